@@ -0,0 +1,25 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+const BACKEND_URL = process.env.BACKEND_URL || 'http://localhost:5000';
+
+// Long-polls the backend for an analysis deferred by /api/predict
+export async function GET(request: NextRequest, { params }: { params: Promise<{ id: string }> }) {
+  try {
+    const { id } = await params;
+    const wait = request.nextUrl.searchParams.get('wait');
+    const query = wait ? `?wait=${encodeURIComponent(wait)}` : '';
+
+    const backendResponse = await fetch(`${BACKEND_URL}/analysis/${encodeURIComponent(id)}${query}`, {
+      cache: 'no-store',
+    });
+    const result = await backendResponse.json().catch(() => ({}));
+    // Pass the status through: 202 pending, 200 done, 404 expired, 502 failed
+    return NextResponse.json(result, { status: backendResponse.status });
+  } catch (error) {
+    console.error('Analysis fetch error:', error);
+    return NextResponse.json(
+      { error: error instanceof Error ? error.message : 'Unknown error' },
+      { status: 500 }
+    );
+  }
+}
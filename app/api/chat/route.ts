@@ -40,7 +40,7 @@ Your goal is to help ABA staff implement effective, function-based interventions
 export async function POST(req: NextRequest) {
   try {
     const body = await req.json();
-    const { messages } = body as { messages: ChatMessage[] };
+    const { messages, conversation_id } = body as { messages: ChatMessage[]; conversation_id?: string };
 
     if (!messages || !Array.isArray(messages) || messages.length === 0) {
       return NextResponse.json(
@@ -55,7 +55,7 @@ export async function POST(req: NextRequest) {
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ messages }),
+      body: JSON.stringify({ messages, conversation_id }),
     });
 
     if (!backendResponse.ok) {
@@ -18,6 +18,9 @@ export async function POST(request: Request) {
       time_since_last_meal_min: calculateTimeSince(data.meals?.[0]?.time, data.predictionTime),
       time_since_last_void_min: calculateTimeSince(data.bathroomVisits?.[0]?.time, data.predictionTime),
       recent_accident_flag: data.bathroomVisits?.some((v: any) => v.type === 'accident') ? 1 : 0,
+      location: data.location, // Selects that site's weather; required once several sites post weather
+      // Return the score right away; the page polls /api/analysis/<id> for the analysis
+      defer_analysis: true,
     };
 
     console.log('Transformed backend data:', backendData);
@@ -7,14 +7,34 @@ import BehaviorPredictionForm from '@/components/behavior-prediction-form'
 import WeatherDisplay from '@/components/weather-display'
 import PredictionResult from '@/components/prediction-result'
 import { ChatAgentOverlay } from '@/components/chatbot/agent_overlay'
-import { ASSESSMENT_STORAGE_KEY, PROFILE_STORAGE_KEY } from '@/lib/constants'
+import { ASSESSMENT_STORAGE_KEY, PROFILE_STORAGE_KEY, WEATHER_LOCATION_STORAGE_KEY } from '@/lib/constants'
 import type { BehaviorAssessmentFormData, PatientSnapshot, SavedAssessment } from '@/types/assessment'
 
+// Long-poll window per request; the backend caps it at 30 seconds
+const ANALYSIS_WAIT_SECONDS = 25
+const ANALYSIS_MAX_POLLS = 8
+
+// Waits for an analysis deferred by /api/predict and returns the finished job
+async function fetchDeferredAnalysis(analysisId: string): Promise<any> {
+  for (let attempt = 0; attempt < ANALYSIS_MAX_POLLS; attempt++) {
+    const response = await fetch(`/api/analysis/${analysisId}?wait=${ANALYSIS_WAIT_SECONDS}`)
+    if (response.status === 202) continue
+    const job = await response.json().catch(() => ({}))
+    if (!response.ok) {
+      throw new Error(job.error || `Analysis failed: ${response.statusText}`)
+    }
+    return job
+  }
+  throw new Error('Analysis is taking too long')
+}
+
 function AssessmentPageContent() {
   const [prediction, setPrediction] = useState<any>(null)
   const [loading, setLoading] = useState(false)
   const [showResults, setShowResults] = useState(false)
   const formSectionRef = useRef<HTMLDivElement>(null)
+  // Deferred analysis being polled for; cleared when the user starts over
+  const pendingAnalysisRef = useRef<string | null>(null)
   const searchParams = useSearchParams()
   const router = useRouter()
 
@@ -108,7 +128,11 @@ function AssessmentPageContent() {
         headers: {
           'Content-Type': 'application/json',
         },
-        body: JSON.stringify(formData),
+        // The site WeatherDisplay posted weather for, so the backend uses that reading
+        body: JSON.stringify({
+          ...formData,
+          location: localStorage.getItem(WEATHER_LOCATION_STORAGE_KEY) ?? undefined,
+        }),
       })
 
       if (!response.ok) {
@@ -120,7 +144,8 @@ function AssessmentPageContent() {
       const result = await response.json()
       setPrediction(result)
       setShowResults(true)
-      persistAssessment(result)
+      setLoading(false)
+      persistAssessment(result.analysis_id && !result.analysis ? await completeAnalysis(result) : result)
     } catch (error) {
       console.error('Error:', error)
       alert('Error submitting form. Please try again.')
@@ -129,7 +154,32 @@ function AssessmentPageContent() {
     }
   }
 
+  // The score is already on screen; fill in the analysis once the backend has it
+  const completeAnalysis = async (result: any) => {
+    const analysisId: string = result.analysis_id
+    pendingAnalysisRef.current = analysisId
+    let completed: any
+    try {
+      const job = await fetchDeferredAnalysis(analysisId)
+      completed = {
+        ...result,
+        analysis: job.analysis,
+        recommendations: job.recommendations,
+        analysis_status: job.status,
+      }
+    } catch (error) {
+      console.error('Analysis error:', error)
+      completed = { ...result, analysis_status: 'error' }
+    }
+    if (pendingAnalysisRef.current === analysisId) {
+      pendingAnalysisRef.current = null
+      setPrediction(completed)
+    }
+    return completed
+  }
+
   const handleNewAssessment = () => {
+    pendingAnalysisRef.current = null
     setShowResults(false)
     setPrediction(null)
     // Clear the assessmentId from URL
@@ -171,7 +221,10 @@ function AssessmentPageContent() {
       </div>
 
       <WeatherDisplay />
-      {prediction && <ChatAgentOverlay predictionContext={prediction} />}
+      {/* Remount once a deferred analysis arrives so the chat starts with it as context */}
+      {prediction && (
+        <ChatAgentOverlay key={prediction.analysis ? 'with-analysis' : 'score-only'} predictionContext={prediction} />
+      )}
     </main>
   )
 }
@@ -0,0 +1,79 @@
+"""Bounded registry of Railtracks agents shared by /chat and the /predict analysis.
+
+Building an agent means constructing a new LLM client, so agents are cached
+under a hash of everything that defines them (name, model, streaming mode and
+system prompt) and evicted least-recently-used once the pool is full.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Callable
+import hashlib
+import threading
+import time
+
+import railtracks as rt
+
+MAX_AGENTS_DEFAULT = 32
+
+
+def agent_key(name: str, model_name: str, system_message: str, stream: bool = False) -> str:
+    material = "\0".join([name, model_name, "stream" if stream else "sync", system_message])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class AgentPool:
+    """Thread-safe LRU cache of ``rt.agent_node`` instances with construction metrics."""
+
+    def __init__(self, llm_factory: Callable = rt.llm.AnthropicLLM, max_agents: int = MAX_AGENTS_DEFAULT):
+        if max_agents < 1:
+            raise ValueError(f"max_agents must be at least 1, got {max_agents}")
+        self.llm_factory = llm_factory
+        self.max_agents = max_agents
+        self._agents: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+        self.constructions = 0
+        self.reuses = 0
+        self.evictions = 0
+        self.construction_seconds = 0.0
+
+    def get(self, name: str, model_name: str, system_message: str, stream: bool = False):
+        key = agent_key(name, model_name, system_message, stream)
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is not None:
+                self._agents.move_to_end(key)
+                self.reuses += 1
+                return agent
+
+            start = time.perf_counter()
+            agent = rt.agent_node(
+                name,
+                llm=self.llm_factory(model_name, stream=stream),
+                system_message=system_message,
+            )
+            self.construction_seconds += time.perf_counter() - start
+            self.constructions += 1
+
+            self._agents[key] = agent
+            while len(self._agents) > self.max_agents:
+                self._agents.popitem(last=False)
+                self.evictions += 1
+            return agent
+
+    def stats(self) -> dict:
+        with self._lock:
+            requests = self.constructions + self.reuses
+            return {
+                "agents": len(self._agents),
+                "max_agents": self.max_agents,
+                "constructions": self.constructions,
+                "reuses": self.reuses,
+                "reuse_ratio": round(self.reuses / requests, 3) if requests else None,
+                "evictions": self.evictions,
+                "construction_ms_total": round(self.construction_seconds * 1000, 2),
+                "construction_ms_avg": (
+                    round(self.construction_seconds * 1000 / self.constructions, 3) if self.constructions else None
+                ),
+            }
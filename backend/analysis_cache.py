@@ -0,0 +1,181 @@
+"""Content-addressed cache for Claude behavior analyses.
+
+The analysis prompt is driven by a small set of mostly discrete values: risk
+label, probabilities, sleep/toileting/transition/social buckets, weather and
+time of day. Those values are quantized (probabilities, minute counts and
+temperature into configurable buckets) and hashed into a canonical key.
+Learners whose inputs land in the same buckets share one analysis instead of
+paying for another Claude round trip.
+
+Entries expire after a TTL and are evicted least-recently-used once the
+entry or character budget is exceeded. An optional SQLite file keeps them
+across restarts and shares them between processes.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+import hashlib
+import json
+import math
+import threading
+import time
+
+from process_sqlite import ProcessLocalSQLite
+
+# Bump when the analysis prompt changes, so replies to the old prompt are not served
+CACHE_KEY_VERSION = 2
+PROBABILITY_STEP_DEFAULT = 0.05
+MINUTES_STEP_DEFAULT = 30
+TEMPERATURE_STEP_DEFAULT = 5.0
+HUMIDITY_STEP_DEFAULT = 20.0
+MAX_ENTRIES_DEFAULT = 512
+MAX_CHARS_DEFAULT = 8_000_000  # roughly 8 MB of analysis text
+TTL_SECONDS_DEFAULT = 3600.0
+
+
+def _bucket(value, step: float) -> int | None:
+    if value is None:
+        return None
+    value = float(value)
+    if math.isnan(value):
+        return None
+    return int(math.floor(value / step))
+
+
+def _time_slot(time_numeric, minutes_step: int) -> int | None:
+    """Bucket an HHMM time of day into ``minutes_step``-wide slots"""
+    if time_numeric is None:
+        return None
+    hhmm = int(time_numeric)
+    return (hhmm // 100 * 60 + hhmm % 100) // minutes_step
+
+
+def analysis_cache_key(
+    inputs: dict[str, Any],
+    probability_step: float = PROBABILITY_STEP_DEFAULT,
+    minutes_step: int = MINUTES_STEP_DEFAULT,
+    temperature_step: float = TEMPERATURE_STEP_DEFAULT,
+    humidity_step: float = HUMIDITY_STEP_DEFAULT,
+) -> str:
+    """Canonical SHA-256 key for the quantized prompt inputs.
+
+    ``inputs`` needs prediction, high_risk_probability, sleep_quality_numeric,
+    time_since_last_meal_min, time_since_last_void_min,
+    toileting_status_bucket_numeric, recent_accident_flag, transitionType,
+    socialInteractionContext, weather_condition, temperature_c,
+    humidity_percent, time_numeric and weekday_numeric.
+    """
+    canonical = {
+        "v": CACHE_KEY_VERSION,
+        "prediction": int(inputs["prediction"]),
+        "high_risk": _bucket(inputs["high_risk_probability"], probability_step),
+        "sleep": inputs.get("sleep_quality_numeric"),
+        "meal": _bucket(inputs.get("time_since_last_meal_min"), minutes_step),
+        "void": _bucket(inputs.get("time_since_last_void_min"), minutes_step),
+        "toileting": inputs.get("toileting_status_bucket_numeric"),
+        "accident": inputs.get("recent_accident_flag"),
+        "transition": inputs.get("transitionType"),
+        "social": inputs.get("socialInteractionContext"),
+        "weather": inputs.get("weather_condition"),
+        "temperature": _bucket(inputs.get("temperature_c"), temperature_step),
+        "humidity": _bucket(inputs.get("humidity_percent"), humidity_step),
+        "time": _time_slot(inputs.get("time_numeric"), minutes_step),
+        "weekday": inputs.get("weekday_numeric"),
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """Thread-safe TTL + LRU cache of analysis text, optionally backed by SQLite."""
+
+    def __init__(
+        self,
+        max_entries: int = MAX_ENTRIES_DEFAULT,
+        ttl_seconds: float = TTL_SECONDS_DEFAULT,
+        max_chars: int = MAX_CHARS_DEFAULT,
+        db_path: Path | None = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_chars = max_chars
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # Shared by every process that opens the same file, e.g. the pre-forked workers
+        self._db: ProcessLocalSQLite | None = None
+        if db_path is not None:
+            self._db = ProcessLocalSQLite(
+                db_path,
+                "CREATE TABLE IF NOT EXISTS analyses (key TEXT PRIMARY KEY, analysis TEXT NOT NULL, expires REAL NOT NULL);",
+            )
+            self._db.connection.execute("DELETE FROM analyses WHERE expires <= ?", (time.time(),))
+            self._db.connection.commit()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.connection.execute(
+                    "SELECT analysis, expires FROM analyses WHERE key = ? AND expires > ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[1], row[0])
+                    self._insert(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, analysis: str) -> None:
+        if not analysis:
+            return
+        expires = time.time() + self.ttl_seconds
+        with self._lock:
+            self._insert(key, (expires, analysis))
+            if self._db is not None:
+                self._db.connection.execute(
+                    "INSERT OR REPLACE INTO analyses (key, analysis, expires) VALUES (?, ?, ?)",
+                    (key, analysis, expires),
+                )
+                self._db.connection.commit()
+
+    def _insert(self, key: str, entry: tuple[float, str]) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self._chars += len(entry[1])
+        while self._entries and (len(self._entries) > self.max_entries or self._chars > self.max_chars):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, analysis = self._entries.pop(key)
+        self._chars -= len(analysis)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "chars": self._chars,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "evictions": self.evictions,
+                "persistent": self._db is not None,
+            }
@@ -0,0 +1,228 @@
+"""Deferred Claude analyses for the /predict fast path.
+
+The risk score is ready milliseconds after predict_proba, while the BCBA-style
+analysis takes seconds. When a caller asks for deferred analysis, /predict
+returns the score with an ``analysis_id`` straight away and the analysis is
+generated here in the background, to be fetched or long-polled from
+``/analysis/<id>``. With a SQLite file the jobs are shared between processes,
+so a pre-forked worker can answer for a job another worker is running.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+import threading
+import time
+import uuid
+
+from process_sqlite import ProcessLocalSQLite
+from structured_logging import get_logger
+
+ANALYSIS_WORKERS_DEFAULT = 4
+# Finished analyses are kept this long for clients to collect them
+ANALYSIS_RETENTION_SECONDS = 3600
+MAX_STORED_ANALYSES = 1000
+MAX_WAIT_SECONDS = 30.0
+# How often a waiter re-reads a job that another process is running
+SHARED_POLL_SECONDS = 0.2
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    analysis_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    analysis TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    finished REAL
+);
+"""
+
+logger = get_logger("analysis_jobs")
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "error"
+
+
+@dataclass
+class AnalysisJob:
+    analysis_id: str
+    created: float
+    status: str = PENDING
+    analysis: str | None = None
+    error: str | None = None
+    finished: float | None = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def to_dict(self) -> dict:
+        end = self.finished if self.finished is not None else time.time()
+        return {
+            "analysis_id": self.analysis_id,
+            "status": self.status,
+            "analysis": self.analysis,
+            "recommendations": self.analysis,  # Same as analysis, like /predict
+            "error": self.error,
+            "elapsed_ms": round((end - self.created) * 1000),
+        }
+
+
+class AnalysisStoreFull(RuntimeError):
+    """Every stored job is still pending, so no slot can be freed for a new one"""
+
+
+class AnalysisStore:
+    """Thread-safe, bounded registry of analysis jobs keyed by id.
+
+    Only finished jobs are evicted: a pending job's id has already been handed
+    to a client, which must be able to collect the result. With ``db_path``
+    every job is also written to SQLite, and ``get`` falls back to it for jobs
+    created by other processes. ``max_jobs`` bounds this process's jobs only.
+    """
+
+    def __init__(
+        self,
+        retention_seconds: float = ANALYSIS_RETENTION_SECONDS,
+        max_jobs: int = MAX_STORED_ANALYSES,
+        db_path: Path | None = None,
+    ):
+        self.retention_seconds = retention_seconds
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, AnalysisJob] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = ProcessLocalSQLite(db_path, JOBS_SCHEMA) if db_path is not None else None
+
+    @property
+    def shared(self) -> bool:
+        return self._db is not None
+
+    def create(self) -> AnalysisJob:
+        """Register a new pending job; raises AnalysisStoreFull when every slot holds a pending job"""
+        job = AnalysisJob(analysis_id=uuid.uuid4().hex, created=time.time())
+        with self._lock:
+            self._evict(job.created)
+            if len(self._jobs) >= self.max_jobs:
+                raise AnalysisStoreFull(f"All {self.max_jobs} stored analyses are still pending")
+            self._jobs[job.analysis_id] = job
+            self._save(job)
+        return job
+
+    def get(self, analysis_id: str) -> AnalysisJob | None:
+        """The job itself if this process runs it, else a snapshot from the shared file"""
+        with self._lock:
+            job = self._jobs.get(analysis_id)
+            if job is None and self._db is not None:
+                job = self._load(analysis_id)
+            return job
+
+    def complete(self, job: AnalysisJob, analysis: str) -> None:
+        job.analysis = analysis
+        self._finish(job, DONE)
+
+    def fail(self, job: AnalysisJob, message: str) -> None:
+        job.error = message
+        self._finish(job, FAILED)
+
+    def _finish(self, job: AnalysisJob, status: str) -> None:
+        job.status = status
+        job.finished = time.time()
+        with self._lock:
+            self._save(job)
+        job.done.set()
+
+    def wait(self, analysis_id: str, timeout: float) -> AnalysisJob | None:
+        """Block up to ``timeout`` seconds for a job to finish; None if the id is unknown"""
+        job = self.get(analysis_id)
+        if job is None or timeout <= 0:
+            return job
+        deadline = time.monotonic() + min(timeout, MAX_WAIT_SECONDS)
+        while not job.done.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Another process's job is a snapshot whose event never fires, so re-read it
+            job.done.wait(min(remaining, SHARED_POLL_SECONDS) if self.shared else remaining)
+            job = self.get(analysis_id) or job
+        return job
+
+    def _save(self, job: AnalysisJob) -> None:
+        if self._db is None:
+            return
+        connection = self._db.connection
+        connection.execute(
+            "INSERT OR REPLACE INTO analysis_jobs (analysis_id, status, analysis, error, created, finished)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (job.analysis_id, job.status, job.analysis, job.error, job.created, job.finished),
+        )
+        connection.commit()
+
+    def _load(self, analysis_id: str) -> AnalysisJob | None:
+        row = self._db.connection.execute(
+            "SELECT status, analysis, error, created, finished FROM analysis_jobs WHERE analysis_id = ?",
+            (analysis_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        status, analysis, error, created, finished = row
+        job = AnalysisJob(analysis_id, created, status, analysis, error, finished)
+        if status != PENDING:
+            job.done.set()
+        return job
+
+    def _evict(self, now: float) -> None:
+        if self._db is not None:
+            # A job still pending after the retention period belonged to a worker that died
+            self._db.connection.execute(
+                "DELETE FROM analysis_jobs WHERE COALESCE(finished, created) < ?", (now - self.retention_seconds,)
+            )
+            self._db.connection.commit()
+        expired = [
+            analysis_id for analysis_id, job in self._jobs.items()
+            if job.finished is not None and now - job.finished > self.retention_seconds
+        ]
+        for analysis_id in expired:
+            del self._jobs[analysis_id]
+        if len(self._jobs) < self.max_jobs:
+            return
+        # Still full: drop the oldest finished job, never a pending one
+        for analysis_id, job in self._jobs.items():
+            if job.finished is not None:
+                del self._jobs[analysis_id]
+                return
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._jobs)
+
+
+class AnalysisWorkerPool:
+    """Runs blocking analysis callables on a small thread pool and records the results."""
+
+    def __init__(self, store: AnalysisStore, workers: int = ANALYSIS_WORKERS_DEFAULT):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+
+    def submit(self, run: Callable[[], str]) -> AnalysisJob:
+        job = self.store.create()
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def _run(self, job: AnalysisJob, run: Callable[[], str]) -> None:
+        try:
+            self.store.complete(job, run())
+        except Exception as e:
+            logger.exception("analysis failed", extra={"fields": {"analysis_id": job.analysis_id}})
+            self.store.fail(job, str(e))
+
+
+def parse_wait(value) -> float:
+    """Long-poll timeout from a ?wait= query value, clamped to MAX_WAIT_SECONDS"""
+    if value in (None, ""):
+        return 0.0
+    seconds = float(value)
+    if seconds != seconds or seconds < 0:
+        raise ValueError(f"wait must be a non-negative number of seconds, got {value}")
+    return min(seconds, MAX_WAIT_SECONDS)
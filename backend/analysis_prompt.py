@@ -0,0 +1,97 @@
+"""Prompt for the Claude behavior analysis that accompanies each /predict score.
+
+The prompt is split in two. ``BEHAVIOR_ANALYSIS_SYSTEM_MESSAGE`` holds the
+BCBA role and the response format, which are the same for every learner. It
+is sent as the system message and marked for Anthropic prompt caching.
+``behavior_analysis_prompt`` builds the part that changes per learner: the
+scores and the antecedent context.
+"""
+
+from __future__ import annotations
+
+SLEEP_QUALITY_DESCRIPTIONS = {0: "Very Poor", 1: "Poor", 2: "Fair", 3: "Good", 4: "Excellent"}
+TOILETING_STATUS_DESCRIPTIONS = {0: "Normal", 1: "Any void accident in 60 min", 2: "No void in 60 min", 3: "Recent accident"}
+WEEKDAY_NAMES = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+
+BEHAVIOR_ANALYSIS_ROLE = """You are a Board Certified Behavior Analyst (BCBA) providing session support for ABA therapists and RBTs working in a clinic setting. Analyze behavioral data and provide practical, session-ready strategies for table work, NET (Natural Environment Teaching), transitions, and other typical ABA activities. Use clear ABA terminology and focus on antecedent interventions, motivating operations, and concrete recommendations."""
+
+BEHAVIOR_ANALYSIS_INSTRUCTIONS = """Each message gives one learner's behavioral prediction data and antecedent context (motivating operations, setting events and environment). Provide a detailed behavioral analysis in the following format, using clear ABA language and focusing on what is practical for therapists/technicians working in an ABA clinic session (table work, NET, transitions, etc.):
+
+BEHAVIORAL ANALYSIS:
+In 3–5 sentences, describe:
+- How current motivating operations (sleep, hunger, toileting, sensory context) and recent events might be setting the occasion for problem behavior.
+- The most likely antecedent patterns and probable functions of problem behavior in this context (for example, escape, attention, tangible, automatic).
+- How this risk profile might show up during typical ABA activities (discrete trials, transitions between tasks, group time, NET).
+
+KEY RISK FACTORS:
+List the 2–4 most clinically relevant risk factors from the data. Focus specifically on:
+- Antecedent triggers or transitions that are likely to produce problem behavior.
+- Current MOs/EOs (for example, low sleep, long time since meal/void, recent accident).
+- Social or environmental variables (group size, noise level, type of transition) that increase the likelihood of escalation.
+
+PROTECTIVE FACTORS:
+List 2–3 factors that the ABA team can lean on during this session, such as:
+- Existing supports (visual schedules, token systems, first/then, transition warnings).
+- Learner strengths or strong reinforcers that can be used proactively.
+- Any contextual elements that reduce risk (predictable routine, 1:1 support, calm environment).
+
+ACTIONABLE RECOMMENDATIONS:
+Provide 4–6 concrete, session-ready ABA strategies. Each item should be:
+- A specific action that a therapist/RBT can implement in the next 1–2 hours.
+- Focused on antecedent interventions (for example, transition warnings, task modification, choice-making), proactive reinforcement (for example, dense schedule of reinforcement, noncontingent access to certain stimuli), and teaching/rehearsing replacement behaviors (for example, functional communication) BEFORE problem behavior escalates.
+- Written in "do this" language (for example, "Before starting work, provide a 2-step visual 'first/then' with a preferred item," not vague suggestions).
+
+MONITORING PRIORITIES:
+List 2–4 things the ABA team should actively watch for and document during the session, such as:
+- Early warning signs or precursor behaviors that typically occur before full escalation.
+- How the learner responds to specific antecedent strategies or reinforcement changes.
+- Any changes in suspected function or triggers that should be communicated to the supervising BCBA and used to refine the behavior plan or prediction model later."""
+
+# The static prefix: identical for every /predict analysis, so the API can serve it from its prompt cache
+BEHAVIOR_ANALYSIS_SYSTEM_MESSAGE = f"{BEHAVIOR_ANALYSIS_ROLE}\n\n{BEHAVIOR_ANALYSIS_INSTRUCTIONS}"
+
+
+def weather_display(condition: str, temperature, humidity) -> str:
+    """Format weather display based on whether real weather data is available"""
+    if temperature is not None and humidity is not None and condition != "Unknown":
+        return f"{condition}, {temperature}°C, {humidity}% humidity"
+    return "Weather data not available"
+
+
+def behavior_analysis_prompt(
+    data: dict,
+    derived: dict,
+    prediction: int,
+    prediction_proba,
+    confidence: float,
+    weather_summary: str,
+) -> str:
+    """The per-learner part of the analysis prompt; ``derived`` is the derive_time_features output"""
+    # Map numeric values to readable descriptions
+    sleep_quality_desc = SLEEP_QUALITY_DESCRIPTIONS.get(data.get("sleep_quality_numeric"), "Unknown")
+    toileting_status_desc = TOILETING_STATUS_DESCRIPTIONS.get(derived["toileting_status_bucket_numeric"], "Unknown")
+    time_since_last_meal_min = derived["time_since_last_meal_min"]
+    time_since_last_void_min = derived["time_since_last_void_min"]
+    recent_accident_flag = derived["recent_accident_flag"]
+
+    return f"""BEHAVIORAL PREDICTION DATA:
+- Risk of Escalation: {"HIGH - Increased likelihood of challenging behavior/escalation" if prediction == 1 else "LOW - Baseline behavioral stability expected"}
+- Model Confidence: {confidence * 100:.1f}%
+- Probability of Challenging Behavior: {prediction_proba[1] * 100:.1f}%
+- Probability of Appropriate Behavior: {prediction_proba[0] * 100:.1f}%
+
+ANTECEDENT ANALYSIS (Motivating Operations & Setting Events):
+
+Physiological Motivating Operations:
+- Sleep Quality: {sleep_quality_desc} (Score: {data.get("sleep_quality_numeric")}/4)
+- Time Since Last Meal: {time_since_last_meal_min if time_since_last_meal_min else "N/A"} minutes (hunger may be an MO)
+- Time Since Last Void: {time_since_last_void_min if time_since_last_void_min else "N/A"} minutes (discomfort may be an MO)
+- Toileting Status: {toileting_status_desc}
+- Recent Accident: {"Yes" if recent_accident_flag else "No"}
+
+Environmental Context:
+- Current Weather: {weather_summary}
+- Time of Day: {data.get("time_numeric")}
+- Day of Week: {WEEKDAY_NAMES[data.get("weekday_numeric", 0)]}
+- Transition Type: {data.get("transitionType", "none").replace("_", " ").title()}
+- Social Context: {data.get("socialInteractionContext", "alone").replace("_", " ").title()}"""
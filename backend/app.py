@@ -1,16 +1,70 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 from pathlib import Path
 import railtracks as rt
-from datetime import datetime
-import joblib
-import pandas as pd
-import json
 import re
-import traceback
 import asyncio
+import json
+import time
+
+from agent_pool import MAX_AGENTS_DEFAULT, AgentPool
+from analysis_cache import (
+    HUMIDITY_STEP_DEFAULT,
+    MAX_ENTRIES_DEFAULT,
+    MINUTES_STEP_DEFAULT,
+    PROBABILITY_STEP_DEFAULT,
+    TEMPERATURE_STEP_DEFAULT,
+    TTL_SECONDS_DEFAULT,
+    AnalysisCache,
+    analysis_cache_key,
+)
+from analysis_jobs import (
+    ANALYSIS_WORKERS_DEFAULT,
+    DONE,
+    PENDING,
+    AnalysisStore,
+    AnalysisStoreFull,
+    AnalysisWorkerPool,
+    parse_wait,
+)
+from analysis_prompt import BEHAVIOR_ANALYSIS_SYSTEM_MESSAGE, behavior_analysis_prompt, weather_display
+from conversation import HISTORY_TOKEN_BUDGET_DEFAULT, ConversationManager, estimate_tokens
+from day_curve import (
+    DAY_END_DEFAULT,
+    DAY_START_DEFAULT,
+    STEP_MINUTES_DEFAULT,
+    build_day_features,
+    day_curve_key,
+    format_minutes,
+    peak_windows,
+    time_grid,
+    to_hhmm,
+)
+from features import (
+    assemble_features,
+    build_feature_frame,
+    calculated_values,
+    derive_time_features,
+    extract_weather,
+)
+from inference import feature_matrix, validate_threshold
+from learner_events import EVENT_RETENTION_SECONDS_DEFAULT, LearnerEventStore
+from metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    record_llm_call,
+    registry as metrics_registry,
+    request_seconds,
+    stage_seconds,
+)
+from standin_llm import StandInConfig
+from model_registry import POLL_INTERVAL_SECONDS_DEFAULT, ModelRegistry, RollbackError
+from prompt_cache import PromptCachingAnthropicLLM
+from streaming import ANALYSIS_SECTIONS, SSE_HEADERS, sse_event, sse_frames, wants_stream
+from structured_logging import begin_request, configure_logging, debug_enabled, get_logger
+from train_model import NUMERIC_FEATURES
+from weather_store import WEATHER_TTL_SECONDS_DEFAULT, AmbiguousLocationError, WeatherReading, WeatherStore
 
 # Load .env from the same directory as this script
 env_path = Path(__file__).parent / '.env'
@@ -19,375 +73,595 @@ load_dotenv(dotenv_path=env_path)
 app = Flask(__name__)
 CORS(app)
 
-# Test API key loading
-api_key = os.environ.get("ANTHROPIC_API_KEY")
-print(f"Loading .env from: {env_path}")
-print(f"API Key loaded: {'Yes' if api_key else 'No'}")
+@app.before_request
+def _tag_request_logs():
+    begin_request(request.path)
+    g.request_started = time.perf_counter()
 
-if not api_key:
-    print("ERROR: ANTHROPIC_API_KEY not found in environment!")
-    print(f"Checked .env file at: {env_path}")
-    print(f"File exists: {env_path.exists()}")
+@app.after_request
+def _time_request(response):
+    # Route templates, not raw paths, so learner ids do not become label values
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    started = g.get("request_started")
+    if started is not None:
+        request_seconds.observe(time.perf_counter() - started, route, str(response.status_code))
+    return response
 
-model_path = Path("backend/models/behavior_predictor.joblib")
-model = joblib.load(model_path)
-model_name = "claude-3-5-haiku-20241022" # or another Claude model you can use
+configure_logging()
+logger = get_logger("app")
 
-# Railtracks agent cache for behavior analysis
-_behavior_analysis_agent = None
+# "standin" serves every analysis and chat reply from a local simulated model, for load tests
+llm_backend = os.environ.get("LLM_BACKEND", "anthropic").lower()
+if llm_backend not in ("anthropic", "standin"):
+    raise ValueError(f"LLM_BACKEND must be 'anthropic' or 'standin', got {llm_backend!r}")
 
-def _get_behavior_analysis_agent():
-    """Get or create the behavior analysis agent using Railtracks"""
-    global _behavior_analysis_agent
-    if _behavior_analysis_agent is None:
-        system_message = """You are a Board Certified Behavior Analyst (BCBA) providing session support for ABA therapists and RBTs working in a clinic setting. Analyze behavioral data and provide practical, session-ready strategies for table work, NET (Natural Environment Teaching), transitions, and other typical ABA activities. Use clear ABA terminology and focus on antecedent interventions, motivating operations, and concrete recommendations."""
-        _behavior_analysis_agent = rt.agent_node(
-            "Behavior Analysis Agent",
-            llm=rt.llm.AnthropicLLM(model_name),
-            system_message=system_message,
-        )
-    return _behavior_analysis_agent
+# Test API key loading
+api_key = os.environ.get("ANTHROPIC_API_KEY")
+logger.info("environment loaded", extra={"fields": {
+    "env_path": str(env_path),
+    "api_key_loaded": bool(api_key),
+    "llm_backend": llm_backend,
+}})
+
+if not api_key and llm_backend == "anthropic":
+    logger.error("ANTHROPIC_API_KEY not found in environment", extra={"fields": {
+        "env_path": str(env_path),
+        "env_file_exists": env_path.exists(),
+    }})
+
+model_dir = Path("backend/models")
+# New versioned artifacts under backend/models/versions/ are picked up and swapped in without a restart
+model_registry = ModelRegistry(
+    model_dir,
+    poll_interval=float(os.environ.get("MODEL_POLL_INTERVAL", POLL_INTERVAL_SECONDS_DEFAULT)),
+).start()
+model_name = "claude-3-5-haiku-20241022" # or another Claude model you can use
 
-# Store latest weather data
-weather = {}
+# Railtracks agents are built once per (name, model, streaming mode, system prompt) and reused.
+# Their system messages are marked for Anthropic prompt caching.
+agent_pool = AgentPool(
+    llm_factory=StandInConfig.from_env().factory() if llm_backend == "standin" else PromptCachingAnthropicLLM,
+    max_agents=int(os.environ.get("AGENT_POOL_SIZE", MAX_AGENTS_DEFAULT)),
+)
 
-def convert_time_to_numeric(time_value):
-    """Convert time string (HH:MM) to numeric format (HHMM as integer)"""
-    if isinstance(time_value, int):
-        return time_value
+def _get_behavior_analysis_agent(stream: bool = False):
+    """Get or create the behavior analysis agent using Railtracks"""
+    return agent_pool.get("Behavior Analysis Agent", model_name, BEHAVIOR_ANALYSIS_SYSTEM_MESSAGE, stream=stream)
 
-    if isinstance(time_value, str):
-        # Remove any colons and convert to int
-        time_str = time_value.replace(":", "")
-        return int(time_str)
+def llm_input_tokens(agent, prompt: str) -> int:
+    return estimate_tokens(agent.system_message().content) + estimate_tokens(prompt)
 
-    return None
+def call_llm(operation: str, agent, prompt: str):
+    """Blocking Railtracks call, timed and counted under ``operation`` in /metrics"""
+    started = time.perf_counter()
+    try:
+        result = asyncio.run(rt.call(agent, prompt))
+    except Exception as e:
+        record_llm_call(operation, llm_input_tokens(agent, prompt), started, error=e)
+        raise
+    record_llm_call(operation, llm_input_tokens(agent, prompt), started, reply=result.text)
+    return result
+
+# Latest weather reading per location, decoded once at ingest.
+# Set WEATHER_STORE_PATH to a SQLite file to share the readings between processes.
+weather_store_path = os.environ.get("WEATHER_STORE_PATH")
+weather_store = WeatherStore(
+    ttl_seconds=float(os.environ.get("WEATHER_TTL_SECONDS", WEATHER_TTL_SECONDS_DEFAULT)),
+    db_path=Path(weather_store_path) if weather_store_path else None,
+)
+
+# Meals and bathroom visits per learner, appended as they happen; payloads with a learner_id use them
+learner_events = LearnerEventStore(
+    retention_seconds=float(os.environ.get("LEARNER_EVENT_RETENTION_SECONDS", EVENT_RETENTION_SECONDS_DEFAULT)),
+)
+
+# Deferred analyses: /predict returns the score immediately and Claude runs in the background.
+# Opt in per request with "defer_analysis": true, or for every request with DEFER_ANALYSIS=1.
+DEFER_ANALYSIS_DEFAULT = os.environ.get("DEFER_ANALYSIS", "0").lower() in ("1", "true", "yes")
+# Set ANALYSIS_JOBS_PATH to a SQLite file to let any process answer for a job
+analysis_jobs_path = os.environ.get("ANALYSIS_JOBS_PATH")
+analysis_pool = AnalysisWorkerPool(
+    AnalysisStore(db_path=Path(analysis_jobs_path) if analysis_jobs_path else None),
+    workers=int(os.environ.get("ANALYSIS_WORKERS", ANALYSIS_WORKERS_DEFAULT)),
+)
+
+# Analyses are reused for learners whose quantized prompt inputs match.
+# Set ANALYSIS_CACHE_PATH to a SQLite file to keep them across restarts.
+analysis_cache_path = os.environ.get("ANALYSIS_CACHE_PATH")
+analysis_cache = AnalysisCache(
+    max_entries=int(os.environ.get("ANALYSIS_CACHE_SIZE", MAX_ENTRIES_DEFAULT)),
+    ttl_seconds=float(os.environ.get("ANALYSIS_CACHE_TTL", TTL_SECONDS_DEFAULT)),
+    db_path=Path(analysis_cache_path) if analysis_cache_path else None,
+)
+analysis_cache_steps = {
+    "probability_step": float(os.environ.get("ANALYSIS_CACHE_PROBABILITY_STEP", PROBABILITY_STEP_DEFAULT)),
+    "minutes_step": int(os.environ.get("ANALYSIS_CACHE_MINUTES_STEP", MINUTES_STEP_DEFAULT)),
+    "temperature_step": TEMPERATURE_STEP_DEFAULT,
+    "humidity_step": HUMIDITY_STEP_DEFAULT,
+}
+
+
+# Day curves are cached under a hash of the scored feature grid, model version and threshold
+day_curve_cache = AnalysisCache(
+    max_entries=int(os.environ.get("DAY_CURVE_CACHE_SIZE", 256)),
+    ttl_seconds=float(os.environ.get("DAY_CURVE_CACHE_TTL", 900)),
+)
+
+
+class RequestError(ValueError):
+    """Malformed request; both the Flask and ASGI servers answer it with HTTP 400"""
+
+
+def store_weather(data: dict) -> dict:
+    """Store a reading for its location; identical re-posts only refresh its timestamp"""
+    if not isinstance(data, dict):
+        raise RequestError("Expected a JSON object")
+
+    reading, changed = weather_store.put(data)
+
+    if changed:
+        logger.info("weather received", extra={"fields": {
+            "location": reading.location,
+            "condition": data.get("condition"),
+            "temperature": data.get("temperature"),
+        }})
+
+    return {
+        "status": "success",
+        "message": "Weather data received" if changed else "Weather data unchanged",
+        "data": reading.raw
+    }
+
+
+def stored_weather(location) -> WeatherReading | None:
+    """Stored reading for a request's location; leaving it out is a bad request once several sites post"""
+    try:
+        return weather_store.get(location)
+    except AmbiguousLocationError as e:
+        raise RequestError(str(e)) from e
 
 @app.route('/weather', methods=['POST'])
 def receive_weather():
     try:
-        global weather
-        data = request.json
-
-        # Store weather in OpenWeatherMap API format for compatibility with predict endpoint
-        weather = {
-            "main": {
-                "temp": data.get("temperature"),
-                "feels_like": data.get("feels_like"),
-                "humidity": data.get("humidity")
-            },
-            "weather": [{
-                "main": data.get("condition"),
-                "description": data.get("condition", "").lower()
-            }],
-            "wind": {
-                "speed": data.get("wind_speed")
-            },
-            "name": data.get("location"),
-            "timestamp": data.get("timestamp", datetime.now().isoformat())
-        }
-
-        print(f"Received weather data: {weather}")
-
-        return jsonify({
-            "status": "success",
-            "message": "Weather data received",
-            "data": weather
-        }), 200
+        return jsonify(store_weather(request.json)), 200
 
+    except RequestError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def record_events(learner_id, data) -> dict:
+    """Append a learner's new meals and bathroom visits to the event store"""
+    if not isinstance(data, dict):
+        raise RequestError("Expected a JSON object")
+    try:
+        return learner_events.add(learner_id, data.get("meals"), data.get("bathroomVisits"))
+    except ValueError as e:
+        raise RequestError(str(e)) from e
+
+def derive_learner_features(data: dict) -> dict:
+    """Time features from the event store for payloads with a learner_id, otherwise from the payload's own log.
+
+    Events in a payload with a learner_id are appended to the store first, so
+    clients can send only what happened since their last call.
+    """
+    learner_id = data.get("learner_id")
+    if learner_id is None:
+        return derive_time_features(data)
+    record_events(learner_id, data)
+    return learner_events.derive(learner_id)
+
+@app.route('/learners/<learner_id>/events', methods=['POST'])
+def add_learner_events(learner_id):
+    try:
+        return jsonify(record_events(learner_id, request.json)), 200
+
+    except RequestError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/learners/<learner_id>/events', methods=['GET'])
+def get_learner_events(learner_id):
+    events = learner_events.events(learner_id)
+    if events is None:
+        return jsonify({"error": f"No events stored for learner {learner_id}"}), 404
+    return jsonify({**events, "calculated_values": learner_events.derive(learner_id)}), 200
+
+@app.route('/learners/<learner_id>/events', methods=['DELETE'])
+def clear_learner_events(learner_id):
+    if not learner_events.clear(learner_id):
+        return jsonify({"error": f"No events stored for learner {learner_id}"}), 404
+    return jsonify({"status": "cleared", "learner_id": learner_id}), 200
+
+def prepare_prediction(data: dict) -> tuple[dict, str, str]:
+    """Score one learner and build the Claude analysis prompt.
+
+    Returns the JSON response without the analysis fields, the prompt that
+    produces them and the analysis cache key, so the Flask and ASGI servers
+    can run the LLM call however suits them.
+    """
+    if not isinstance(data, dict):
+        raise RequestError("Expected a JSON object")
+
+    # Optional what-if override of the tuned decision threshold
+    threshold = data.get("decision_threshold")
+    if threshold is not None:
+        try:
+            threshold = validate_threshold(threshold)
+        except (TypeError, ValueError) as e:
+            raise RequestError(str(e)) from e
+
+    # Weather for the learner's site; a location may be left out only while one site posts weather
+    with stage_seconds.time("predict", "weather"):
+        reading = stored_weather(data.get("location"))
+        weather_values = reading.values if reading is not None else extract_weather(None)
+
+    # Calculate meal, void and toileting features from the event log
+    with stage_seconds.time("predict", "derive"):
+        derived = derive_learner_features(data)
+    time_since_last_meal_min = derived["time_since_last_meal_min"]
+    time_since_last_void_min = derived["time_since_last_void_min"]
+    toileting_status_bucket_numeric = derived["toileting_status_bucket_numeric"]
+    recent_accident_flag = derived["recent_accident_flag"]
+
+    # Prepare features for the model
+    with stage_seconds.time("predict", "features"):
+        feature_row = assemble_features(data, derived, weather_values)
+        features = feature_matrix([feature_row])
+    transition_type_numeric = feature_row["transition_type_numeric"]
+    social_context_numeric = feature_row["social_context_numeric"]
+    temperature = feature_row["temperature_c"]
+    humidity = feature_row["humidity_percent"]
+    weather_type = feature_row["weather_type_numeric"]
+
+    if debug_enabled(logger):
+        # Only derived model inputs are logged; the raw payload can carry PHI
+        logger.debug("model input", extra={"fields": {
+            "request_fields": sorted(data),
+            "weather_available": reading is not None,
+            "weather_condition": weather_values["condition"],
+            "features": feature_row,
+            "recent_accident_flag": recent_accident_flag,
+        }})
+
+    # Get prediction: one predict_proba pass, labelled with the tuned (or requested) threshold
+    predictor = model_registry.current
+    with stage_seconds.time("predict", "score"):
+        scored = predictor.predict(features, threshold=threshold)
+    prediction = int(scored.labels[0])
+    prediction_proba = scored.probabilities[0]
+    confidence = float(scored.confidence[0])
+
+    logger.info("prediction", extra={"fields": {
+        "prediction": prediction,
+        "high_risk_probability": round(float(prediction_proba[1]), 4),
+        "confidence": round(confidence, 4),
+        "decision_threshold": scored.threshold,
+        "model_version": predictor.version,
+    }})
+
+    # Include weather in Claude prompt
+    weather_condition = weather_values["condition"]
+
+    with stage_seconds.time("predict", "prompt"):
+        prompt = behavior_analysis_prompt(
+            data,
+            derived,
+            prediction,
+            prediction_proba,
+            confidence,
+            weather_display(weather_condition, temperature, humidity),
+        )
+        cache_key = analysis_cache_key({
+            "prediction": prediction,
+            "high_risk_probability": prediction_proba[1],
+            "sleep_quality_numeric": data.get("sleep_quality_numeric"),
+            "time_since_last_meal_min": time_since_last_meal_min,
+            "time_since_last_void_min": time_since_last_void_min,
+            "toileting_status_bucket_numeric": toileting_status_bucket_numeric,
+            "recent_accident_flag": recent_accident_flag,
+            "transitionType": data.get("transitionType", "none"),
+            "socialInteractionContext": data.get("socialInteractionContext", "alone"),
+            "weather_condition": weather_condition,
+            "temperature_c": temperature,
+            "humidity_percent": humidity,
+            "time_numeric": feature_row["time_numeric"],
+            "weekday_numeric": data.get("weekday_numeric", 0),
+        }, **analysis_cache_steps)
+
+    payload = {
+        "prediction": int(prediction),
+        "prediction_label": "High Risk" if prediction == 1 else "Low Risk",
+        "confidence": round(confidence, 3),
+        "decision_threshold": scored.threshold,
+        "model_version": predictor.version,
+        "probabilities": {
+            "low_risk": round(float(prediction_proba[0]), 3),
+            "high_risk": round(float(prediction_proba[1]), 3)
+        },
+        "calculated_values": calculated_values(derived, feature_row),
+        "weather_used": {
+            "temperature": temperature,
+            "humidity": humidity,
+            "condition": weather_condition,
+            "type_numeric": weather_type
+        } if reading is not None else None,
+    }
+    return payload, prompt, cache_key
+
+
+def attach_analysis(payload: dict, claude_response: str) -> dict:
+    payload["analysis"] = claude_response
+    payload["recommendations"] = claude_response  # Keep for backward compatibility
+    return payload
+
+
+def defer_requested(data: dict) -> bool:
+    flag = data.get("defer_analysis")
+    return DEFER_ANALYSIS_DEFAULT if flag is None else bool(flag)
+
+
+def attach_pending_analysis(payload: dict, job) -> dict:
+    """Fast-path response: the score now, the analysis later from /analysis/<id>"""
+    payload["analysis"] = None
+    payload["recommendations"] = None
+    payload["analysis_id"] = job.analysis_id
+    payload["analysis_status"] = job.status
+    payload["analysis_url"] = f"/analysis/{job.analysis_id}"
+    return payload
+
+
+def log_deferral_refused(error: AnalysisStoreFull) -> None:
+    logger.warning("analysis deferral refused, answering inline", extra={"fields": {"reason": str(error)}})
+
+
+def analysis_status_code(job) -> int:
+    return {DONE: 200, PENDING: 202}.get(job.status, 502)
+
+
+def llm_text_chunks(operation: str, agent, prompt: str):
+    """Yield text chunks from a streaming Railtracks agent as they arrive"""
+    started = time.perf_counter()
+    parts = []
+    try:
+        generator = asyncio.run(rt.call(agent, prompt))
+        for item in generator:
+            # The generator ends with the assembled response object
+            if not isinstance(item, str):
+                break
+            parts.append(item)
+            yield item
+    except Exception as e:
+        record_llm_call(operation, llm_input_tokens(agent, prompt), started, error=e)
+        raise
+    record_llm_call(operation, llm_input_tokens(agent, prompt), started, reply="".join(parts))
+
+
+def prediction_stream(payload: dict, prompt: str, cache_key: str):
+    """SSE frames for /predict: the score first, then the analysis as it streams"""
+    yield sse_event("prediction", payload)
+
+    cached = analysis_cache.get(cache_key)
+    if cached is not None:
+        chunks = [cached]
+    else:
+        chunks = llm_text_chunks("predict", _get_behavior_analysis_agent(stream=True), prompt)
+
+    def finish(claude_response: str) -> dict:
+        if cached is None:
+            analysis_cache.put(cache_key, claude_response)
+        return attach_analysis(payload, claude_response)
+
+    yield from sse_frames(chunks, finish, ANALYSIS_SECTIONS)
+
+
+def sse_response(frames) -> Response:
+    return Response(stream_with_context(frames), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+def run_behavior_analysis(prompt: str, cache_key: str | None = None) -> str:
+    """Blocking Claude call for the behavior analysis prompt; the reply is cached under cache_key"""
+    result = call_llm("predict", _get_behavior_analysis_agent(), prompt)
+    claude_response = result.text.strip()
+    if cache_key is not None:
+        analysis_cache.put(cache_key, claude_response)
+    return claude_response
+
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
         data = request.json
+        payload, prompt, cache_key = prepare_prediction(data)
 
-        # Debugging: Log the raw request data
-        # ==================== RAW REQUEST DATA LOGGING ====================
-        print("\n" + "="*70)
-        print("📥 RAW REQUEST DATA FROM FRONTEND")
-        print("="*70)
-        print(json.dumps(data, indent=2, default=str))
-        print("="*70 + "\n")
-        # ==================================================================
-
-        # Debug: Log if weather data is available
-        print(f"Weather data available: {bool(weather)}")
-        if weather:
-            print(f"Weather data: {weather}")
-
-        # Extract weather data from the weather object
-        weather_temp = None
-        weather_humidity = None
-        weather_type_numeric = None
-
-        if weather:
-            # Get temperature from main.temp
-            weather_temp = weather.get("main", {}).get("temp")
-
-            # Get humidity from main.humidity (already in percent)
-            weather_humidity = weather.get("main", {}).get("humidity")
-
-            # Get weather type and convert to numeric
-            weather_main = weather.get("weather", [{}])[0].get("main", "")
-
-            # Format weather type according to your mapping
-            if weather_main in ["Clear"]:
-                weather_type_numeric = 0
-            elif weather_main in ["Clouds", "Cloudy", "Fog", "Sand", "Ash", "Squall", "Smoke", "Haze", "Mist"]:
-                weather_type_numeric = 1
-            elif weather_main in ["Rain", "Drizzle", "Snow"]:
-                weather_type_numeric = 2
-            else:
-                weather_type_numeric = 3
-
-            # Debug: Log extracted weather values
-            print(f"Extracted weather - Temp: {weather_temp}°C, Humidity: {weather_humidity}%, Type: {weather_main} -> {weather_type_numeric}")
-
-        # Helper function to parse time from 'HH:MM' format to datetime
-        def parse_time_string(time_str):
-            """Convert 'HH:MM' time string to datetime object using today's date"""
-            if not time_str:
-                return None
+        if wants_stream(data, request.headers.get("Accept")):
+            return sse_response(prediction_stream(payload, prompt, cache_key))
+
+        claude_response = analysis_cache.get(cache_key)
+        if claude_response is not None:
+            return jsonify(attach_analysis(payload, claude_response))
+
+        if defer_requested(data):
             try:
-                # Try ISO format first
-                return datetime.fromisoformat(time_str)
-            except ValueError:
-                # Parse 'HH:MM' format
-                hour, minute = map(int, time_str.split(':'))
-                now = datetime.now()
-                return now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-
-        # Calculate time_since_last_meal_min from meals array
-        meals = data.get("meals", [])
-        time_since_last_meal_min = None
-        if meals:
-            # Get the latest meal time
-            latest_meal_time = max([parse_time_string(meal["time"]) for meal in meals if meal.get("time")])
-            current_time = datetime.now()
-            time_since_last_meal_min = int((current_time - latest_meal_time).total_seconds() / 60)
-
-        # Calculate time_since_last_void_min from bathroomVisits array (only "no void" type)
-        bathroom_visits = data.get("bathroomVisits", [])
-        time_since_last_void_min = None
-        no_void_visits = [visit for visit in bathroom_visits if visit.get("type") == "no void"]
-        if no_void_visits:
-            latest_no_void_time = max([parse_time_string(visit["time"]) for visit in no_void_visits if visit.get("time")])
-            current_time = datetime.now()
-            time_since_last_void_min = int((current_time - latest_no_void_time).total_seconds() / 60)
-
-        # Calculate toileting_status_bucket_numeric from bathroomVisits array
-        toileting_status_bucket_numeric = 0
-        if bathroom_visits:
-            current_time = datetime.now()
-            last_60_min_visits = [
-                visit for visit in bathroom_visits
-                if visit.get("time") and (current_time - parse_time_string(visit["time"])).total_seconds() <= 3600
-            ]
-
-            # Check for void accidents in last 60 minutes
-            void_accidents = [v for v in last_60_min_visits if v.get("type") in ["bowel movement accident", "urine accident"]]
-
-            # Check for any void/movement in last 60 minutes
-            void_types = ["urine", "bowel movement", "bowel movement accident", "urine accident"]
-            any_void = [v for v in last_60_min_visits if v.get("type") in void_types]
-
-            if void_accidents:
-                toileting_status_bucket_numeric = 3  # Recent accident
-            elif not any_void:
-                toileting_status_bucket_numeric = 2  # No void in 60 min
-            elif any(v.get("type") in ["bowel movement accident", "urine accident"] for v in last_60_min_visits):
-                toileting_status_bucket_numeric = 1  # Any void accident in 60 min
-
-        # Calculate recent_accident_flag
-        recent_accident_flag = 1 if toileting_status_bucket_numeric == 3 else 0
-
-        # Map transition_type_numeric from transitionType
-        transition_map = {"none": 0, "minor": 1, "moderate": 2, "major": 3}
-        transition_type_numeric = transition_map.get(data.get("transitionType"), 0)
-
-        # Map social_context_numeric from socialInteractionContext
-        social_context_map = {"alone": 0, "plus_one": 1, "small_group": 2, "large_group": 3}
-        social_context_numeric = social_context_map.get(data.get("socialInteractionContext"), 0)
-
-        # Use weather data if available, otherwise fall back to form data
-        temperature = weather_temp if weather_temp is not None else data.get("temperature_c")
-        humidity = weather_humidity if weather_humidity is not None else data.get("humidity_percent")
-        weather_type = weather_type_numeric if weather_type_numeric is not None else data.get("weather_type_numeric")
-
-        # ==================== CALCULATED VALUES LOGGING ====================
-        print("="*70)
-        print("🔧 CALCULATED/PROCESSED VALUES")
-        print("="*70)
-        print(f"Time Calculations:")
-        print(f"  • Time since last meal:    {time_since_last_meal_min} minutes")
-        print(f"  • Time since last void:    {time_since_last_void_min} minutes")
-        print(f"\nToileting Status:")
-        print(f"  • Toileting status bucket: {toileting_status_bucket_numeric}")
-        print(f"     (0=Normal, 1=Any void accident in 60min, 2=No void in 60min, 3=Recent accident)")
-        print(f"  • Recent accident flag:    {recent_accident_flag}")
-        print(f"\nContext Mappings:")
-        print(f"  • Transition type numeric: {transition_type_numeric} (from '{data.get('transitionType')}')")
-        print(f"  • Social context numeric:  {social_context_numeric} (from '{data.get('socialInteractionContext')}')")
-        print(f"\nWeather (used in model):")
-        print(f"  • Temperature:             {temperature}°C")
-        print(f"  • Humidity:                {humidity}%")
-        print(f"  • Weather type numeric:    {weather_type}")
-        print(f"     (0=Clear, 1=Cloudy/Fog, 2=Rain/Snow, 3=Extreme)")
-        print("="*70 + "\n")
-        # ====================================================================
-
-        # Prepare features for the model
-        features = pd.DataFrame([{
-            "sleep_quality_numeric": data.get("sleep_quality_numeric"),
-            "time_numeric": convert_time_to_numeric(data.get("time_numeric")),
-            "weekday_numeric": data.get("weekday_numeric"),
-            "temperature_c": temperature,
-            "humidity_percent": humidity,
-            "weather_type_numeric": weather_type,
-            "time_since_last_meal_min": time_since_last_meal_min or data.get("time_since_last_meal_min"),
-            "time_since_last_void_min": time_since_last_void_min or data.get("time_since_last_void_min"),
-            "recent_accident_flag": recent_accident_flag,
-            "toileting_status_bucket_numeric": toileting_status_bucket_numeric,
-            "transition_type_numeric": transition_type_numeric,
-            "social_context_numeric": social_context_numeric,
-        }])
-
-        # ==================== MODEL INPUT LOGGING ====================
-        print("\n" + "="*70)
-        print("🤖 MODEL INPUT DATA")
-        print("="*70)
-        print("\nFeatures DataFrame:")
-        print(features.to_string())
-        print("\nFeature Values:")
-        for column in features.columns:
-            print(f"  • {column:35s} = {features[column].iloc[0]}")
-        print("="*70 + "\n")
-        # ============================================================
-
-        # Get prediction
-        prediction = model.predict(features)[0]
-        prediction_proba = model.predict_proba(features)[0]
-        confidence = float(max(prediction_proba))
-
-        # ==================== MODEL OUTPUT LOGGING ====================
-        print("="*70)
-        print("🎯 MODEL PREDICTION OUTPUT")
-        print("="*70)
-        print(f"  • Raw Prediction:          {prediction}")
-        print(f"  • Prediction Label:        {'HIGH RISK (1)' if prediction == 1 else 'LOW RISK (0)'}")
-        print(f"  • Probability [Low, High]: {prediction_proba}")
-        print(f"  • Low Risk Probability:    {prediction_proba[0]:.4f} ({prediction_proba[0]*100:.2f}%)")
-        print(f"  • High Risk Probability:   {prediction_proba[1]:.4f} ({prediction_proba[1]*100:.2f}%)")
-        print(f"  • Confidence:              {confidence:.4f} ({confidence*100:.2f}%)")
-        print("="*70 + "\n")
-
-        # Include weather in Claude prompt
-        weather_condition = weather.get("weather", [{}])[0].get("main", "Unknown") if weather else "Unknown"
-
-        # Debug: Log weather values being used
-        print(f"Weather values for Claude - Condition: {weather_condition}, Temp: {temperature}°C, Humidity: {humidity}%")
-
-        # Map numeric values to readable descriptions
-        sleep_quality_desc = {0: "Very Poor", 1: "Poor", 2: "Fair", 3: "Good", 4: "Excellent"}.get(data.get("sleep_quality_numeric"), "Unknown")
-        toileting_status_desc = {0: "Normal", 1: "Any void accident in 60 min", 2: "No void in 60 min", 3: "Recent accident"}.get(toileting_status_bucket_numeric, "Unknown")
-
-        # Format weather display based on whether real weather data is available
-        if temperature is not None and humidity is not None and weather_condition != "Unknown":
-            weather_display = f"{weather_condition}, {temperature}°C, {humidity}% humidity"
-        else:
-            weather_display = "Weather data not available"
-
-        prompt = f"""You are a Board Certified Behavior Analyst (BCBA) providing session support for ABA therapists and RBTs working in a clinic setting. Analyze the following behavioral data and provide practical, session-ready strategies for table work, NET (Natural Environment Teaching), transitions, and other typical ABA activities.
-
-BEHAVIORAL PREDICTION DATA:
-- Risk of Escalation: {"HIGH - Increased likelihood of challenging behavior/escalation" if prediction == 1 else "LOW - Baseline behavioral stability expected"}
-- Model Confidence: {confidence * 100:.1f}%
-- Probability of Challenging Behavior: {prediction_proba[1] * 100:.1f}%
-- Probability of Appropriate Behavior: {prediction_proba[0] * 100:.1f}%
-
-ANTECEDENT ANALYSIS (Motivating Operations & Setting Events):
-
-Physiological Motivating Operations:
-- Sleep Quality: {sleep_quality_desc} (Score: {data.get("sleep_quality_numeric")}/4)
-- Time Since Last Meal: {time_since_last_meal_min if time_since_last_meal_min else "N/A"} minutes (hunger may be an MO)
-- Time Since Last Void: {time_since_last_void_min if time_since_last_void_min else "N/A"} minutes (discomfort may be an MO)
-- Toileting Status: {toileting_status_desc}
-- Recent Accident: {"Yes" if recent_accident_flag else "No"}
-
-Environmental Context:
-- Current Weather: {weather_display}
-- Time of Day: {data.get("time_numeric")}
-- Day of Week: {["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"][data.get("weekday_numeric", 0)]}
-- Transition Type: {data.get("transitionType", "none").replace("_", " ").title()}
-- Social Context: {data.get("socialInteractionContext", "alone").replace("_", " ").title()}
-
-Please provide a detailed behavioral analysis in the following format, using clear ABA language and focusing on what is practical for therapists/technicians working in an ABA clinic session (table work, NET, transitions, etc.):
-
-BEHAVIORAL ANALYSIS:
-In 3–5 sentences, describe:
-- How current motivating operations (sleep, hunger, toileting, sensory context) and recent events might be setting the occasion for problem behavior.
-- The most likely antecedent patterns and probable functions of problem behavior in this context (for example, escape, attention, tangible, automatic).
-- How this risk profile might show up during typical ABA activities (discrete trials, transitions between tasks, group time, NET).
-- How current motivating operations (sleep, hunger, toileting, sensory context) and recent events might be setting the occasion for problem behavior.
-KEY RISK FACTORS:
-List the 2–4 most clinically relevant risk factors from the data above. Focus specifically on:
-- Antecedent triggers or transitions that are likely to produce problem behavior.
-- Current MOs/EOs (for example, low sleep, long time since meal/void, recent accident).
-- Social or environmental variables (group size, noise level, type of transition) that increase the likelihood of escalation.
-
-PROTECTIVE FACTORS:
-List 2–3 factors that the ABA team can lean on during this session, such as:
-- Existing supports (visual schedules, token systems, first/then, transition warnings).
-- Learner strengths or strong reinforcers that can be used proactively.
-- Any contextual elements that reduce risk (predictable routine, 1:1 support, calm environment).
-- Antecedent triggers or transitions that are likely to produce problem behavior.
-
-ACTIONABLE RECOMMENDATIONS:
-Provide 4–6 concrete, session-ready ABA strategies. Each item should be:
-- A specific action that a therapist/RBT can implement in the next 1–2 hours.
-- Focused on antecedent interventions (for example, transition warnings, task modification, choice-making), proactive reinforcement (for example, dense schedule of reinforcement, noncontingent access to certain stimuli), and teaching/rehearsing replacement behaviors (for example, functional communication) BEFORE problem behavior escalates.
-- Written in "do this" language (for example, "Before starting work, provide a 2-step visual 'first/then' with a preferred item," not vague suggestions).
-- Any contextual elements that reduce risk (predictable routine, 1:1 support, calm environment).
-
-
-MONITORING PRIORITIES:
-List 2–4 things the ABA team should actively watch for and document during the session, such as:
-- Early warning signs or precursor behaviors that typically occur before full escalation.
-- How the learner responds to specific antecedent strategies or reinforcement changes.
-- Any changes in suspected function or triggers that should be communicated to the supervising BCBA and used to refine the behavior plan or prediction model later."""
+                job = analysis_pool.submit(lambda: run_behavior_analysis(prompt, cache_key))
+                return jsonify(attach_pending_analysis(payload, job)), 202
+            except AnalysisStoreFull as e:
+                # No slot for the job: answer inline rather than hand out an id that may be dropped
+                log_deferral_refused(e)
 
         # Use Railtracks to call the behavior analysis agent
-        agent = _get_behavior_analysis_agent()
-        result = asyncio.run(rt.call(agent, prompt))
-        claude_response = result.text.strip()
-
-        return jsonify({
-            "prediction": int(prediction),
-            "prediction_label": "High Risk" if prediction == 1 else "Low Risk",
-            "confidence": round(confidence, 3),
-            "probabilities": {
-                "low_risk": round(float(prediction_proba[0]), 3),
-                "high_risk": round(float(prediction_proba[1]), 3)
-            },
-            "calculated_values": {
-                "time_since_last_meal_min": time_since_last_meal_min,
-                "time_since_last_void_min": time_since_last_void_min,
-                "toileting_status_bucket_numeric": toileting_status_bucket_numeric,
-                "transition_type_numeric": transition_type_numeric,
-                "social_context_numeric": social_context_numeric
-            },
-            "weather_used": {
-                "temperature": temperature,
-                "humidity": humidity,
-                "condition": weather_condition,
-                "type_numeric": weather_type
-            } if weather else None,
-            "analysis": claude_response,
-            "recommendations": claude_response  # Keep for backward compatibility
-        })
+        claude_response = run_behavior_analysis(prompt, cache_key)
 
+        return jsonify(attach_analysis(payload, claude_response))
+
+    except RequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/analysis/<analysis_id>', methods=['GET'])
+def get_analysis(analysis_id):
+    """Fetch a deferred analysis; ?wait=<seconds> long-polls until it is ready"""
+    try:
+        wait = parse_wait(request.args.get("wait"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job = analysis_pool.store.wait(analysis_id, wait)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired analysis_id {analysis_id}"}), 404
+    return jsonify(job.to_dict()), analysis_status_code(job)
+
+def score_batch(data) -> dict:
+    """Score many learners with one vectorized feature pass and a single predict_proba call.
+
+    Accepts either a JSON list of /predict payloads or {"learners": [...], "location": ...}. No Claude
+    analysis is generated here; this endpoint is meant for roster-wide risk scoring.
+    """
+    learners = data.get("learners") if isinstance(data, dict) else data
+
+    if not isinstance(learners, list):
+        raise RequestError("Expected a list of learner payloads")
+
+    threshold = data.get("decision_threshold") if isinstance(data, dict) else None
+    if threshold is not None:
+        try:
+            threshold = validate_threshold(threshold)
+        except (TypeError, ValueError) as e:
+            raise RequestError(str(e)) from e
+
+    # Learners with a learner_id take their time features from the event store
+    stored: dict[int, dict] = {}
+    failed: dict[int, str] = {}
+    for idx, learner in enumerate(learners):
+        if isinstance(learner, dict) and learner.get("learner_id") is not None:
+            try:
+                stored[idx] = derive_learner_features(learner)
+            except RequestError as e:
+                failed[idx] = str(e)
+
+    location = data.get("location") if isinstance(data, dict) else None
+    reading = stored_weather(location)
+    features, row_indexes, calculated, errors = build_feature_frame(
+        learners,
+        weather_values=reading.values if reading is not None else None,
+        derived=stored,
+        errors=failed,
+    )
+
+    predictor = model_registry.current
+    results = [None] * len(learners)
+    if row_indexes:
+        try:
+            batch = predictor.predict(features, threshold=threshold)
+        except Exception as e:
+            for idx in row_indexes:
+                errors[idx] = str(e)
+        else:
+            rows = zip(row_indexes, batch.labels, batch.probabilities, batch.confidence, calculated)
+            for idx, prediction, proba, confidence, values in rows:
+                results[idx] = {
+                    "index": idx,
+                    "status": "ok",
+                    "prediction": int(prediction),
+                    "prediction_label": "High Risk" if prediction == 1 else "Low Risk",
+                    "confidence": round(float(confidence), 3),
+                    "probabilities": {
+                        "low_risk": round(float(proba[0]), 3),
+                        "high_risk": round(float(proba[1]), 3)
+                    },
+                    "calculated_values": values,
+                }
+
+    for idx, message in errors.items():
+        results[idx] = {"index": idx, "status": "error", "error": message}
+
+    for idx, learner in enumerate(learners):
+        if isinstance(learner, dict) and "learner_id" in learner:
+            results[idx]["learner_id"] = learner["learner_id"]
+
+    return {
+        "decision_threshold": predictor.decision_threshold if threshold is None else threshold,
+        "model_version": predictor.version,
+        "count": len(results),
+        "succeeded": len(results) - len(errors),
+        "failed": len(errors),
+        "results": results,
+    }
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    try:
+        return jsonify(score_batch(request.json))
+
+    except RequestError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def score_day_curve(data: dict) -> dict:
+    """Score one learner at every time slot of the day with a single predict call.
+
+    Accepts a /predict payload plus optional "start"/"end" ("HH:MM"),
+    "step_minutes" and an hourly "forecast" list of {"time", "temperature",
+    "humidity", "condition"} entries.
+    """
+    if not isinstance(data, dict):
+        raise RequestError("Expected a JSON object")
+
+    if data.get("learner_id") is not None:
+        record_events(data["learner_id"], data)
+        data = {**data, **(learner_events.events(data["learner_id"]) or {"meals": [], "bathroomVisits": []})}
+
+    threshold = data.get("decision_threshold")
+    forecast = data.get("forecast")
+    if forecast is not None and not isinstance(forecast, list):
+        raise RequestError("forecast must be a list of hourly entries")
+    try:
+        if threshold is not None:
+            threshold = validate_threshold(threshold)
+        step_minutes = int(data.get("step_minutes", STEP_MINUTES_DEFAULT))
+        grid = time_grid(data.get("start", DAY_START_DEFAULT), data.get("end", DAY_END_DEFAULT), step_minutes)
+        reading = stored_weather(data.get("location"))
+        weather_values = reading.values if reading is not None else extract_weather(None)
+        features = build_day_features(data, grid, weather_values, forecast)
+    except (TypeError, ValueError) as e:
+        raise RequestError(str(e)) from e
+
+    predictor = model_registry.current
+    threshold = predictor.decision_threshold if threshold is None else threshold
+    cache_key = day_curve_key(features, predictor.version, threshold)
+    cached = day_curve_cache.get(cache_key)
+    if cached is not None:
+        return {**json.loads(cached), "cached": True}
+
+    high_risk = predictor.predict(features, threshold=threshold).high_risk
+    peak = int(high_risk.argmax())
+    body = {
+        "model_version": predictor.version,
+        "decision_threshold": threshold,
+        "step_minutes": step_minutes,
+        "points": [
+            {
+                "time": format_minutes(minutes),
+                "time_numeric": to_hhmm(minutes),
+                "high_risk": round(float(probability), 3),
+                "in_peak_window": bool(probability >= threshold),
+            }
+            for minutes, probability in zip(grid, high_risk)
+        ],
+        "peak": {"time": format_minutes(grid[peak]), "high_risk": round(float(high_risk[peak]), 3)},
+        "peak_windows": peak_windows(grid, high_risk, threshold, step_minutes),
+        "weather_source": "forecast" if forecast else ("current" if reading is not None else "form"),
+    }
+    day_curve_cache.put(cache_key, json.dumps(body))
+    return {**body, "cached": False}
+
+@app.route('/predict/day-curve', methods=['POST'])
+def predict_day_curve():
+    try:
+        return jsonify(score_day_curve(request.json))
+
+    except RequestError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -513,33 +787,11 @@ List 2–4 things the ABA team should actively watch for and document during the
 #         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
 
 
-# Chat agent cache
-_chat_agent = None
-
-def _get_chat_agent(system_message: str):
+def _get_chat_agent(system_message: str, stream: bool = False):
     """Get or create a chat agent with the specified system message using Railtracks"""
-    global _chat_agent
-    # For simplicity, we'll create a new agent if the system message changes
-    # In production, you might want to cache based on system message hash
-    agent = rt.agent_node(
-        "BCBA Chat Assistant",
-        llm=rt.llm.AnthropicLLM(model_name),
-        system_message=system_message,
-    )
-    return agent
-
-@app.route('/chat', methods=['POST'])
-def chat():
-    """Chat endpoint using Railtracks for conversation with the BCBA assistant"""
-    try:
-        data = request.json
-        messages = data.get("messages", [])
-
-        if not messages or not isinstance(messages, list):
-            return jsonify({"error": "Invalid messages format"}), 400
+    return agent_pool.get("BCBA Chat Assistant", model_name, system_message, stream=stream)
 
-        # Extract system message if provided, otherwise use default
-        system_message_default = """You are a Board Certified Behavior Analyst (BCBA) providing real-time session support for ABA therapists, RBTs, and technicians working in clinic settings with learners. Your responses should be practical, concrete, and immediately implementable during table work, NET (Natural Environment Teaching), transitions, and other ABA activities.
+DEFAULT_CHAT_SYSTEM_MESSAGE = """You are a Board Certified Behavior Analyst (BCBA) providing real-time session support for ABA therapists, RBTs, and technicians working in clinic settings with learners. Your responses should be practical, concrete, and immediately implementable during table work, NET (Natural Environment Teaching), transitions, and other ABA activities.
 
 When providing guidance:
 - Use clear ABA terminology (MOs/EOs, antecedents, functions, reinforcement schedules, etc.)
@@ -567,71 +819,153 @@ Important limitations:
 
 Your goal is to help ABA staff implement effective, function-based interventions during active sessions."""
 
-        system_msg = None
-        for msg in messages:
-            if msg.get("role") == "system":
-                system_msg = msg.get("content")
-                break
+CONVERSATION_SUMMARY_SYSTEM_MESSAGE = """You keep running summaries of conversations between ABA clinic staff and a BCBA session-support assistant. Preserve the learner context, behaviors and triggers discussed, strategies already suggested, and any open questions. Write concise plain prose with no preamble."""
+
+def summarize_conversation(previous_summary: str | None, transcript: str) -> str:
+    """Fold newly aged-out turns into the conversation's running summary"""
+    agent = agent_pool.get("Conversation Summarizer", model_name, CONVERSATION_SUMMARY_SYSTEM_MESSAGE)
+    if previous_summary:
+        prompt = f"Current summary:\n{previous_summary}\n\nAdditional turns:\n{transcript}\nRewrite the summary so it also covers the additional turns."
+    else:
+        prompt = f"Conversation:\n{transcript}\nSummarize this conversation."
+    result = call_llm("summarize", agent, prompt)
+    return result.text
+
+conversation_manager = ConversationManager(
+    summarize_conversation,
+    history_token_budget=int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", HISTORY_TOKEN_BUDGET_DEFAULT)),
+)
+
+def prepare_chat(data: dict) -> tuple[str, str, dict]:
+    """Return the system prompt, the full prompt for the latest user message and its token usage.
+
+    May call Claude to summarize turns that fell out of the history window, so
+    async callers should run it in a worker thread.
+    """
+    if not isinstance(data, dict):
+        raise RequestError("Expected a JSON object")
+
+    messages = data.get("messages", [])
+
+    if not messages or not isinstance(messages, list):
+        raise RequestError("Invalid messages format")
+
+    # Extract system message if provided, otherwise use default
+    system_msg = None
+    for msg in messages:
+        if msg.get("role") == "system":
+            system_msg = msg.get("content")
+            break
+
+    system_prompt = system_msg or DEFAULT_CHAT_SYSTEM_MESSAGE
+
+    # Filter out system messages; the latest user message is answered, the rest is history
+    conversation_messages = [msg for msg in messages if msg.get("role") in ["user", "assistant"]]
+
+    last_user_index = None
+    for index in range(len(conversation_messages) - 1, -1, -1):
+        if conversation_messages[index].get("role") == "user":
+            last_user_index = index
+            break
+
+    if last_user_index is None or not conversation_messages[last_user_index].get("content"):
+        raise RequestError("No user message found")
+
+    chat_prompt = conversation_manager.build(
+        conversation_messages[:last_user_index],
+        conversation_messages[last_user_index].get("content", ""),
+        system_prompt,
+        conversation_id=data.get("conversation_id"),
+    )
+    return system_prompt, chat_prompt.prompt, chat_prompt.usage
 
-        system_prompt = system_msg or system_message_default
-
-        # Filter out system messages and build conversation history
-        conversation_messages = [msg for msg in messages if msg.get("role") in ["user", "assistant"]]
-
-        # Build the full conversation context
-        conversation_text = ""
-        for msg in conversation_messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            if role == "user":
-                conversation_text += f"User: {content}\n\n"
-            elif role == "assistant":
-                conversation_text += f"Assistant: {content}\n\n"
-
-        # Get the last user message
-        last_user_message = ""
-        for msg in reversed(conversation_messages):
-            if msg.get("role") == "user":
-                last_user_message = msg.get("content", "")
-                break
+def chat_reply(reply_text: str, usage: dict) -> dict:
+    return {"reply": reply_text, "usage": {**usage, "output_tokens": estimate_tokens(reply_text)}}
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    """Chat endpoint using Railtracks for conversation with the BCBA assistant"""
+    try:
+        data = request.json
+        with stage_seconds.time("chat", "prompt"):
+            system_prompt, full_prompt, usage = prepare_chat(data)
 
-        if not last_user_message:
-            return jsonify({"error": "No user message found"}), 400
+        if wants_stream(data, request.headers.get("Accept")):
+            chunks = llm_text_chunks("chat", _get_chat_agent(system_prompt, stream=True), full_prompt)
+            return sse_response(sse_frames(chunks, lambda reply_text: chat_reply(reply_text, usage)))
 
         # Create agent with system message
         agent = _get_chat_agent(system_prompt)
 
-        # If there's conversation history, include it in the prompt
-        if len(conversation_messages) > 1:
-            # Build context from previous messages (excluding the last one)
-            context_messages = conversation_messages[:-1]
-            context_text = "Previous conversation:\n"
-            for msg in context_messages:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                if role == "user":
-                    context_text += f"User: {content}\n\n"
-                elif role == "assistant":
-                    context_text += f"Assistant: {content}\n\n"
-
-            full_prompt = f"{context_text}\nUser: {last_user_message}\n\nPlease respond to the user's latest message, taking into account the conversation history above."
-        else:
-            full_prompt = last_user_message
-
         # Use Railtracks to call the agent
-        result = asyncio.run(rt.call(agent, full_prompt))
+        result = call_llm("chat", agent, full_prompt)
         reply_text = result.text.strip()
 
-        return jsonify({"reply": reply_text})
+        return jsonify(chat_reply(reply_text, usage))
 
+    except RequestError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error in /chat: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("chat failed")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/model', methods=['GET'])
+def model_info():
+    return jsonify(model_registry.stats()), 200
+
+@app.route('/model/rollback', methods=['POST'])
+def rollback_model():
+    try:
+        model_registry.rollback()
+        return jsonify(model_registry.stats()), 200
+
+    except RollbackError as e:
+        return jsonify({"error": str(e)}), 409
+
+# A row with every feature missing, which the serving model must still score
+READINESS_PROBE = feature_matrix([dict.fromkeys(NUMERIC_FEATURES)])
+
+def readiness() -> tuple[dict, int]:
+    """/health body and status: ready only while the serving model answers a probe prediction"""
+    try:
+        predictor = model_registry.current
+        probabilities = predictor.predict(READINESS_PROBE).probabilities[0]
+        # NaN fails both comparisons
+        if not all(0.0 <= value <= 1.0 for value in probabilities):
+            raise ValueError(f"Probe prediction returned {list(probabilities)}")
+        model_check = {"ok": True, "version": predictor.version}
+    except Exception as e:
+        logger.exception("readiness probe failed")
+        model_check = {"ok": False, "error": str(e)}
+
+    ready = model_check["ok"]
+    return {
+        'status': 'healthy' if ready else 'unavailable',
+        'checks': {'model': model_check},
+        'llm_backend': llm_backend,
+        'model': model_registry.stats() if ready else None,
+        'analysis_cache': analysis_cache.stats(),
+        'agent_pool': agent_pool.stats(),
+        'conversations': conversation_manager.stats(),
+        'weather': weather_store.stats(),
+        'learner_events': learner_events.stats(),
+    }, 200 if ready else 503
+
+metrics_registry.gauge(
+    "aba_model_info",
+    "Serving model version and decision threshold (always 1)",
+    ("version", "decision_threshold"),
+    lambda: {(model_registry.current.version, model_registry.current.decision_threshold): 1},
+)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'healthy'}), 200
+    body, status_code = readiness()
+    return jsonify(body), status_code
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
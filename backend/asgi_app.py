@@ -0,0 +1,432 @@
+"""ASGI serving mode for the ABA Forecast backend.
+
+Exposes the same routes and JSON shapes as the Flask server in app.py, but
+awaits Railtracks calls on uvicorn's single long-lived event loop instead of
+creating a fresh loop per request with asyncio.run. Keeping one loop alive lets
+the LLM client reuse its HTTP connection pool across requests.
+
+In-flight Claude calls are capped by a semaphore. A request that cannot get a
+slot within the queue timeout is answered with 503 and a Retry-After header,
+so a burst of slow LLM round trips applies backpressure instead of starving
+the server.
+
+Run from the project root:
+
+    python backend/asgi_app.py
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+import railtracks as rt
+import uvicorn
+
+from analysis_jobs import SHARED_POLL_SECONDS, AnalysisJob, AnalysisStoreFull, parse_wait
+from app import (
+    RequestError,
+    _get_behavior_analysis_agent,
+    _get_chat_agent,
+    analysis_cache,
+    analysis_pool,
+    analysis_status_code,
+    attach_analysis,
+    attach_pending_analysis,
+    chat_reply,
+    defer_requested,
+    learner_events,
+    log_deferral_refused,
+    llm_input_tokens,
+    model_registry,
+    prepare_chat,
+    prepare_prediction,
+    readiness,
+    record_events,
+    score_batch,
+    score_day_curve,
+    store_weather,
+)
+from metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    llm_errors,
+    record_llm_call,
+    registry as metrics_registry,
+    request_seconds,
+    stage_seconds,
+)
+from model_registry import RollbackError
+from streaming import ANALYSIS_SECTIONS, SSE_HEADERS, asse_frames, sse_event, wants_stream
+from structured_logging import begin_request, get_logger
+
+LLM_CONCURRENCY = int(os.environ.get("ASGI_LLM_CONCURRENCY", "8"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("ASGI_LLM_QUEUE_TIMEOUT", "30"))
+HOST = os.environ.get("ASGI_HOST", "127.0.0.1")
+PORT = int(os.environ.get("ASGI_PORT", "5000"))
+
+logger = get_logger("asgi")
+# How often a long-polling /analysis request re-checks its job
+ANALYSIS_POLL_INTERVAL = 0.05
+
+
+class LLMBusyError(RuntimeError):
+    """No LLM slot became free within the queue timeout"""
+
+
+class LLMGate:
+    """Caps concurrent Railtracks calls; waiters give up after ``timeout`` seconds."""
+
+    def __init__(self, limit: int, timeout: float):
+        if limit < 1:
+            raise ValueError(f"LLM concurrency must be at least 1, got {limit}")
+        self.limit = limit
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self, operation: str):
+        """Hold one LLM slot, e.g. for the whole lifetime of a streamed reply"""
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            llm_errors.inc(1, operation, LLMBusyError.__name__)
+            raise LLMBusyError(
+                f"All {self.limit} LLM slots busy for {self.timeout:g}s, try again shortly"
+            ) from None
+        finally:
+            self.waiting -= 1
+            stage_seconds.observe(time.perf_counter() - started, operation, "llm_queue")
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def call(self, operation: str, agent, prompt: str):
+        async with self.slot(operation):
+            started = time.perf_counter()
+            try:
+                result = await rt.call(agent, prompt)
+            except Exception as e:
+                record_llm_call(operation, llm_input_tokens(agent, prompt), started, error=e)
+                raise
+            record_llm_call(operation, llm_input_tokens(agent, prompt), started, reply=result.text)
+            return result
+
+    async def stream(self, operation: str, agent, prompt: str):
+        """Yield text chunks from a streaming agent without blocking the event loop"""
+        async with self.slot(operation):
+            started = time.perf_counter()
+            parts = []
+            try:
+                generator = await rt.call(agent, prompt)
+                async for item in iterate_in_threadpool(generator):
+                    # The generator ends with the assembled response object
+                    if not isinstance(item, str):
+                        break
+                    parts.append(item)
+                    yield item
+            except Exception as e:
+                record_llm_call(operation, llm_input_tokens(agent, prompt), started, error=e)
+                raise
+            record_llm_call(operation, llm_input_tokens(agent, prompt), started, reply="".join(parts))
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    # Railtracks runs the blocking LLM client in the default executor; size it so the
+    # semaphore, not the executor's CPU-based default, is what limits concurrency
+    # (the extra threads leave room for batch scoring)
+    executor = ThreadPoolExecutor(max_workers=LLM_CONCURRENCY + 4, thread_name_prefix="worker")
+    loop.set_default_executor(executor)
+    app.state.llm_gate = LLMGate(LLM_CONCURRENCY, LLM_QUEUE_TIMEOUT)
+    app.state.analysis_tasks = set()
+    logger.info("ASGI server ready", extra={"fields": {
+        "llm_concurrency": LLM_CONCURRENCY,
+        "llm_queue_timeout": LLM_QUEUE_TIMEOUT,
+    }})
+    yield
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="ABA Forecast", lifespan=lifespan)
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+
+
+@app.middleware("http")
+async def tag_request_logs(request: Request, call_next):
+    begin_request(request.url.path)
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Route templates, not raw paths, so learner ids do not become label values
+    route = request.scope.get("route")
+    request_seconds.observe(
+        time.perf_counter() - started,
+        route.path if route is not None else "unmatched",
+        str(response.status_code),
+    )
+    return response
+
+
+def _error(message: str, status_code: int, headers: dict | None = None) -> JSONResponse:
+    return JSONResponse({"error": message}, status_code=status_code, headers=headers)
+
+
+def _sse(frames) -> StreamingResponse:
+    return StreamingResponse(frames, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+async def _prediction_stream(gate: LLMGate, payload: dict, prompt: str, cache_key: str):
+    yield sse_event("prediction", payload)
+
+    cached = analysis_cache.get(cache_key)
+
+    async def chunks():
+        if cached is not None:
+            yield cached
+            return
+        async for chunk in gate.stream("predict", _get_behavior_analysis_agent(stream=True), prompt):
+            yield chunk
+
+    def finish(claude_response: str) -> dict:
+        if cached is None:
+            analysis_cache.put(cache_key, claude_response)
+        return attach_analysis(payload, claude_response)
+
+    async for frame in asse_frames(chunks(), finish, ANALYSIS_SECTIONS):
+        yield frame
+
+
+def _busy(e: LLMBusyError) -> JSONResponse:
+    return _error(str(e), 503, headers={"Retry-After": str(math.ceil(LLM_QUEUE_TIMEOUT))})
+
+
+async def _run_behavior_analysis(gate: LLMGate, prompt: str, cache_key: str) -> str:
+    result = await gate.call("predict", _get_behavior_analysis_agent(), prompt)
+    claude_response = result.text.strip()
+    analysis_cache.put(cache_key, claude_response)
+    return claude_response
+
+
+async def _run_deferred_analysis(gate: LLMGate, job: AnalysisJob, prompt: str, cache_key: str) -> None:
+    try:
+        analysis_pool.store.complete(job, await _run_behavior_analysis(gate, prompt, cache_key))
+    except Exception as e:
+        logger.exception("analysis failed", extra={"fields": {"analysis_id": job.analysis_id}})
+        analysis_pool.store.fail(job, str(e))
+
+
+async def _json_body(request: Request):
+    try:
+        return await request.json()
+    except ValueError as e:
+        raise RequestError(f"Invalid JSON body: {e}") from e
+
+
+@app.post("/weather")
+async def receive_weather(request: Request):
+    try:
+        return store_weather(await _json_body(request))
+
+    except RequestError as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@app.post("/learners/{learner_id}/events")
+async def add_learner_events(learner_id: str, request: Request):
+    try:
+        return record_events(learner_id, await _json_body(request))
+
+    except RequestError as e:
+        return _error(str(e), 400)
+
+
+@app.get("/learners/{learner_id}/events")
+async def get_learner_events(learner_id: str):
+    events = learner_events.events(learner_id)
+    if events is None:
+        return _error(f"No events stored for learner {learner_id}", 404)
+    return {**events, "calculated_values": learner_events.derive(learner_id)}
+
+
+@app.delete("/learners/{learner_id}/events")
+async def clear_learner_events(learner_id: str):
+    if not learner_events.clear(learner_id):
+        return _error(f"No events stored for learner {learner_id}", 404)
+    return {"status": "cleared", "learner_id": learner_id}
+
+
+@app.post("/predict")
+async def predict(request: Request):
+    try:
+        data = await _json_body(request)
+        payload, prompt, cache_key = prepare_prediction(data)
+        gate = request.app.state.llm_gate
+
+        if wants_stream(data, request.headers.get("accept")):
+            return _sse(_prediction_stream(gate, payload, prompt, cache_key))
+
+        claude_response = analysis_cache.get(cache_key)
+        if claude_response is not None:
+            return attach_analysis(payload, claude_response)
+
+        if defer_requested(data):
+            try:
+                job = analysis_pool.store.create()
+            except AnalysisStoreFull as e:
+                # No slot for the job: answer inline rather than hand out an id that may be dropped
+                log_deferral_refused(e)
+            else:
+                task = asyncio.create_task(_run_deferred_analysis(gate, job, prompt, cache_key))
+                # The loop only keeps weak references to tasks
+                request.app.state.analysis_tasks.add(task)
+                task.add_done_callback(request.app.state.analysis_tasks.discard)
+                return JSONResponse(attach_pending_analysis(payload, job), status_code=202)
+
+        claude_response = await _run_behavior_analysis(gate, prompt, cache_key)
+
+        return attach_analysis(payload, claude_response)
+
+    except RequestError as e:
+        return _error(str(e), 400)
+    except LLMBusyError as e:
+        return _busy(e)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@app.get("/analysis/{analysis_id}")
+async def get_analysis(analysis_id: str, request: Request):
+    """Fetch a deferred analysis; ?wait=<seconds> long-polls until it is ready"""
+    try:
+        wait = parse_wait(request.query_params.get("wait"))
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    job = analysis_pool.store.get(analysis_id)
+    if job is None:
+        return _error(f"Unknown or expired analysis_id {analysis_id}", 404)
+
+    deadline = asyncio.get_running_loop().time() + wait
+    poll_interval = SHARED_POLL_SECONDS if analysis_pool.store.shared else ANALYSIS_POLL_INTERVAL
+    while not job.done.is_set() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(poll_interval)
+        # A job run by another pre-forked worker is a snapshot, so read it again
+        job = analysis_pool.store.get(analysis_id) or job
+    return JSONResponse(job.to_dict(), status_code=analysis_status_code(job))
+
+
+@app.post("/predict/batch")
+async def predict_batch(request: Request):
+    try:
+        data = await _json_body(request)
+        # Large rosters are CPU-bound; keep them off the event loop
+        return await asyncio.to_thread(score_batch, data)
+
+    except RequestError as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@app.post("/predict/day-curve")
+async def predict_day_curve(request: Request):
+    try:
+        data = await _json_body(request)
+        return await asyncio.to_thread(score_day_curve, data)
+
+    except RequestError as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        return _error(str(e), 500)
+
+
+@app.post("/chat")
+async def chat(request: Request):
+    """Chat endpoint using Railtracks for conversation with the BCBA assistant"""
+    try:
+        data = await _json_body(request)
+        # prepare_chat may block on a history summary call
+        with stage_seconds.time("chat", "prompt"):
+            system_prompt, full_prompt, usage = await asyncio.to_thread(prepare_chat, data)
+        gate = request.app.state.llm_gate
+
+        if wants_stream(data, request.headers.get("accept")):
+            chunks = gate.stream("chat", _get_chat_agent(system_prompt, stream=True), full_prompt)
+            return _sse(asse_frames(chunks, lambda reply_text: chat_reply(reply_text, usage)))
+
+        agent = _get_chat_agent(system_prompt)
+        result = await gate.call("chat", agent, full_prompt)
+        reply_text = result.text.strip()
+
+        return chat_reply(reply_text, usage)
+
+    except RequestError as e:
+        return _error(str(e), 400)
+    except LLMBusyError as e:
+        return _busy(e)
+    except Exception as e:
+        logger.exception("chat failed")
+        return _error(str(e), 500)
+
+
+@app.get("/model")
+async def model_info():
+    return model_registry.stats()
+
+
+@app.post("/model/rollback")
+async def rollback_model():
+    try:
+        model_registry.rollback()
+        return model_registry.stats()
+
+    except RollbackError as e:
+        return _error(str(e), 409)
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/health")
+async def health(request: Request):
+    body, status_code = readiness()
+    body["llm"] = request.app.state.llm_gate.stats()
+    # Set by prefork.py in each worker process
+    worker_stats = getattr(request.app.state, "worker_stats", None)
+    if worker_stats is not None:
+        body["worker"] = worker_stats()
+    return JSONResponse(body, status_code=status_code)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=HOST, port=PORT)
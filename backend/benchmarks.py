@@ -0,0 +1,323 @@
+"""Microbenchmarks for the backend's serving and training hot paths.
+
+Each case times one stage on its own: deriving features from a realistic
+event log, building the model input, predict_proba at several batch sizes,
+building the analysis prompt, generating synthetic data and training. Every
+case is calibrated to run long enough to time reliably and is then repeated;
+the median and best time per call are reported.
+
+Results can be saved as a JSON baseline. Later runs compare each case
+against it and flag any case slower than the tolerance as a regression (exit
+status 1). The comparison uses the best round, which is far less sensitive
+than the median to other load on the machine.
+
+    python backend/benchmarks.py --save-baseline          # record a baseline
+    python backend/benchmarks.py                          # compare against it
+    python backend/benchmarks.py --stages features,predict
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from analysis_cache import analysis_cache_key
+from analysis_prompt import behavior_analysis_prompt, weather_display
+from features import assemble_features, build_feature_frame, derive_time_features, extract_weather
+from generate_synthetic_data import generate_samples
+from inference import BehaviorPredictor, feature_matrix
+from learner_events import LearnerEventStore
+from train_model import MODEL_DIR_DEFAULT, NUMERIC_FEATURES, TrainConfig, train
+
+BASELINE_PATH_DEFAULT = Path("backend") / "benchmark_baseline.json"
+# A case whose best time is this much slower than the baseline's is a regression. Microsecond
+# cases on a shared VM vary by a third from run to run, so a tighter bound needs a quiet machine.
+TOLERANCE_DEFAULT = 0.5
+ROUNDS_DEFAULT = 7
+# Training runs take seconds each, so they get fewer rounds
+TRAIN_ROUNDS = 3
+PREDICT_ROWS = (1, 100, 10_000)
+GENERATE_SAMPLES = (1_000, 10_000, 100_000)
+TRAIN_SAMPLES = (2_000, 7_000, 20_000)
+BATCH_LEARNERS = 100
+SEED = 42
+
+# Fixed clock so derived minutes, and therefore the prompt, are the same every run
+NOW = datetime(2025, 1, 15, 14, 30)
+
+
+@dataclass(frozen=True)
+class Case:
+    name: str
+    fn: Callable[[], object]
+    rounds: int = ROUNDS_DEFAULT
+
+
+def realistic_payload(now: datetime = NOW) -> dict:
+    """One learner's /predict payload with a full morning of meals and bathroom visits"""
+    def at(minutes_ago: int) -> str:
+        return (now - timedelta(minutes=minutes_ago)).strftime("%H:%M")
+
+    return {
+        "sleep_quality_numeric": 1,
+        "time_numeric": int(now.strftime("%H%M")),
+        "weekday_numeric": 3,
+        "temperature_c": 21,
+        "humidity_percent": 55,
+        "weather_type_numeric": 1,
+        "transitionType": "moderate",
+        "socialInteractionContext": "small_group",
+        "meals": [{"time": at(minutes)} for minutes in (390, 240, 95)],
+        "bathroomVisits": [
+            {"time": at(minutes), "type": visit_type}
+            for minutes, visit_type in (
+                (400, "urine"),
+                (330, "no void"),
+                (280, "urine"),
+                (210, "bowel movement"),
+                (160, "no void"),
+                (120, "urine accident"),
+                (70, "urine"),
+                (25, "no void"),
+            )
+        ],
+    }
+
+
+def _feature_cases(context: dict) -> list[Case]:
+    payload = realistic_payload()
+    derived = derive_time_features(payload, now=NOW)
+    weather_values = extract_weather(None)
+    roster = [realistic_payload() for _ in range(BATCH_LEARNERS)]
+
+    store = LearnerEventStore()
+    store.add("benchmark", payload["meals"], payload["bathroomVisits"], now=NOW)
+
+    return [
+        Case("features.derive_time_features", lambda: derive_time_features(payload, now=NOW)),
+        Case("features.event_store_derive", lambda: store.derive("benchmark", now=NOW)),
+        Case("features.assemble_features", lambda: assemble_features(payload, derived, weather_values)),
+        Case(
+            f"features.build_feature_frame.learners_{BATCH_LEARNERS}",
+            lambda: build_feature_frame(roster, now=NOW, weather_values=weather_values),
+        ),
+    ]
+
+
+def _dataframe_cases(context: dict) -> list[Case]:
+    payload = realistic_payload()
+    row = assemble_features(payload, derive_time_features(payload, now=NOW), extract_weather(None))
+    rows = [row] * BATCH_LEARNERS
+    return [
+        Case("dataframe.pandas.rows_1", lambda: pd.DataFrame([row], columns=NUMERIC_FEATURES)),
+        Case("dataframe.feature_matrix.rows_1", lambda: feature_matrix([row])),
+        Case(f"dataframe.pandas.rows_{BATCH_LEARNERS}", lambda: pd.DataFrame(rows, columns=NUMERIC_FEATURES)),
+        Case(f"dataframe.feature_matrix.rows_{BATCH_LEARNERS}", lambda: feature_matrix(rows)),
+    ]
+
+
+def _predict_cases(context: dict) -> list[Case]:
+    predictor = context["predictor"]
+    samples = generate_samples(max(PREDICT_ROWS), seed=SEED)[NUMERIC_FEATURES]
+    cases = []
+    for rows in PREDICT_ROWS:
+        frame = samples.iloc[:rows].reset_index(drop=True)
+        matrix = frame.to_numpy(dtype=np.float32)
+        cases.append(Case(f"predict.pipeline_proba.rows_{rows}", lambda frame=frame: predictor.pipeline.predict_proba(frame)))
+        # The serving path: compiled forest for small batches, sklearn above COMPILED_MAX_ROWS
+        cases.append(Case(f"predict.serving.rows_{rows}", lambda matrix=matrix: predictor.predict(matrix)))
+    return cases
+
+
+def _prompt_cases(context: dict) -> list[Case]:
+    payload = realistic_payload()
+    derived = derive_time_features(payload, now=NOW)
+    proba = np.array([0.27, 0.73])
+    summary = weather_display("Clouds", 21, 55)
+    key_inputs = {
+        "prediction": 1,
+        "high_risk_probability": proba[1],
+        "sleep_quality_numeric": payload["sleep_quality_numeric"],
+        "time_since_last_meal_min": derived["time_since_last_meal_min"],
+        "time_since_last_void_min": derived["time_since_last_void_min"],
+        "toileting_status_bucket_numeric": derived["toileting_status_bucket_numeric"],
+        "recent_accident_flag": derived["recent_accident_flag"],
+        "transitionType": payload["transitionType"],
+        "socialInteractionContext": payload["socialInteractionContext"],
+        "weather_condition": "Clouds",
+        "temperature_c": 21,
+        "humidity_percent": 55,
+        "time_numeric": payload["time_numeric"],
+        "weekday_numeric": payload["weekday_numeric"],
+    }
+    return [
+        Case("prompt.behavior_analysis", lambda: behavior_analysis_prompt(payload, derived, 1, proba, 0.73, summary)),
+        Case("prompt.analysis_cache_key", lambda: analysis_cache_key(key_inputs)),
+    ]
+
+
+def _generate_cases(context: dict) -> list[Case]:
+    return [
+        Case(f"generate.samples_{samples}", lambda samples=samples: generate_samples(samples, seed=SEED))
+        for samples in GENERATE_SAMPLES
+    ]
+
+
+def _train_cases(context: dict) -> list[Case]:
+    workdir = Path(context["workdir"])
+    cases = []
+    for samples in TRAIN_SAMPLES:
+        data_path = workdir / f"train_{samples}.csv"
+        generate_samples(samples, seed=SEED).to_csv(data_path, index=False)
+        config = TrainConfig(
+            data_path=data_path,
+            model_dir=workdir / f"model_{samples}",
+            test_size=0.2,
+            random_seed=SEED,
+        )
+        cases.append(Case(f"train.samples_{samples}", lambda config=config: train(config), rounds=TRAIN_ROUNDS))
+    return cases
+
+
+STAGES = {
+    "features": _feature_cases,
+    "dataframe": _dataframe_cases,
+    "predict": _predict_cases,
+    "prompt": _prompt_cases,
+    "generate": _generate_cases,
+    "train": _train_cases,
+}
+
+
+def measure(case: Case, rounds: int | None = None) -> dict:
+    """Median and best seconds per call, calibrated so each round runs for at least 0.2 s"""
+    timer = timeit.Timer(case.fn)
+    loops, _ = timer.autorange()
+    rounds = rounds or case.rounds
+    per_call = [total / loops for total in timer.repeat(repeat=rounds, number=loops)]
+    return {
+        "median_s": statistics.median(per_call),
+        "min_s": min(per_call),
+        "loops": loops,
+        "rounds": rounds,
+    }
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[dict]:
+    """Each case's best time against the baseline's: regression, improvement, ok or new"""
+    rows = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            rows.append({"case": name, "status": "new", "ratio": None})
+            continue
+        ratio = result["min_s"] / previous["min_s"]
+        if ratio > 1 + tolerance:
+            status = "regression"
+        elif ratio < 1 / (1 + tolerance):
+            status = "improvement"
+        else:
+            status = "ok"
+        rows.append({"case": name, "status": status, "ratio": round(ratio, 3)})
+    return rows
+
+
+def _format_seconds(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Time the backend hot paths and compare them with a saved baseline")
+    parser.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help=f"Comma-separated stages to run (default: all of {', '.join(STAGES)})",
+    )
+    parser.add_argument("--model-dir", type=Path, default=MODEL_DIR_DEFAULT, help="Model scored by the predict stage")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH_DEFAULT, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run's results as the new baseline")
+    parser.add_argument("--output", type=Path, default=None, help="Also write this run's results to this JSON file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE_DEFAULT,
+        help="Allowed slowdown before a case counts as a regression (0.5 = 50%%)",
+    )
+    parser.add_argument("--rounds", type=int, default=None, help="Override the number of timed rounds per case")
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise SystemExit(f"Unknown stages {unknown}; choose from {list(STAGES)}")
+
+    results: dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as workdir:
+        context = {"workdir": workdir}
+        if "predict" in stages:
+            context["predictor"] = BehaviorPredictor.load(args.model_dir)
+        for stage in stages:
+            for case in STAGES[stage](context):
+                results[case.name] = measure(case, args.rounds)
+                print(f"{case.name:<48} {_format_seconds(results[case.name]['median_s']):>12}", file=sys.stderr)
+
+    run = {"created": datetime.now().isoformat(timespec="seconds"), "environment": environment(), "results": results}
+
+    regressions = []
+    if args.baseline.exists() and not args.save_baseline:
+        with args.baseline.open("r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("environment") != run["environment"]:
+            print("Warning: the baseline was recorded in a different environment", file=sys.stderr)
+        comparison = compare(results, baseline, args.tolerance)
+        run["comparison"] = comparison
+        regressions = [row for row in comparison if row["status"] == "regression"]
+
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+    if args.save_baseline:
+        with args.baseline.open("w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved baseline with {len(results)} cases -> {args.baseline}", file=sys.stderr)
+
+    print(json.dumps(run.get("comparison", results), indent=2))
+    if regressions:
+        names = ", ".join(f"{row['case']} (x{row['ratio']})" for row in regressions)
+        raise SystemExit(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {names}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+"""Array-backed evaluator for the behavior predictor's random forest.
+
+The fitted StandardScaler + RandomForestClassifier pipeline is flattened into a
+handful of NumPy node arrays with the scaler folded into the split thresholds,
+so a raw (unscaled) float32 feature vector can be scored without pandas,
+ColumnTransformer validation or joblib dispatch.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+import argparse
+import io
+import json
+import mmap
+import struct
+import time
+import zipfile
+
+import numpy as np
+
+from train_model import (
+    DATA_FILE_DEFAULT,
+    FOREST_FILENAME,
+    MODEL_DIR_DEFAULT,
+    MODEL_FILENAME,
+    NUMERIC_FEATURES,
+)
+
+POSITIVE_LABEL = 1
+# Array data in the exported archive starts on this boundary, like NumPy's own .npy headers
+ARRAY_ALIGNMENT = 64
+# Zip extra-field id for alignment padding, as used by Android's zipalign
+PADDING_EXTRA_ID = 0xD935
+
+
+def _fold_thresholds(threshold: np.ndarray, mean: np.ndarray, scale: np.ndarray) -> np.ndarray:
+    """Rewrite scaled split thresholds as raw float32 thresholds.
+
+    x_scaled <= t is equivalent to x_raw <= t * scale + mean (scale is always
+    positive), but sklearn rounds the scaled value to float32 before comparing,
+    and some thresholds sit exactly on a rounded training value. Each folded
+    threshold is therefore nudged to the largest float32 raw value that sklearn
+    would still send left, which keeps the decisions bit-for-bit identical.
+    """
+
+    def goes_left(raw: np.ndarray) -> np.ndarray:
+        scaled = ((raw.astype(np.float64) - mean) / scale).astype(np.float32)
+        return scaled <= threshold
+
+    folded = (threshold * scale + mean).astype(np.float32)
+    for _ in range(64):
+        too_high = ~goes_left(folded)
+        if not too_high.any():
+            break
+        folded[too_high] = np.nextafter(folded[too_high], np.float32(-np.inf))
+    for _ in range(64):
+        candidate = np.nextafter(folded, np.float32(np.inf))
+        can_raise = goes_left(candidate)
+        if not can_raise.any():
+            break
+        folded[can_raise] = candidate[can_raise]
+    return folded
+
+
+@dataclass(frozen=True)
+class CompiledForest:
+    feature: np.ndarray  # int32, split feature per node (0 for leaves)
+    threshold: np.ndarray  # float32, split threshold in raw feature units (+inf for leaves)
+    children: np.ndarray  # int32, flattened [left, right] pairs; leaves point at themselves
+    missing_right: np.ndarray  # bool, where NaN inputs go at each split
+    value: np.ndarray  # float64, positive-class probability at each leaf
+    roots: np.ndarray  # int32, root node of each tree
+    max_depth: int
+    feature_names: tuple[str, ...]
+
+    @property
+    def n_trees(self) -> int:
+        return int(self.roots.shape[0])
+
+    @property
+    def n_nodes(self) -> int:
+        return int(self.feature.shape[0])
+
+    @classmethod
+    def from_pipeline(cls, pipeline) -> "CompiledForest":
+        preprocess = pipeline.named_steps["preprocess"]
+        forest = pipeline.named_steps["clf"]
+
+        # Map every column the forest sees back to (raw input column, mean, scale)
+        raw_index: list[int] = []
+        means: list[float] = []
+        scales: list[float] = []
+        for name, transformer, columns in preprocess.transformers_:
+            if name == "remainder":
+                continue
+            mean = getattr(transformer, "mean_", None)
+            scale = getattr(transformer, "scale_", None)
+            for pos, column in enumerate(columns):
+                raw_index.append(NUMERIC_FEATURES.index(column))
+                means.append(float(mean[pos]) if mean is not None else 0.0)
+                scales.append(float(scale[pos]) if scale is not None else 1.0)
+
+        raw_index_arr = np.asarray(raw_index, dtype=np.int32)
+        means_arr = np.asarray(means)
+        scales_arr = np.asarray(scales)
+        positive = list(forest.classes_).index(POSITIVE_LABEL)
+
+        features, thresholds, children, missing_right, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+
+            scaled_feature = np.where(is_leaf, 0, tree.feature)
+            raw_threshold = _fold_thresholds(
+                tree.threshold, means_arr[scaled_feature], scales_arr[scaled_feature]
+            )
+
+            node_ids = np.arange(n)
+            left = np.where(is_leaf, node_ids, tree.children_left) + offset
+            right = np.where(is_leaf, node_ids, tree.children_right) + offset
+
+            leaf_values = tree.value[:, 0, :]
+            totals = leaf_values.sum(axis=1)
+            totals[totals == 0] = 1.0
+
+            missing_left = getattr(tree, "missing_go_to_left", None)
+            if missing_left is None:
+                missing_left = np.ones(n, dtype=bool)
+
+            features.append(np.where(is_leaf, 0, raw_index_arr[scaled_feature]))
+            thresholds.append(np.where(is_leaf, np.inf, raw_threshold))
+            children.append(np.column_stack([left, right]).ravel())
+            missing_right.append(~np.asarray(missing_left, dtype=bool) & ~is_leaf)
+            values.append(leaf_values[:, positive] / totals)
+            roots.append(offset)
+
+            offset += n
+            max_depth = max(max_depth, int(tree.max_depth))
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float32),
+            children=np.concatenate(children).astype(np.int32),
+            missing_right=np.concatenate(missing_right),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            feature_names=tuple(NUMERIC_FEATURES),
+        )
+
+    def save(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _save_aligned_npz(path, {
+            "feature": self.feature,
+            "threshold": self.threshold,
+            "children": self.children,
+            "missing_right": self.missing_right,
+            "value": self.value,
+            "roots": self.roots,
+            "max_depth": np.asarray(self.max_depth),
+            "feature_names": np.asarray(self.feature_names),
+        })
+        return path
+
+    @classmethod
+    def load(cls, path: Path, mmap_arrays: bool = False) -> "CompiledForest":
+        """Load exported node arrays; with ``mmap_arrays`` they are read-only views of the mapped file.
+
+        Mapped arrays live in the page cache, so every process that loads the
+        same file (forked workers, or a worker reloading a version) shares one
+        physical copy instead of holding a private one.
+        """
+        arrays = _map_npz(path) if mmap_arrays else None
+        if arrays is None:
+            with np.load(path) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        return cls(
+            feature=arrays["feature"],
+            threshold=arrays["threshold"],
+            children=arrays["children"],
+            missing_right=arrays["missing_right"],
+            value=arrays["value"],
+            roots=arrays["roots"],
+            max_depth=int(arrays["max_depth"]),
+            feature_names=tuple(str(name) for name in arrays["feature_names"]),
+        )
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Walk every tree for every row at once, one depth level per iteration.
+
+        Leaves point at themselves. Once fewer than half of the (row, tree)
+        pairs still being walked moved on a level, the finished ones are
+        recorded and dropped, so each tree is walked only to the depth of the
+        leaf it reaches and the loop stops when none are left.
+        """
+        n_rows, n_features = X.shape
+        leaves = np.tile(self.roots, n_rows)
+        node = leaves
+        pending = None  # positions in leaves still being walked, once some have been dropped
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, self.n_trees)
+        flat = np.ascontiguousarray(X).ravel()
+        has_missing = bool(np.isnan(flat).any())
+
+        for _ in range(self.max_depth):
+            values = np.take(flat, row_offset + np.take(self.feature, node))
+            go_right = values > np.take(self.threshold, node)
+            if has_missing:
+                go_right = np.where(np.isnan(values), np.take(self.missing_right, node), go_right)
+            step = np.take(self.children, 2 * node + go_right)
+            moved = step != node
+            n_moved = int(np.count_nonzero(moved))
+            if 2 * n_moved < moved.size:
+                if pending is None:
+                    pending = np.arange(leaves.size)
+                leaves[pending[~moved]] = step[~moved]
+                pending, step, row_offset = pending[moved], step[moved], row_offset[moved]
+            node = step
+            if not n_moved:
+                break
+
+        if pending is None:
+            return node.reshape(n_rows, self.n_trees)
+        leaves[pending] = node
+        return leaves.reshape(n_rows, self.n_trees)
+
+    def _leaves_single(self, x: np.ndarray) -> np.ndarray:
+        """``_leaves`` for one complete row, with plain indexing and no row offsets."""
+        if np.isnan(x).any():
+            return self._leaves(x[None, :])[0]
+
+        feature, threshold, children = self.feature, self.threshold, self.children
+        leaves = self.roots.copy()
+        node = leaves
+        pending = None
+        for _ in range(self.max_depth):
+            step = children[2 * node + (x[feature[node]] > threshold[node])]
+            moved = step != node
+            n_moved = int(np.count_nonzero(moved))
+            if 2 * n_moved < moved.size:
+                if pending is None:
+                    pending = np.arange(leaves.size)
+                leaves[pending[~moved]] = step[~moved]
+                pending, step = pending[moved], step[moved]
+            node = step
+            if not n_moved:
+                break
+
+        if pending is None:
+            return node
+        leaves[pending] = node
+        return leaves
+
+    def predict_positive(self, X: np.ndarray) -> np.ndarray:
+        """Probability of the positive (high risk) class for a raw feature vector or matrix"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            return np.asarray([self.value[self._leaves_single(X)].mean()])
+        return self.value[self._leaves(X)].mean(axis=1)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities ordered as [low risk, high risk]"""
+        positive = self.predict_positive(X)
+        return np.column_stack([1.0 - positive, positive])
+
+
+def _save_aligned_npz(path: Path, arrays: dict[str, np.ndarray]) -> None:
+    """Write an uncompressed .npz (readable by ``np.load``) with every array's data 64-byte aligned.
+
+    ``np.savez`` puts each member right after its zip header, so the data
+    lands at arbitrary offsets. Memory-mapped views of it are then unaligned,
+    which makes NumPy's take/fancy indexing, the core of the tree walk, about
+    20x slower. Padding each local header's extra field moves the data onto
+    an aligned offset.
+    """
+    with path.open("wb") as f, zipfile.ZipFile(f, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, array in arrays.items():
+            buffer = io.BytesIO()
+            np.lib.format.write_array(buffer, np.asanyarray(array), allow_pickle=False)
+            info = zipfile.ZipInfo(f"{name}.npy", date_time=(1980, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_STORED
+            # 30-byte local header, file name, then the 4-byte extra-field header before the padding
+            npy_start = f.tell() + 30 + len(info.filename.encode("utf-8")) + 4
+            padding = -npy_start % ARRAY_ALIGNMENT
+            info.extra = struct.pack("<HH", PADDING_EXTRA_ID, padding) + bytes(padding)
+            # The .npy header is itself padded to a multiple of 64 bytes, so the data stays aligned
+            archive.writestr(info, buffer.getvalue())
+
+
+def _map_npz(path: Path) -> dict[str, np.ndarray] | None:
+    """Memory-map every member of an uncompressed ``np.savez`` archive; None if that is not possible.
+
+    ``np.savez`` stores each array as a plain .npy file inside the zip, so the
+    data can be viewed in place: skip the zip local header and the .npy header
+    and wrap the rest of the mapping with ``np.frombuffer``.
+    """
+    with path.open("rb") as f, zipfile.ZipFile(f) as archive:
+        members = archive.infolist()
+        if any(member.compress_type != zipfile.ZIP_STORED for member in members):
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        arrays = {}
+        for member in members:
+            f.seek(member.header_offset)
+            local_header = f.read(30)
+            name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+            f.seek(member.header_offset + 30 + name_length + extra_length)
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                return None
+
+            count = int(np.prod(shape, dtype=np.int64))
+            array = np.frombuffer(mapped, dtype=dtype, count=count, offset=f.tell())
+            if not array.flags.aligned:
+                # Archives written by np.savez are not aligned; a private copy is slower to load but fast to walk
+                array = array.copy()
+            arrays[member.filename.removesuffix(".npy")] = array.reshape(shape, order="F" if fortran_order else "C")
+        return arrays
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Check parity and latency of the compiled forest against the joblib pipeline"
+    )
+    parser.add_argument("--model-dir", type=Path, default=MODEL_DIR_DEFAULT)
+    parser.add_argument("--data-path", type=Path, default=DATA_FILE_DEFAULT)
+    parser.add_argument("--repeat", type=int, default=200, help="Single-row timing iterations")
+    parser.add_argument("--tolerance", type=float, default=1e-9, help="Max allowed probability difference")
+    return parser.parse_args()
+
+
+def _median_seconds(fn, repeat: int) -> float:
+    fn()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main() -> None:
+    import joblib
+    import pandas as pd
+
+    args = parse_args()
+    pipeline = joblib.load(args.model_dir / MODEL_FILENAME)
+    forest_path = args.model_dir / FOREST_FILENAME
+    compiled = CompiledForest.load(forest_path) if forest_path.exists() else CompiledForest.from_pipeline(pipeline)
+
+    df = pd.read_csv(args.data_path)
+    X_frame = df[NUMERIC_FEATURES]
+    X = X_frame.to_numpy(dtype=np.float32)
+
+    expected = pipeline.predict_proba(X_frame)[:, list(pipeline.classes_).index(POSITIVE_LABEL)]
+    actual = compiled.predict_positive(X)
+    max_diff = float(np.abs(expected - actual).max())
+
+    row_frame = X_frame.iloc[[0]]
+    row = X[0]
+    pipeline_latency = _median_seconds(lambda: pipeline.predict_proba(row_frame), max(args.repeat // 10, 5))
+    compiled_latency = _median_seconds(lambda: compiled.predict_proba(row), args.repeat)
+    start = time.perf_counter()
+    compiled.predict_proba(X)
+    compiled_batch = time.perf_counter() - start
+
+    report = {
+        "rows_checked": int(len(X)),
+        "max_abs_probability_diff": max_diff,
+        "parity": max_diff <= args.tolerance,
+        "trees": compiled.n_trees,
+        "nodes": compiled.n_nodes,
+        "max_depth": compiled.max_depth,
+        "pipeline_single_row_us": round(pipeline_latency * 1e6, 1),
+        "compiled_single_row_us": round(compiled_latency * 1e6, 1),
+        "compiled_all_rows_ms": round(compiled_batch * 1e3, 1),
+    }
+    print(json.dumps(report, indent=2))
+    if not report["parity"]:
+        raise SystemExit(f"Compiled forest diverges from the pipeline by {max_diff:.3g}")
+
+
+if __name__ == "__main__":
+    main()
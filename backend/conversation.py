@@ -0,0 +1,230 @@
+"""Token-budgeted conversation history for /chat.
+
+Instead of resending the entire transcript every turn, the prompt carries the
+most recent turns that fit in a token budget plus a rolling summary of
+everything older. Summaries are cached per conversation and extended
+incrementally, so each turn only summarizes the messages that have just
+fallen out of the window and prompt size stays roughly constant over a long
+session.
+
+Summaries are keyed by the client's ``conversation_id``. Without one, each
+summary is keyed by a hash of the messages it covers: a turn extends the
+summary of the longest prefix of its history that is already summarized, and
+identical histories share one. Concurrent turns that need the same summary
+build it only once: the first request marks the build in flight, and the
+others wait for it.
+
+Token counts are estimates (about four characters per token for English
+text); they are meant for budgeting, not billing.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+import hashlib
+import math
+import threading
+import time
+
+from structured_logging import get_logger
+
+CHARS_PER_TOKEN = 4
+HISTORY_TOKEN_BUDGET_DEFAULT = 2000
+MAX_CONVERSATIONS_DEFAULT = 1000
+CONVERSATION_TTL_SECONDS = 4 * 3600
+# How long a request waits for another request's summary of the same conversation
+SUMMARY_WAIT_SECONDS = 30.0
+
+logger = get_logger("conversation")
+
+RESPOND_INSTRUCTION = "Please respond to the user's latest message, taking into account the conversation history above."
+
+
+def estimate_tokens(text: str | None) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_turn(message: dict) -> str:
+    label = "User" if message.get("role") == "user" else "Assistant"
+    return f"{label}: {message.get('content', '')}\n\n"
+
+
+def _prefix_fingerprints(messages: list[dict]) -> list[str]:
+    """Hash of every prefix of ``messages``, from the empty one up to all of them"""
+    digest = hashlib.sha256()
+    fingerprints = [digest.hexdigest()]
+    for message in messages:
+        digest.update(f"{message.get('role')}\0{message.get('content', '')}\0".encode("utf-8"))
+        fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def _history_key(fingerprint: str) -> str:
+    return f"history:{fingerprint}"
+
+
+@dataclass
+class _SummaryState:
+    summary: str
+    summarized: int  # number of leading history messages folded into the summary
+    fingerprint: str  # hash of those messages, to notice an edited history
+    updated: float
+
+
+@dataclass(frozen=True)
+class ChatPrompt:
+    prompt: str
+    usage: dict
+
+
+class ConversationManager:
+    """Builds /chat prompts from a rolling window plus a cached summary of older turns.
+
+    ``summarize(previous_summary, transcript)`` must return an updated summary
+    that folds the new transcript into the previous one (which may be None).
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[str | None, str], str],
+        history_token_budget: int = HISTORY_TOKEN_BUDGET_DEFAULT,
+        max_conversations: int = MAX_CONVERSATIONS_DEFAULT,
+        ttl_seconds: float = CONVERSATION_TTL_SECONDS,
+    ):
+        self.summarize = summarize
+        self.history_token_budget = history_token_budget
+        self.max_conversations = max_conversations
+        self.ttl_seconds = ttl_seconds
+        self._summaries: OrderedDict[str, _SummaryState] = OrderedDict()
+        self._building: dict[str, threading.Event] = {}  # summary key -> set when its build ends
+        self._lock = threading.Lock()
+        self.summaries_built = 0
+        self.summary_failures = 0
+
+    def build(
+        self,
+        history: list[dict],
+        last_user_message: str,
+        system_prompt: str,
+        conversation_id: str | None = None,
+    ) -> ChatPrompt:
+        """Prompt for ``last_user_message`` given the earlier ``history`` (user/assistant turns only)"""
+        # Walk back from the newest turn until the budget is spent; everything older gets summarized
+        turns = [format_turn(message) for message in history]
+        window_start = len(turns)
+        window_tokens = 0
+        for index in range(len(turns) - 1, -1, -1):
+            cost = estimate_tokens(turns[index])
+            if window_tokens + cost > self.history_token_budget and window_start < len(turns):
+                break
+            window_tokens += cost
+            window_start = index
+
+        summary, summarized = self._summary_for(conversation_id or None, history[:window_start], turns[:window_start])
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of earlier conversation:\n{summary}\n\n")
+        if window_start < len(turns):
+            parts.append("Previous conversation:\n")
+            parts.extend(turns[window_start:])
+        if parts:
+            parts.append(f"\nUser: {last_user_message}\n\n{RESPOND_INSTRUCTION}")
+            prompt = "".join(parts)
+        else:
+            prompt = last_user_message
+
+        usage = {
+            "conversation_id": conversation_id,
+            "system_tokens": estimate_tokens(system_prompt),
+            "summary_tokens": estimate_tokens(summary),
+            "history_tokens": window_tokens,
+            "prompt_tokens": estimate_tokens(prompt),
+            "window_messages": len(turns) - window_start,
+            # A failed update leaves the previous summary, which covers fewer messages
+            "summarized_messages": summarized,
+            "dropped_messages": window_start - summarized,
+        }
+        usage["input_tokens"] = usage["system_tokens"] + usage["prompt_tokens"]
+        return ChatPrompt(prompt=prompt, usage=usage)
+
+    def _summary_for(
+        self, conversation_id: str | None, older: list[dict], older_turns: list[str]
+    ) -> tuple[str | None, int]:
+        """Summary of ``older`` and the number of its leading messages that summary covers"""
+        if not older:
+            return None, 0
+
+        prefixes = _prefix_fingerprints(older)
+        key = conversation_id if conversation_id is not None else _history_key(prefixes[-1])
+        while True:
+            now = time.time()
+            with self._lock:
+                self._evict(now)
+                cached_key, state = self._cached(conversation_id, prefixes)
+                if state is not None and state.summarized == len(older):
+                    state.updated = now
+                    self._summaries.move_to_end(cached_key)
+                    return state.summary, state.summarized
+
+                in_flight = self._building.get(key)
+                if in_flight is None:
+                    self._building[key] = threading.Event()
+                    break
+            # Another request is building this summary; its result may cover this history too
+            if not in_flight.wait(SUMMARY_WAIT_SECONDS):
+                return (state.summary, state.summarized) if state is not None else (None, 0)
+
+        previous = state.summary if state is not None else None
+        start = state.summarized if state is not None else 0
+        try:
+            summary = self.summarize(previous, "".join(older_turns[start:])).strip()
+        except Exception:
+            with self._lock:
+                self.summary_failures += 1
+            logger.exception("conversation summary failed", extra={"fields": {"conversation_id": conversation_id}})
+            return previous, start
+        else:
+            with self._lock:
+                self.summaries_built += 1
+                self._summaries[key] = _SummaryState(summary, len(older), prefixes[-1], now)
+                self._summaries.move_to_end(key)
+            return summary, len(older)
+        finally:
+            with self._lock:
+                self._building.pop(key).set()
+
+    def _cached(self, conversation_id: str | None, prefixes: list[str]) -> tuple[str | None, _SummaryState | None]:
+        """Key and state of the cached summary to extend, if any; called with the lock held"""
+        if conversation_id is not None:
+            state = self._summaries.get(conversation_id)
+            # Reuse the conversation's summary only if it still describes a prefix of this history
+            if state is None or state.summarized >= len(prefixes) or state.fingerprint != prefixes[state.summarized]:
+                return None, None
+            return conversation_id, state
+        # The longest prefix of this history that an earlier turn summarized
+        for count in range(len(prefixes) - 1, 0, -1):
+            state = self._summaries.get(_history_key(prefixes[count]))
+            if state is not None:
+                return _history_key(prefixes[count]), state
+        return None, None
+
+    def _evict(self, now: float) -> None:
+        while self._summaries:
+            oldest_id, oldest = next(iter(self._summaries.items()))
+            if now - oldest.updated <= self.ttl_seconds and len(self._summaries) < self.max_conversations:
+                break
+            del self._summaries[oldest_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "conversations": len(self._summaries),
+                "summaries_built": self.summaries_built,
+                "summary_failures": self.summary_failures,
+                "history_token_budget": self.history_token_budget,
+            }
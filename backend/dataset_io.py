@@ -0,0 +1,135 @@
+"""Column-pruned, downcast loading of training datasets.
+
+``read_columns`` reads only the requested columns from a CSV (optionally
+gzipped), Parquet or Arrow/Feather file, or from a directory of shards as
+written by ``generate_synthetic_data.py --chunk-size``. Files are read in
+record batches. Each batch is downcast to the smallest dtype that holds its
+values (int8/int16 for the generated features, float32 for real-valued
+columns) before the next one is parsed. Peak memory therefore stays close to
+the size of the final frame instead of the int64 copy of every column.
+
+Batch reading uses ``pyarrow`` when it is installed. Without it, CSV files
+fall back to chunked ``pandas.read_csv``, and Parquet and Arrow need
+``pyarrow`` anyway.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Iterator
+import json
+import sys
+
+import pandas as pd
+
+CSV_SUFFIXES = (".csv", ".csv.gz")
+PARQUET_SUFFIXES = (".parquet", ".pq")
+ARROW_SUFFIXES = (".arrow", ".feather", ".ipc")
+# Rows per batch when pandas parses the CSV itself
+CSV_CHUNK_ROWS = 1_000_000
+MANIFEST_FILENAME = "manifest.json"
+
+
+def _format(path: Path) -> str:
+    name = path.name.lower()
+    for kind, suffixes in (("csv", CSV_SUFFIXES), ("parquet", PARQUET_SUFFIXES), ("arrow", ARROW_SUFFIXES)):
+        if name.endswith(suffixes):
+            return kind
+    raise ValueError(f"Unsupported dataset file {path}; use CSV, Parquet or Arrow/Feather")
+
+
+def dataset_files(path: Path) -> list[Path]:
+    """The file itself, or a shard directory's files in manifest (else name) order"""
+    if not path.exists():
+        raise FileNotFoundError(
+            f"Dataset not found at {path}. Generate it first using generate_synthetic_data.py"
+        )
+    if path.is_file():
+        return [path]
+
+    manifest_path = path / MANIFEST_FILENAME
+    if manifest_path.exists():
+        shards = json.loads(manifest_path.read_text())["shards"]
+        files = [path / shard for shard in shards]
+    else:
+        files = sorted(child for child in path.iterdir() if child.is_file() and child.name != MANIFEST_FILENAME)
+    if not files:
+        raise FileNotFoundError(f"No dataset shards found in {path}")
+    return files
+
+
+def _columns_in(path: Path, kind: str) -> list[str]:
+    if kind == "csv":
+        return list(pd.read_csv(path, nrows=0).columns)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if kind == "parquet":
+        return pq.ParquetFile(path).schema_arrow.names
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).schema.names
+
+
+def _batches(path: Path, kind: str, columns: list[str]) -> Iterator[pd.DataFrame]:
+    if kind == "csv":
+        try:
+            from pyarrow import csv as pa_csv
+        except ImportError:
+            yield from pd.read_csv(path, usecols=columns, chunksize=CSV_CHUNK_ROWS)
+            return
+        # pyarrow's default 1 MB blocks keep each batch small; larger blocks parse little faster
+        options = pa_csv.ConvertOptions(include_columns=columns)
+        for batch in pa_csv.open_csv(path, convert_options=options):
+            yield batch.to_pandas()
+        return
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if kind == "parquet":
+        for batch in pq.ParquetFile(path).iter_batches(columns=columns):
+            yield batch.to_pandas()
+        return
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            yield reader.get_batch(index).select(columns).to_pandas()
+
+
+def downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """Smallest integer dtype for integer columns, float32 for float columns"""
+    for column in df.columns:
+        kind = df[column].dtype.kind
+        if kind in "iu":
+            df[column] = pd.to_numeric(df[column], downcast="integer")
+        elif kind == "f":
+            df[column] = pd.to_numeric(df[column], downcast="float")
+    return df
+
+
+def read_columns(path: Path, columns: list[str]) -> pd.DataFrame:
+    """``columns`` of the dataset at ``path`` (a file or a shard directory), downcast batch by batch"""
+    parts = []
+    for file in dataset_files(path):
+        kind = _format(file)
+        missing = [column for column in columns if column not in _columns_in(file, kind)]
+        if missing:
+            raise ValueError(f"{file} is missing columns {missing}")
+        parts.extend(downcast(batch) for batch in _batches(file, kind, columns))
+
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    # Batches can downcast differently; concat settles each column on the widest dtype seen
+    df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    return df[columns]
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process so far; None where the platform does not report it"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
@@ -0,0 +1,204 @@
+"""Risk curve across a learner's session day.
+
+One learner context is expanded into a grid of times of day. Time since the
+last meal and since the last void advance along the grid, the toileting
+bucket follows the bathroom log, and weather follows an optional hourly
+forecast. The whole grid is then scored in one ``predict`` call, which
+replaces a ``/predict`` round trip per time slot.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+import hashlib
+from typing import Any
+
+import numpy as np
+
+from features import (
+    ACCIDENT_TYPES,
+    NO_VOID_TYPE,
+    TOILETING_WINDOW_SECONDS,
+    VOID_TYPES,
+    assemble_features,
+    convert_time_to_numeric,
+    parse_time_string,
+    weather_type_from_condition,
+)
+from train_model import NUMERIC_FEATURES
+
+DAY_START_DEFAULT = "06:00"
+DAY_END_DEFAULT = "24:00"
+STEP_MINUTES_DEFAULT = 15
+MIN_STEP_MINUTES = 5
+
+COLUMN = {name: index for index, name in enumerate(NUMERIC_FEATURES)}
+
+
+def to_minutes(value) -> int:
+    """Minutes since midnight from 'HH:MM' or an HHMM integer (the /predict time encoding)"""
+    hhmm = convert_time_to_numeric(value)
+    if hhmm is None:
+        raise ValueError(f"Expected a time as 'HH:MM' or HHMM, got {value!r}")
+    hours, minutes = divmod(int(hhmm), 100)
+    if minutes >= 60 or not 0 <= hours * 60 + minutes <= 24 * 60:
+        raise ValueError(f"Invalid time of day {value!r}")
+    return hours * 60 + minutes
+
+
+def to_hhmm(minutes) -> int:
+    return int(minutes) // 60 * 100 + int(minutes) % 60
+
+
+def format_minutes(minutes) -> str:
+    return f"{int(minutes) // 60:02d}:{int(minutes) % 60:02d}"
+
+
+def time_grid(start=DAY_START_DEFAULT, end=DAY_END_DEFAULT, step_minutes: int = STEP_MINUTES_DEFAULT) -> np.ndarray:
+    """Minutes since midnight from ``start`` to ``end`` inclusive"""
+    step_minutes = int(step_minutes)
+    if step_minutes < MIN_STEP_MINUTES:
+        raise ValueError(f"step_minutes must be at least {MIN_STEP_MINUTES}, got {step_minutes}")
+    first, last = to_minutes(start), to_minutes(end)
+    if last < first:
+        raise ValueError(f"Day end {end!r} is before day start {start!r}")
+    return np.arange(first, last + 1, step_minutes)
+
+
+def _event_minutes(events: list[dict], now: datetime, types=None) -> np.ndarray:
+    """Sorted minutes since midnight of ``now``'s day for events with a time (optionally of given types)"""
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    minutes = []
+    for event in events:
+        if not event.get("time") or (types is not None and event.get("type") not in types):
+            continue
+        try:
+            when = parse_time_string(event["time"], now)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid event time {event['time']!r}: {e}") from e
+        minutes.append((when - day_start).total_seconds() / 60)
+    return np.sort(np.asarray(minutes, dtype=np.float64))
+
+
+def _minutes_since_latest(event_minutes: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Minutes since the latest event at or before each grid time; NaN before the first event"""
+    latest = np.searchsorted(event_minutes, grid, side="right") - 1
+    since = np.full(len(grid), np.nan)
+    seen = latest >= 0
+    since[seen] = grid[seen] - event_minutes[latest[seen]]
+    return since
+
+
+def _count_in_window(event_minutes: np.ndarray, grid: np.ndarray, window: float) -> np.ndarray:
+    """Events in [t - window, t] for each grid time t"""
+    return np.searchsorted(event_minutes, grid, side="right") - np.searchsorted(event_minutes, grid - window, side="left")
+
+
+def _advance_clock(since: np.ndarray, reported, anchor: int | None, grid: np.ndarray) -> np.ndarray:
+    """Fill slots with no logged event from a reported elapsed time, advanced from its anchor time"""
+    if reported is None or anchor is None:
+        return since
+    advanced = np.maximum(float(reported) + (grid - anchor), 0.0)
+    return np.where(np.isnan(since), advanced, since)
+
+
+def _forecast_columns(forecast: list[dict], grid: np.ndarray) -> dict[str, np.ndarray]:
+    """Temperature, humidity and weather type per grid time from the latest forecast entry at or before it"""
+    entries = []
+    for entry in forecast:
+        if not isinstance(entry, dict) or entry.get("time") is None:
+            raise ValueError("Each forecast entry needs a 'time' ('HH:MM' or HHMM)")
+        entries.append((
+            to_minutes(entry["time"]),
+            entry.get("temperature"),
+            entry.get("humidity"),
+            weather_type_from_condition(entry.get("condition")) if entry.get("condition") else None,
+        ))
+    entries.sort(key=lambda item: item[0])
+
+    starts = np.asarray([item[0] for item in entries])
+    # Slots before the first entry use the first entry
+    index = np.clip(np.searchsorted(starts, grid, side="right") - 1, 0, len(entries) - 1)
+
+    def column(position: int) -> np.ndarray:
+        return np.asarray([np.nan if item[position] is None else float(item[position]) for item in entries])[index]
+
+    return {"temperature_c": column(1), "humidity_percent": column(2), "weather_type_numeric": column(3)}
+
+
+def build_day_features(
+    data: dict,
+    grid: np.ndarray,
+    weather_values: dict,
+    forecast: list[dict] | None = None,
+    now: datetime | None = None,
+) -> np.ndarray:
+    """Raw float32 model input, one row per grid time, in NUMERIC_FEATURES order"""
+    now = now or datetime.now()
+    neutral = {
+        "time_since_last_meal_min": None,
+        "time_since_last_void_min": None,
+        "toileting_status_bucket_numeric": 0,
+        "recent_accident_flag": 0,
+    }
+    base = assemble_features(data, neutral, weather_values)
+    row = np.array([np.nan if base[name] is None else float(base[name]) for name in NUMERIC_FEATURES])
+    features = np.tile(row, (len(grid), 1))
+
+    anchor = to_minutes(data["time_numeric"]) if data.get("time_numeric") is not None else None
+
+    meals = data.get("meals") or []
+    meal_since = _minutes_since_latest(_event_minutes(meals, now), grid)
+    meal_since = _advance_clock(meal_since, data.get("time_since_last_meal_min"), anchor, grid)
+
+    # As in /predict, only "no void" visits reset the void clock
+    visits = data.get("bathroomVisits") or []
+    void_since = _minutes_since_latest(_event_minutes(visits, now, {NO_VOID_TYPE}), grid)
+    void_since = _advance_clock(void_since, data.get("time_since_last_void_min"), anchor, grid)
+
+    window = TOILETING_WINDOW_SECONDS / 60
+    accidents = _count_in_window(_event_minutes(visits, now, ACCIDENT_TYPES), grid, window)
+    voids = _count_in_window(_event_minutes(visits, now, VOID_TYPES), grid, window)
+    # 0=Normal, 2=No void in 60 min, 3=Recent accident
+    toileting = np.where(accidents > 0, 3, np.where((voids == 0) & bool(visits), 2, 0))
+
+    features[:, COLUMN["time_numeric"]] = [to_hhmm(minutes) for minutes in grid]
+    features[:, COLUMN["time_since_last_meal_min"]] = np.floor(meal_since)
+    features[:, COLUMN["time_since_last_void_min"]] = np.floor(void_since)
+    features[:, COLUMN["toileting_status_bucket_numeric"]] = toileting
+    features[:, COLUMN["recent_accident_flag"]] = toileting == 3
+
+    if forecast:
+        for name, values in _forecast_columns(forecast, grid).items():
+            # Forecast gaps fall back to the current reading or form value
+            features[:, COLUMN[name]] = np.where(np.isnan(values), features[:, COLUMN[name]], values)
+
+    return features.astype(np.float32)
+
+
+def day_curve_key(features: np.ndarray, model_version: str | None, threshold: float) -> str:
+    """Hash of exactly what gets scored, so equal grids share a cached curve"""
+    digest = hashlib.sha256()
+    digest.update(f"{model_version}|{threshold!r}|{features.shape}|".encode("utf-8"))
+    digest.update(np.ascontiguousarray(features).tobytes())
+    return digest.hexdigest()
+
+
+def peak_windows(grid: np.ndarray, high_risk: np.ndarray, threshold: float, step_minutes: int) -> list[dict[str, Any]]:
+    """Contiguous runs of grid times at or above the decision threshold, in time order"""
+    above = high_risk >= threshold
+    edges = np.diff(np.concatenate([[0], above.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    windows = []
+    for start, end in zip(starts, ends):
+        peak = start + int(np.argmax(high_risk[start:end]))
+        windows.append({
+            "start": format_minutes(grid[start]),
+            # A window covers its last slot, so it ends one step later
+            "end": format_minutes(min(grid[end - 1] + step_minutes, 24 * 60)),
+            "peak_time": format_minutes(grid[peak]),
+            "peak_high_risk": round(float(high_risk[peak]), 3),
+            "mean_high_risk": round(float(high_risk[start:end].mean()), 3),
+        })
+    return windows
@@ -0,0 +1,195 @@
+"""Threshold sweep and calibration report for a binary classifier's scores.
+
+Scores are sorted once, and cumulative sums of the labels give the confusion
+matrix at every distinct threshold. The exact macro-F1 optimum, the PR and
+ROC curves and their areas then all come from those counts in O(n log n),
+with no per-threshold pass over the validation set.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+CALIBRATION_BINS_DEFAULT = 10
+# Smallest threshold above every probability; ``score >= NEVER_POSITIVE`` is always false
+NEVER_POSITIVE = float(np.nextafter(1.0, np.inf))
+# Curves are downsampled to about this many points in the written report
+CURVE_POINTS_DEFAULT = 201
+
+
+@dataclass(frozen=True)
+class ThresholdCurve:
+    """Confusion matrix at every distinct score, for the rule ``score >= threshold``.
+
+    Index 0 is the empty rule (nothing predicted positive); the remaining
+    entries follow the distinct scores in decreasing order.
+    """
+
+    thresholds: np.ndarray
+    tp: np.ndarray
+    fp: np.ndarray
+    positives: int
+    negatives: int
+
+    @property
+    def fn(self) -> np.ndarray:
+        return self.positives - self.tp
+
+    @property
+    def tn(self) -> np.ndarray:
+        return self.negatives - self.fp
+
+    def macro_f1(self) -> np.ndarray:
+        # Classes with no true or predicted members score 0, like sklearn's zero_division default
+        positive_f1 = _safe_ratio(2 * self.tp, 2 * self.tp + self.fp + self.fn)
+        negative_f1 = _safe_ratio(2 * self.tn, 2 * self.tn + self.fn + self.fp)
+        return (positive_f1 + negative_f1) / 2
+
+    def precision(self) -> np.ndarray:
+        # Precision of the empty rule is undefined; use 1, as sklearn does for the curve's end point
+        return np.where(self.tp + self.fp > 0, _safe_ratio(self.tp, self.tp + self.fp), 1.0)
+
+    def recall(self) -> np.ndarray:
+        return _safe_ratio(self.tp, np.full_like(self.tp, self.positives))
+
+    def false_positive_rate(self) -> np.ndarray:
+        return _safe_ratio(self.fp, np.full_like(self.fp, self.negatives))
+
+
+def _safe_ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def threshold_curve(y_true, y_score) -> ThresholdCurve:
+    y_true = np.asarray(y_true).astype(bool)
+    y_score = np.asarray(y_score, dtype=np.float64)
+    if y_true.shape != y_score.shape:
+        raise ValueError(f"y_true and y_score must have the same shape, got {y_true.shape} and {y_score.shape}")
+
+    order = np.argsort(-y_score, kind="stable")
+    sorted_scores = y_score[order]
+    tp_cumulative = np.cumsum(y_true[order], dtype=np.int64)
+
+    # Last position of each run of equal scores
+    ends = np.flatnonzero(np.diff(sorted_scores)) if len(sorted_scores) else np.array([], dtype=np.int64)
+    ends = np.append(ends, len(sorted_scores) - 1) if len(sorted_scores) else ends
+
+    tp = np.concatenate([[0], tp_cumulative[ends]])
+    fp = np.concatenate([[0], ends + 1 - tp_cumulative[ends]])
+    thresholds = np.concatenate([[np.inf], sorted_scores[ends]])
+    positives = int(tp_cumulative[-1]) if len(tp_cumulative) else 0
+    return ThresholdCurve(thresholds, tp, fp, positives, len(y_true) - positives)
+
+
+def best_macro_f1_threshold(curve: ThresholdCurve) -> tuple[float, float]:
+    """Exact macro-F1 optimum as (threshold, macro F1).
+
+    Every threshold in (lower score, optimal score] gives the same
+    predictions under ``>=``. The midpoint is returned, or the next float
+    above the lower score when the two are too close for a distinct midpoint.
+    When the optimum predicts nothing, the threshold is the next float above
+    the top score, which may be just over 1.0 (``NEVER_POSITIVE``).
+    """
+    macro = curve.macro_f1()
+    best = int(np.argmax(macro))
+    if best + 1 == len(curve.thresholds):
+        # Everything predicted positive: any threshold at or below the lowest score (0 when empty)
+        upper = float(curve.thresholds[best]) if best > 0 else 0.0
+        return upper / 2, float(macro[best])
+
+    lower = float(curve.thresholds[best + 1])
+    above_lower = float(np.nextafter(lower, np.inf))
+    if best == 0:
+        # Nothing predicted positive: stay above every score
+        threshold = above_lower
+    else:
+        upper = float(curve.thresholds[best])
+        threshold = max((upper + lower) / 2, above_lower)
+    return threshold, float(macro[best])
+
+
+def _downsample(length: int, points: int) -> np.ndarray:
+    if length <= points:
+        return np.arange(length)
+    return np.unique(np.linspace(0, length - 1, points).round().astype(np.int64))
+
+
+def calibration_table(y_true, y_score, bins: int = CALIBRATION_BINS_DEFAULT) -> tuple[list[dict], float]:
+    """Reliability table over equal-width score bins and the expected calibration error"""
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_score = np.asarray(y_score, dtype=np.float64)
+    index = np.clip((y_score * bins).astype(np.int64), 0, bins - 1)
+
+    counts = np.bincount(index, minlength=bins)
+    score_sums = np.bincount(index, weights=y_score, minlength=bins)
+    label_sums = np.bincount(index, weights=y_true, minlength=bins)
+
+    table = []
+    ece = 0.0
+    for b in range(bins):
+        if counts[b] == 0:
+            continue
+        mean_score = score_sums[b] / counts[b]
+        observed = label_sums[b] / counts[b]
+        ece += counts[b] / len(y_score) * abs(mean_score - observed)
+        table.append({
+            "bin_lower": round(b / bins, 4),
+            "bin_upper": round((b + 1) / bins, 4),
+            "count": int(counts[b]),
+            "mean_predicted": round(float(mean_score), 4),
+            "observed_rate": round(float(observed), 4),
+        })
+    return table, float(ece)
+
+
+def evaluation_report(
+    y_true,
+    y_score,
+    bins: int = CALIBRATION_BINS_DEFAULT,
+    curve_points: int = CURVE_POINTS_DEFAULT,
+) -> dict:
+    """Macro-F1 optimum, PR and ROC curves with their areas, and a calibration table"""
+    curve = threshold_curve(y_true, y_score)
+    threshold, macro_f1 = best_macro_f1_threshold(curve)
+
+    precision, recall = curve.precision(), curve.recall()
+    fpr = curve.false_positive_rate()
+    average_precision = float(np.sum(np.diff(recall) * precision[1:]))
+    roc_auc = float(np.trapezoid(recall, fpr))
+
+    y_score = np.asarray(y_score, dtype=np.float64)
+    brier = float(np.mean((y_score - np.asarray(y_true, dtype=np.float64)) ** 2)) if len(y_score) else float("nan")
+    calibration, ece = calibration_table(y_true, y_score, bins)
+
+    keep = _downsample(len(curve.thresholds), curve_points)
+    # The empty rule's infinite threshold is written as null, since JSON has no infinity
+    thresholds = [None if not np.isfinite(t) else round(float(t), 6) for t in curve.thresholds[keep]]
+    return {
+        "samples": curve.positives + curve.negatives,
+        "positives": curve.positives,
+        "distinct_thresholds": len(curve.thresholds) - 1,
+        # Unrounded, so it stays strictly between the two scores it separates
+        "best_threshold": threshold,
+        "best_macro_f1": round(macro_f1, 4),
+        "roc_auc": round(roc_auc, 4),
+        "average_precision": round(average_precision, 4),
+        "brier_score": round(brier, 4),
+        "expected_calibration_error": round(ece, 4),
+        "pr_curve": {
+            "threshold": thresholds,
+            "precision": np.round(precision[keep], 4).tolist(),
+            "recall": np.round(recall[keep], 4).tolist(),
+        },
+        "roc_curve": {
+            "threshold": thresholds,
+            "fpr": np.round(fpr[keep], 4).tolist(),
+            "tpr": np.round(recall[keep], 4).tolist(),
+        },
+        "calibration": calibration,
+    }
@@ -0,0 +1,324 @@
+"""Feature derivation shared by the single and batch prediction endpoints."""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+from train_model import NUMERIC_FEATURES
+
+TRANSITION_MAP = {"none": 0, "minor": 1, "moderate": 2, "major": 3}
+SOCIAL_CONTEXT_MAP = {"alone": 0, "plus_one": 1, "small_group": 2, "large_group": 3}
+
+ACCIDENT_TYPES = frozenset({"bowel movement accident", "urine accident"})
+VOID_TYPES = frozenset({"urine", "bowel movement", "bowel movement accident", "urine accident"})
+NO_VOID_TYPE = "no void"
+TOILETING_WINDOW_SECONDS = 3600
+
+CLOUDY_CONDITIONS = frozenset({"Clouds", "Cloudy", "Fog", "Sand", "Ash", "Squall", "Smoke", "Haze", "Mist"})
+WET_CONDITIONS = frozenset({"Rain", "Drizzle", "Snow"})
+
+
+def convert_time_to_numeric(time_value):
+    """Convert time string (HH:MM) to numeric format (HHMM as integer)"""
+    if isinstance(time_value, int):
+        return time_value
+
+    if isinstance(time_value, str):
+        # Remove any colons and convert to int
+        time_str = time_value.replace(":", "")
+        return int(time_str)
+
+    return None
+
+
+def parse_time_string(time_str: str | None, now: datetime | None = None) -> datetime | None:
+    """Convert an ISO timestamp or 'HH:MM' time string to a datetime using today's date"""
+    if not time_str:
+        return None
+    try:
+        # Try ISO format first
+        return datetime.fromisoformat(time_str)
+    except ValueError:
+        # Parse 'HH:MM' format
+        hour, minute = map(int, time_str.split(':'))
+        now = now or datetime.now()
+        return now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+
+def weather_type_from_condition(weather_main: str | None) -> int:
+    if weather_main == "Clear":
+        return 0
+    if weather_main in CLOUDY_CONDITIONS:
+        return 1
+    if weather_main in WET_CONDITIONS:
+        return 2
+    return 3
+
+
+def extract_weather(weather: dict | None) -> dict[str, Any]:
+    """Pull temperature, humidity and the numeric weather type out of an OpenWeatherMap-style dict"""
+    if not weather:
+        return {"temperature": None, "humidity": None, "condition": "Unknown", "type_numeric": None}
+
+    weather_main = weather.get("weather", [{}])[0].get("main", "")
+    return {
+        "temperature": weather.get("main", {}).get("temp"),
+        "humidity": weather.get("main", {}).get("humidity"),
+        "condition": weather_main or "Unknown",
+        "type_numeric": weather_type_from_condition(weather_main),
+    }
+
+
+def derive_time_features(data: dict, now: datetime | None = None) -> dict[str, int | None]:
+    """Derive meal, void and toileting features from one learner's event log"""
+    now = now or datetime.now()
+
+    meals = data.get("meals", [])
+    time_since_last_meal_min = None
+    if meals:
+        latest_meal_time = max([parse_time_string(meal["time"], now) for meal in meals if meal.get("time")])
+        time_since_last_meal_min = int((now - latest_meal_time).total_seconds() / 60)
+
+    # Only "no void" visits reset the void clock
+    bathroom_visits = data.get("bathroomVisits", [])
+    time_since_last_void_min = None
+    no_void_visits = [visit for visit in bathroom_visits if visit.get("type") == NO_VOID_TYPE]
+    if no_void_visits:
+        latest_no_void_time = max([parse_time_string(visit["time"], now) for visit in no_void_visits if visit.get("time")])
+        time_since_last_void_min = int((now - latest_no_void_time).total_seconds() / 60)
+
+    # 0=Normal, 2=No void in 60 min, 3=Recent accident
+    toileting_status_bucket_numeric = 0
+    if bathroom_visits:
+        last_60_min_visits = [
+            visit for visit in bathroom_visits
+            if visit.get("time")
+            and (now - parse_time_string(visit["time"], now)).total_seconds() <= TOILETING_WINDOW_SECONDS
+        ]
+        if any(v.get("type") in ACCIDENT_TYPES for v in last_60_min_visits):
+            toileting_status_bucket_numeric = 3
+        elif not any(v.get("type") in VOID_TYPES for v in last_60_min_visits):
+            toileting_status_bucket_numeric = 2
+
+    return {
+        "time_since_last_meal_min": time_since_last_meal_min,
+        "time_since_last_void_min": time_since_last_void_min,
+        "toileting_status_bucket_numeric": toileting_status_bucket_numeric,
+        "recent_accident_flag": 1 if toileting_status_bucket_numeric == 3 else 0,
+    }
+
+
+def assemble_features(data: dict, derived: dict, weather_values: dict) -> dict[str, Any]:
+    """Combine request fields, derived time features and weather into one model input row"""
+    # Use weather data if available, otherwise fall back to form data
+    temperature = weather_values["temperature"]
+    humidity = weather_values["humidity"]
+    weather_type = weather_values["type_numeric"]
+
+    return {
+        "sleep_quality_numeric": data.get("sleep_quality_numeric"),
+        "time_numeric": convert_time_to_numeric(data.get("time_numeric")),
+        "weekday_numeric": data.get("weekday_numeric"),
+        "temperature_c": temperature if temperature is not None else data.get("temperature_c"),
+        "humidity_percent": humidity if humidity is not None else data.get("humidity_percent"),
+        "weather_type_numeric": weather_type if weather_type is not None else data.get("weather_type_numeric"),
+        "time_since_last_meal_min": derived["time_since_last_meal_min"] or data.get("time_since_last_meal_min"),
+        "time_since_last_void_min": derived["time_since_last_void_min"] or data.get("time_since_last_void_min"),
+        "recent_accident_flag": derived["recent_accident_flag"],
+        "toileting_status_bucket_numeric": derived["toileting_status_bucket_numeric"],
+        "transition_type_numeric": TRANSITION_MAP.get(data.get("transitionType"), 0),
+        "social_context_numeric": SOCIAL_CONTEXT_MAP.get(data.get("socialInteractionContext"), 0),
+    }
+
+
+def calculated_values(derived: dict, row: dict) -> dict[str, Any]:
+    """The subset of derived values echoed back to the frontend"""
+    return {
+        "time_since_last_meal_min": derived["time_since_last_meal_min"],
+        "time_since_last_void_min": derived["time_since_last_void_min"],
+        "toileting_status_bucket_numeric": derived["toileting_status_bucket_numeric"],
+        "transition_type_numeric": row["transition_type_numeric"],
+        "social_context_numeric": row["social_context_numeric"],
+    }
+
+
+def feature_values(row: dict) -> list[float]:
+    """A row's model inputs as floats in NUMERIC_FEATURES order, missing values as NaN"""
+    values = []
+    for column in NUMERIC_FEATURES:
+        value = row[column]
+        try:
+            values.append(np.nan if value is None else float(value))
+        except (TypeError, ValueError):
+            raise ValueError(f"{column} must be a number, got {value!r}") from None
+    return values
+
+
+def _flatten_events(payloads: list[dict], key: str) -> tuple[np.ndarray, list[str | None], list[Any]]:
+    rows: list[int] = []
+    times: list[str | None] = []
+    types: list[Any] = []
+    for idx, data in enumerate(payloads):
+        for event in data.get(key) or []:
+            rows.append(idx)
+            times.append(event.get("time"))
+            types.append(event.get("type"))
+    return np.asarray(rows, dtype=np.intp), times, types
+
+
+def _elapsed_seconds(
+    times: list[str | None],
+    rows: np.ndarray,
+    now: datetime,
+    parsed: dict[str, float],
+    errors: dict[int, str],
+) -> np.ndarray:
+    """Seconds elapsed since each event; NaN where the event has no time.
+
+    Each distinct time string is parsed once for the whole batch, which is what
+    keeps a roster of learners sharing "12:00" lunch entries cheap.
+    """
+    elapsed = np.full(len(times), np.nan)
+    for pos, time_str in enumerate(times):
+        if not time_str:
+            continue
+        seconds = parsed.get(time_str)
+        if seconds is None:
+            try:
+                seconds = (now - parse_time_string(time_str, now)).total_seconds()
+            except (TypeError, ValueError) as e:
+                errors.setdefault(int(rows[pos]), f"Invalid event time {time_str!r}: {e}")
+                continue
+            parsed[time_str] = seconds
+        elapsed[pos] = seconds
+    return elapsed
+
+
+def _min_elapsed_by_row(n_rows: int, rows: np.ndarray, elapsed: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Smallest elapsed time (i.e. the latest event) per row, NaN where a row has none"""
+    out = np.full(n_rows, np.inf)
+    selected = mask & ~np.isnan(elapsed)
+    np.minimum.at(out, rows[selected], elapsed[selected])
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def _minutes_or_none(seconds: float) -> int | None:
+    if np.isnan(seconds):
+        return None
+    return int(seconds / 60)
+
+
+def build_feature_frame(
+    payloads: Iterable[Any],
+    weather: dict | None = None,
+    now: datetime | None = None,
+    weather_values: dict | None = None,
+    derived: dict[int, dict] | None = None,
+    errors: dict[int, str] | None = None,
+) -> tuple[pd.DataFrame, list[int], list[dict], dict[int, str]]:
+    """Derive model features for many learners in one pass.
+
+    ``weather_values`` (already decoded by ``extract_weather``) takes
+    precedence over the raw ``weather`` dict. ``derived`` maps row indexes to
+    time features computed elsewhere (e.g. from the learner event store);
+    those rows' own event logs are ignored. ``errors`` marks rows that have
+    already failed.
+
+    Returns the feature matrix for the rows that could be built, their indexes
+    into ``payloads``, the matching calculated values and a mapping of failed
+    row index to error message. Each row is converted to floats as it is
+    assembled, so a non-numeric field fails only its own row.
+    """
+    now = now or datetime.now()
+    payloads = list(payloads)
+    n_rows = len(payloads)
+    derived = derived or {}
+    errors = dict(errors or {})
+
+    normalized: list[dict] = []
+    for idx, data in enumerate(payloads):
+        if not isinstance(data, dict):
+            errors[idx] = "Learner payload must be a JSON object"
+            data = {}
+        normalized.append(data)
+
+    # Rows with precomputed time features (or already failed) skip the event scan
+    events_from = [
+        {} if idx in derived or idx in errors else data for idx, data in enumerate(normalized)
+    ]
+
+    parsed: dict[str, float] = {}
+
+    meal_rows, meal_times, _ = _flatten_events(events_from, "meals")
+    meal_elapsed = _elapsed_seconds(meal_times, meal_rows, now, parsed, errors)
+    meal_counts = np.bincount(meal_rows, minlength=n_rows)
+    last_meal = _min_elapsed_by_row(n_rows, meal_rows, meal_elapsed, np.ones(len(meal_rows), dtype=bool))
+
+    visit_rows, visit_times, visit_types = _flatten_events(events_from, "bathroomVisits")
+    visit_elapsed = _elapsed_seconds(visit_times, visit_rows, now, parsed, errors)
+    visit_types = np.asarray(visit_types, dtype=object)
+    visit_counts = np.bincount(visit_rows, minlength=n_rows)
+
+    is_no_void = visit_types == NO_VOID_TYPE
+    no_void_counts = np.bincount(visit_rows[is_no_void], minlength=n_rows)
+    last_no_void = _min_elapsed_by_row(n_rows, visit_rows, visit_elapsed, is_no_void)
+
+    in_window = np.zeros(len(visit_rows), dtype=bool)
+    np.less_equal(visit_elapsed, TOILETING_WINDOW_SECONDS, out=in_window, where=~np.isnan(visit_elapsed))
+    is_accident = np.isin(visit_types, list(ACCIDENT_TYPES))
+    is_void = np.isin(visit_types, list(VOID_TYPES))
+    recent_accidents = np.bincount(visit_rows[in_window & is_accident], minlength=n_rows)
+    recent_voids = np.bincount(visit_rows[in_window & is_void], minlength=n_rows)
+
+    toileting_bucket = np.where(
+        visit_counts == 0,
+        0,
+        np.where(recent_accidents > 0, 3, np.where(recent_voids == 0, 2, 0)),
+    )
+
+    if weather_values is None:
+        weather_values = extract_weather(weather)
+
+    feature_rows: list[list[float]] = []
+    row_indexes: list[int] = []
+    calculated: list[dict] = []
+    for idx, data in enumerate(normalized):
+        if idx in errors:
+            continue
+        if idx in derived:
+            row_derived = derived[idx]
+        else:
+            # Mirror the single-request path, which fails when events are present but none carry a time
+            if meal_counts[idx] and np.isnan(last_meal[idx]):
+                errors[idx] = "Meals were provided but none include a time"
+                continue
+            if no_void_counts[idx] and np.isnan(last_no_void[idx]):
+                errors[idx] = "'no void' visits were provided but none include a time"
+                continue
+
+            bucket = int(toileting_bucket[idx])
+            row_derived = {
+                "time_since_last_meal_min": _minutes_or_none(last_meal[idx]),
+                "time_since_last_void_min": _minutes_or_none(last_no_void[idx]),
+                "toileting_status_bucket_numeric": bucket,
+                "recent_accident_flag": 1 if bucket == 3 else 0,
+            }
+        try:
+            row = assemble_features(data, row_derived, weather_values)
+            values = feature_values(row)
+        except (TypeError, ValueError) as e:
+            errors[idx] = str(e)
+            continue
+
+        feature_rows.append(values)
+        row_indexes.append(idx)
+        calculated.append(calculated_values(row_derived, row))
+
+    matrix = np.array(feature_rows, dtype=np.float64).reshape(-1, len(NUMERIC_FEATURES))
+    features = pd.DataFrame(matrix, columns=NUMERIC_FEATURES)
+    return features, row_indexes, calculated, errors
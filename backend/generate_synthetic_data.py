@@ -2,9 +2,13 @@ from __future__ import annotations
 
 """Utility for generating ABA-informed synthetic data for ABA Forecast."""
 
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
 from pathlib import Path
 import argparse
+import json
+import os
+import time
 from typing import Iterable
 
 import numpy as np
@@ -94,11 +98,123 @@ VARIABILITY_MAP = {
 }
 
 
+WEATHER_TYPE_PROBS = np.array([0.4, 0.3, 0.2, 0.1])
+TEMP_LOW = np.array([WEATHER_PROFILES[code]["temp"][0] for code in range(4)])
+TEMP_HIGH = np.array([WEATHER_PROFILES[code]["temp"][1] for code in range(4)])
+HUMIDITY_LOW = np.array([WEATHER_PROFILES[code]["humidity"][0] for code in range(4)])
+HUMIDITY_HIGH = np.array([WEATHER_PROFILES[code]["humidity"][1] for code in range(4)])
+
+SLEEP_RISK = np.array([0.38, 0.22, 0.12])
+WEATHER_RISK = np.array([0.0, 0.02, 0.05, 0.1])
+BEHAVIOUR_LEVEL_CUTS = np.array([0.35, 0.55, 0.75])
+TOPOGRAPHY_TABLE = np.array([TOPOGRAPHY_BY_FUNCTION[code] for code in range(4)], dtype=object)
+
+COLUMNS = [field.name for field in fields(BehaviorSample)]
+
+
 def generate_samples(
+    num_samples: int,
+    seed: int | np.random.SeedSequence | None = None,
+    variability: str = "baseline",
+) -> pd.DataFrame:
+    """Draw ``num_samples`` rows column by column, one RNG call per column.
+
+    Same distributions and risk model as the per-row ``_generate_samples_scalar``,
+    but the random streams are consumed in a different order, so a given seed
+    produces different rows than the scalar generator did.
+    """
+    rng = np.random.default_rng(seed)
+    spread = VARIABILITY_MAP.get(variability, VARIABILITY_MAP["baseline"])
+    n = num_samples
+
+    sleep_quality_numeric = rng.choice([0, 1, 2], size=n, p=[0.2, 0.45, 0.35])
+    time_numeric = rng.integers(360, 1440, size=n)  # focus on awake hours
+    weekday_numeric = rng.choice([0, 1, 2, 3, 4, 5, 6], size=n, p=[0.17, 0.17, 0.17, 0.16, 0.16, 0.09, 0.08])
+
+    weather_type_numeric = rng.choice(4, size=n, p=WEATHER_TYPE_PROBS)
+    temperature_c = rng.integers(TEMP_LOW[weather_type_numeric], TEMP_HIGH[weather_type_numeric] + 1)
+    humidity_percent = rng.integers(HUMIDITY_LOW[weather_type_numeric], HUMIDITY_HIGH[weather_type_numeric] + 1)
+
+    time_since_last_meal_min = np.clip(rng.normal(loc=150, scale=65 * spread, size=n), 15, 360).astype(np.int64)
+    time_since_last_void_min = np.clip(rng.normal(loc=80, scale=40 * spread, size=n), 10, 210).astype(np.int64)
+
+    # Long void gaps raise the accident chance to 45%, on top of the 8% base rate
+    accident_draws = rng.random((2, n))
+    recent_accident_flag = (
+        ((time_since_last_void_min > 120) & (accident_draws[0] < 0.45)) | (accident_draws[1] < 0.08)
+    ).astype(np.int64)
+
+    toileting_status_bucket_numeric = np.clip(rng.normal(loc=1.2, scale=0.9 * spread, size=n), 0, 3).astype(np.int64)
+    transition_type_numeric = rng.choice(TRANSITION_CHOICES, size=n, p=TRANSITION_PROBS)
+    social_context_numeric = rng.choice(SOCIAL_CONTEXT_CHOICES, size=n, p=SOCIAL_CONTEXT_PROBS)
+    antecedent_category_numeric = rng.choice(ANTECEDENT_CHOICES, size=n, p=ANTECEDENT_PROBS)
+    function_inferred_numeric = rng.choice(FUNCTION_CHOICES, size=n, p=FUNCTION_PROBS)
+
+    # Risk modelling inspired by ABA heuristics
+    risk = 0.1 + SLEEP_RISK[sleep_quality_numeric]
+    risk += np.minimum(time_since_last_meal_min / 280, 1.0) * 0.16
+    risk += np.minimum(time_since_last_void_min / 180, 1.0) * 0.14
+    risk += recent_accident_flag * 0.28
+    risk += toileting_status_bucket_numeric * 0.06
+    risk += transition_type_numeric * 0.07
+    risk += social_context_numeric * 0.045
+    risk += antecedent_category_numeric * 0.06
+    risk += function_inferred_numeric * 0.06
+    risk += np.maximum(0.0, (temperature_c - 24) / 10) * 0.08
+    risk += np.maximum(0.0, (humidity_percent - 65) / 30) * 0.07
+    risk += WEATHER_RISK[weather_type_numeric]
+    risk += np.where(weekday_numeric >= 5, 0.04, 0.02)  # weekend staffing/novelty
+    risk += np.select(
+        [(time_numeric >= 720) & (time_numeric <= 1020), time_numeric >= 1080, time_numeric <= 540],
+        [0.05, 0.07, 0.03],
+        default=0.0,
+    )
+    risk = np.clip(risk + rng.normal(loc=0.0, scale=0.05, size=n), 0.0, 1.0)
+
+    behaviour_level = np.digitize(risk, BEHAVIOUR_LEVEL_CUTS).astype(np.int64)
+
+    escalation_probability = risk * 0.85
+    escalation_probability += recent_accident_flag * 0.12
+    escalation_probability += np.where(transition_type_numeric == 3, 0.1, 0.0)
+    escalation_probability += np.where(behaviour_level >= 3, 0.08, 0.0)
+    escalation_probability = np.clip(escalation_probability, 0.0, 1.0)
+    escalation_label = (rng.random(n) < escalation_probability).astype(np.int64)
+
+    behaviour_level = np.where((escalation_label == 1) & (behaviour_level < 2), 2, behaviour_level)
+
+    topography_pick = rng.integers(0, TOPOGRAPHY_TABLE.shape[1], size=n)
+    behaviour_topography = np.where(
+        escalation_label == 1, TOPOGRAPHY_TABLE[function_inferred_numeric, topography_pick], ""
+    )
+
+    columns = {
+        "sleep_quality_numeric": sleep_quality_numeric,
+        "time_numeric": time_numeric,
+        "weekday_numeric": weekday_numeric,
+        "temperature_c": temperature_c,
+        "humidity_percent": humidity_percent,
+        "weather_type_numeric": weather_type_numeric,
+        "time_since_last_meal_min": time_since_last_meal_min,
+        "time_since_last_void_min": time_since_last_void_min,
+        "recent_accident_flag": recent_accident_flag,
+        "toileting_status_bucket_numeric": toileting_status_bucket_numeric,
+        "transition_type_numeric": transition_type_numeric,
+        "social_context_numeric": social_context_numeric,
+        "antecedent_category_numeric": antecedent_category_numeric,
+        "function_inferred_numeric": function_inferred_numeric,
+        "behaviour_level": behaviour_level,
+        "escalation_label": escalation_label,
+        "behaviour_topography": behaviour_topography,
+    }
+    return pd.DataFrame({name: columns[name] for name in COLUMNS})
+
+
+def _generate_samples_scalar(
     num_samples: int,
     seed: int | None = None,
     variability: str = "baseline",
 ) -> list[BehaviorSample]:
+    """Original one-row-at-a-time generator, kept as the reference for --benchmark"""
     rng = np.random.default_rng(seed)
     samples: list[BehaviorSample] = []
     spread = VARIABILITY_MAP.get(variability, VARIABILITY_MAP["baseline"])
@@ -206,8 +322,22 @@ def generate_samples(
     return samples
 
 
-def samples_to_frame(samples: Iterable[BehaviorSample]) -> pd.DataFrame:
-    return pd.DataFrame([sample.__dict__ for sample in samples])
+def samples_to_frame(samples: Iterable[BehaviorSample] | pd.DataFrame) -> pd.DataFrame:
+    if isinstance(samples, pd.DataFrame):
+        return samples
+    return pd.DataFrame([sample.__dict__ for sample in samples], columns=COLUMNS)
+
+
+SHARD_DIRNAME = "synthetic_behavior_data"
+SHARD_FORMATS = ("parquet", "csv.gz")
+
+
+def default_shard_format() -> str:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "csv.gz"
+    return "parquet"
 
 
 def save_dataset(df: pd.DataFrame, output_dir: Path) -> Path:
@@ -217,12 +347,149 @@ def save_dataset(df: pd.DataFrame, output_dir: Path) -> Path:
     return path
 
 
-def summarize_dataset(df: pd.DataFrame) -> dict[str, float]:
+def partial_summary(df: pd.DataFrame) -> dict[str, float]:
+    """Additive statistics for one chunk; combine chunks with ``combine_summaries``"""
+    sleep = df["sleep_quality_numeric"].to_numpy(dtype=np.float64)
     return {
         "samples": int(len(df)),
-        "accident_rate": round(float(df["recent_accident_flag"].mean()), 3),
-        "sleep_quality_mean": round(float(df["sleep_quality_numeric"].mean()), 3),
-        "sleep_quality_std": round(float(df["sleep_quality_numeric"].std()), 3),
+        "accident_sum": float(df["recent_accident_flag"].sum()),
+        "sleep_sum": float(sleep.sum()),
+        "sleep_sq_sum": float(np.dot(sleep, sleep)),
+    }
+
+
+def combine_summaries(partials: Iterable[dict[str, float]]) -> dict[str, float]:
+    samples = accident_sum = sleep_sum = sleep_sq_sum = 0.0
+    for partial in partials:
+        samples += partial["samples"]
+        accident_sum += partial["accident_sum"]
+        sleep_sum += partial["sleep_sum"]
+        sleep_sq_sum += partial["sleep_sq_sum"]
+
+    mean = sleep_sum / samples if samples else float("nan")
+    # Sample standard deviation (ddof=1), matching pandas
+    variance = (sleep_sq_sum - samples * mean * mean) / (samples - 1) if samples > 1 else float("nan")
+    return {
+        "samples": int(samples),
+        "accident_rate": round(accident_sum / samples, 3) if samples else float("nan"),
+        "sleep_quality_mean": round(mean, 3),
+        "sleep_quality_std": round(float(np.sqrt(max(variance, 0.0))), 3),
+    }
+
+
+def summarize_dataset(df: pd.DataFrame) -> dict[str, float]:
+    return combine_summaries([partial_summary(df)])
+
+
+def _write_shard(
+    index: int,
+    num_samples: int,
+    seed: np.random.SeedSequence,
+    variability: str,
+    shard_dir: Path,
+    shard_format: str,
+) -> dict[str, float]:
+    df = generate_samples(num_samples, seed=seed, variability=variability)
+    path = shard_dir / f"part-{index:05d}.{shard_format}"
+    if shard_format == "parquet":
+        df.to_parquet(path, index=False, compression="zstd")
+    else:
+        df.to_csv(path, index=False, compression="gzip")
+    return partial_summary(df)
+
+
+def generate_shards(
+    num_samples: int,
+    chunk_size: int,
+    output_dir: Path,
+    seed: int | None = None,
+    variability: str = "baseline",
+    workers: int | None = None,
+    shard_format: str | None = None,
+) -> tuple[Path, dict]:
+    """Generate ``num_samples`` rows as independent chunks in a process pool, one shard file per chunk.
+
+    Chunk ``i`` always draws from the ``i``-th child of ``SeedSequence(seed)``,
+    so the shards are identical whatever the worker count. Workers write their
+    own shards and send back only summary statistics, and at most two chunks
+    per worker are in flight, so memory stays flat as the dataset grows.
+    Returns the shard directory and its manifest, which is also written to
+    ``manifest.json`` there.
+    """
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+    shard_format = shard_format or default_shard_format()
+    if shard_format not in SHARD_FORMATS:
+        raise ValueError(f"shard_format must be one of {SHARD_FORMATS}, got {shard_format}")
+    workers = workers or os.cpu_count() or 1
+
+    shard_dir = output_dir / SHARD_DIRNAME
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    for stale in shard_dir.glob("part-*"):
+        stale.unlink()
+
+    sizes = [min(chunk_size, num_samples - start) for start in range(0, num_samples, chunk_size)]
+    child_seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    start = time.perf_counter()
+    partials: list[dict] = [None] * len(sizes)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for index, (size, child_seed) in enumerate(zip(sizes, child_seeds)):
+            if len(pending) >= 2 * workers:
+                oldest = next(iter(pending))
+                partials[oldest] = pending.pop(oldest).result()
+            pending[index] = executor.submit(
+                _write_shard, index, size, child_seed, variability, shard_dir, shard_format
+            )
+        for index, future in pending.items():
+            partials[index] = future.result()
+    elapsed = time.perf_counter() - start
+
+    manifest = {
+        "samples": num_samples,
+        "seed": seed,
+        "variability": variability,
+        "chunk_size": chunk_size,
+        "format": shard_format,
+        "shards": [f"part-{index:05d}.{shard_format}" for index in range(len(sizes))],
+        "workers": workers,
+        "seconds": round(elapsed, 2),
+        "summary": combine_summaries(partials),
+    }
+    (shard_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    return shard_dir, manifest
+
+
+def benchmark(num_samples: int, seed: int | None, variability: str, reference_samples: int) -> dict:
+    """Time the vectorized generator against the scalar reference and compare their column means"""
+    start = time.perf_counter()
+    df = generate_samples(num_samples, seed=seed, variability=variability)
+    vectorized_seconds = time.perf_counter() - start
+
+    reference_samples = min(reference_samples, num_samples)
+    start = time.perf_counter()
+    reference = samples_to_frame(_generate_samples_scalar(reference_samples, seed=seed, variability=variability))
+    scalar_seconds = time.perf_counter() - start
+
+    numeric = [column for column in COLUMNS if column != "behaviour_topography"]
+    # Mean differences in units of the reference standard deviation
+    drift = {
+        column: round(abs(float(df[column].mean() - reference[column].mean())) / (float(reference[column].std()) or 1.0), 4)
+        for column in numeric
+    }
+    vectorized_rate = num_samples / vectorized_seconds
+    scalar_rate = reference_samples / scalar_seconds
+    return {
+        "vectorized_samples": num_samples,
+        "vectorized_seconds": round(vectorized_seconds, 3),
+        "vectorized_rows_per_second": round(vectorized_rate),
+        "scalar_samples": reference_samples,
+        "scalar_seconds": round(scalar_seconds, 3),
+        "scalar_rows_per_second": round(scalar_rate),
+        "speedup": round(vectorized_rate / scalar_rate, 1),
+        "max_mean_drift_std": max(drift.values()),
+        "mean_drift_std": drift,
     }
 
 
@@ -242,16 +509,68 @@ def parse_args() -> argparse.Namespace:
         default=Path("backend") / "data",
         help="Directory where the dataset will be stored",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Generate in chunks of this many rows and write one compressed shard per chunk",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes generating chunks in parallel (default: all cores)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=SHARD_FORMATS,
+        default=None,
+        help="Shard file format (default: parquet when pyarrow is installed, else csv.gz)",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Compare speed and column means with the scalar reference generator instead of writing data",
+    )
+    parser.add_argument(
+        "--reference-samples",
+        type=int,
+        default=20000,
+        help="Rows drawn from the slow scalar generator when benchmarking",
+    )
+    args = parser.parse_args()
+    if args.chunk_size is None and not args.benchmark and (args.workers is not None or args.format is not None):
+        parser.error("--workers and --format only apply to sharded output; add --chunk-size")
+    return args
 
 
 def main() -> None:
     args = parse_args()
-    samples = generate_samples(args.samples, seed=args.seed, variability=args.variability)
-    df = samples_to_frame(samples)
-    csv_path = save_dataset(df, args.output_dir)
-    summary = summarize_dataset(df)
-    print(f"Generated {len(df)} synthetic samples -> {csv_path}")
+    if args.benchmark:
+        report = benchmark(args.samples, args.seed, args.variability, args.reference_samples)
+        print(json.dumps(report, indent=2))
+        return
+
+    if args.chunk_size:
+        shard_dir, manifest = generate_shards(
+            args.samples,
+            args.chunk_size,
+            args.output_dir,
+            seed=args.seed,
+            variability=args.variability,
+            workers=args.workers,
+            shard_format=args.format,
+        )
+        summary = manifest["summary"]
+        print(
+            f"Generated {manifest['samples']} synthetic samples in {len(manifest['shards'])} "
+            f"{manifest['format']} shards -> {shard_dir} ({manifest['seconds']}s, {manifest['workers']} workers)"
+        )
+    else:
+        df = generate_samples(args.samples, seed=args.seed, variability=args.variability)
+        csv_path = save_dataset(df, args.output_dir)
+        summary = summarize_dataset(df)
+        print(f"Generated {len(df)} synthetic samples -> {csv_path}")
     print(
         "Dataset summary: "
         f"samples={summary['samples']}, accident_rate={summary['accident_rate']*100:.1f}%, "
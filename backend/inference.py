@@ -0,0 +1,156 @@
+"""Threshold-aware inference wrapper around the trained behavior predictor."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+import json
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from compiled_forest import CompiledForest
+from evaluation import NEVER_POSITIVE
+from structured_logging import get_logger
+from train_model import FOREST_FILENAME, METRICS_FILENAME, MODEL_FILENAME, NUMERIC_FEATURES
+
+DEFAULT_DECISION_THRESHOLD = 0.5
+POSITIVE_LABEL = 1
+# Above this many rows sklearn's per-tree Cython loop beats the level-by-level NumPy walk
+COMPILED_MAX_ROWS = 128
+PARITY_PROBE_ROWS = 32
+PARITY_TOLERANCE = 1e-9
+
+logger = get_logger("inference")
+
+
+@dataclass(frozen=True)
+class PredictionBatch:
+    labels: np.ndarray
+    probabilities: np.ndarray  # columns are [low risk, high risk]
+    threshold: float
+
+    @property
+    def high_risk(self) -> np.ndarray:
+        return self.probabilities[:, 1]
+
+    @property
+    def confidence(self) -> np.ndarray:
+        """Probability assigned to the label that was actually returned"""
+        return np.where(self.labels == POSITIVE_LABEL, self.probabilities[:, 1], self.probabilities[:, 0])
+
+
+def feature_matrix(rows: list[dict]) -> np.ndarray:
+    """Raw float32 model input in NUMERIC_FEATURES order; missing values become NaN"""
+    return np.array([[row[column] for column in NUMERIC_FEATURES] for row in rows], dtype=np.float32)
+
+
+def validate_threshold(value) -> float:
+    threshold = float(value)
+    # NEVER_POSITIVE is a tuned threshold too: training stores it when predicting nothing scores best
+    if not 0.0 <= threshold <= NEVER_POSITIVE:
+        raise ValueError(f"decision_threshold must be between 0 and 1, got {value}")
+    return threshold
+
+
+class BehaviorPredictor:
+    """Scores features with a single predict_proba call and labels them with the tuned threshold."""
+
+    def __init__(
+        self,
+        pipeline,
+        metrics: dict | None = None,
+        model_path: Path | None = None,
+        compiled: CompiledForest | None = None,
+        version: str | None = None,
+    ):
+        self.pipeline = pipeline
+        self.metrics = metrics or {}
+        self.model_path = model_path
+        self.compiled = compiled
+        self.version = version
+        self.decision_threshold = validate_threshold(
+            self.metrics.get("decision_threshold", DEFAULT_DECISION_THRESHOLD)
+        )
+
+        classes = list(pipeline.classes_)
+        if POSITIVE_LABEL not in classes or len(classes) != 2:
+            raise ValueError(f"Expected a binary classifier with label {POSITIVE_LABEL}, got classes {classes}")
+        self._positive_index = classes.index(POSITIVE_LABEL)
+
+    @classmethod
+    def load(cls, model_dir: Path, version: str | None = None) -> "BehaviorPredictor":
+        model_path = model_dir / MODEL_FILENAME
+        metrics_path = model_dir / METRICS_FILENAME
+
+        pipeline = joblib.load(model_path)
+        metrics = {}
+        if metrics_path.exists():
+            with metrics_path.open("r", encoding="utf-8") as f:
+                metrics = json.load(f)
+        else:
+            logger.warning(f"{metrics_path} not found, using decision threshold {DEFAULT_DECISION_THRESHOLD}")
+
+        compiled = load_compiled_forest(pipeline, model_dir / FOREST_FILENAME)
+        return cls(pipeline, metrics, model_path, compiled, version=version)
+
+    def predict_proba(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """Class probabilities ordered as [low risk, high risk]"""
+        if self.compiled is not None and len(features) <= COMPILED_MAX_ROWS:
+            if isinstance(features, pd.DataFrame):
+                features = features[NUMERIC_FEATURES].to_numpy(dtype=np.float32, na_value=np.nan)
+            return self.compiled.predict_proba(features)
+
+        if not isinstance(features, pd.DataFrame):
+            features = pd.DataFrame(features, columns=NUMERIC_FEATURES)
+        proba = self.pipeline.predict_proba(features)
+        if self._positive_index == 0:
+            proba = proba[:, ::-1]
+        return proba
+
+    def warm_up(self) -> None:
+        """Score one row and one large batch so both the compiled and sklearn paths are hot before serving"""
+        rows = np.zeros((COMPILED_MAX_ROWS + 1, len(NUMERIC_FEATURES)), dtype=np.float32)
+        self.predict(rows[:1])
+        self.predict(rows)
+
+    def predict(self, features: pd.DataFrame | np.ndarray, threshold: float | None = None) -> PredictionBatch:
+        threshold = self.decision_threshold if threshold is None else validate_threshold(threshold)
+        probabilities = self.predict_proba(features)
+        labels = (probabilities[:, 1] >= threshold).astype(int)
+        return PredictionBatch(labels=labels, probabilities=probabilities, threshold=threshold)
+
+
+def load_compiled_forest(pipeline, path: Path) -> CompiledForest | None:
+    """Load the exported node arrays, recompiling if they do not match the pipeline."""
+    compiled = CompiledForest.load(path, mmap_arrays=True) if path.exists() else None
+    if compiled is None or not _matches_pipeline(compiled, pipeline):
+        if compiled is not None:
+            logger.warning(f"{path} does not match the loaded pipeline, recompiling")
+        try:
+            compiled = CompiledForest.from_pipeline(pipeline)
+        except Exception as e:
+            logger.warning(f"Could not compile forest, falling back to the sklearn pipeline: {e}")
+            return None
+        if not _matches_pipeline(compiled, pipeline):
+            logger.warning("Compiled forest failed its parity probe, falling back to the sklearn pipeline")
+            return None
+    return compiled
+
+
+def _matches_pipeline(compiled: CompiledForest, pipeline) -> bool:
+    """Score a few probe rows both ways; doubles as a warm-up for the pipeline."""
+    if compiled.n_trees != len(pipeline.named_steps["clf"].estimators_):
+        return False
+
+    rng = np.random.default_rng(0)
+    scaler = pipeline.named_steps["preprocess"].transformers_[0][1]
+    center = scaler.mean_ if getattr(scaler, "mean_", None) is not None else np.zeros(len(NUMERIC_FEATURES))
+    spread = scaler.scale_ if getattr(scaler, "scale_", None) is not None else np.ones(len(NUMERIC_FEATURES))
+    probe = np.round(center + rng.standard_normal((PARITY_PROBE_ROWS, len(NUMERIC_FEATURES))) * spread)
+
+    expected = pipeline.predict_proba(pd.DataFrame(probe, columns=NUMERIC_FEATURES))
+    positive = list(pipeline.classes_).index(POSITIVE_LABEL)
+    actual = compiled.predict_positive(probe.astype(np.float32))
+    return bool(np.abs(expected[:, positive] - actual).max() <= PARITY_TOLERANCE)
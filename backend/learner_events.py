@@ -0,0 +1,251 @@
+"""Per-learner store of logged meals and bathroom visits.
+
+Clients append events as they happen instead of resending the whole day's
+log with every /predict call. Each time string is parsed once, at ingest.
+The learner's events are kept in time order, alongside the aggregates
+/predict needs:
+
+- the latest meal and the latest "no void" visit;
+- the void and accident visits still inside the rolling toileting window.
+
+The window queues only ever drop from the front, so deriving a learner's
+features costs O(1) amortized, however long their log is. Events older than
+the retention period are evicted, and a learner with no events left is
+forgotten.
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from datetime import datetime
+import threading
+import time
+
+from features import ACCIDENT_TYPES, NO_VOID_TYPE, TOILETING_WINDOW_SECONDS, VOID_TYPES, parse_time_string
+
+EVENT_RETENTION_SECONDS_DEFAULT = 24 * 3600
+# How often idle learners are swept, at most
+SWEEP_INTERVAL_SECONDS = 60.0
+
+
+def _insert_sorted(events: deque, item) -> None:
+    """Insert keeping ``events`` ordered; events almost always arrive in order, so scan from the right"""
+    position = len(events)
+    while position > 0 and events[position - 1] > item:
+        position -= 1
+    events.insert(position, item)
+
+
+def _parse_events(events, now: datetime, kind: str) -> list[tuple[float, str | None]]:
+    if events is None:
+        return []
+    if not isinstance(events, list):
+        raise ValueError(f"{kind} must be a list of events")
+    parsed = []
+    for event in events:
+        if not isinstance(event, dict) or not event.get("time"):
+            raise ValueError(f"Each entry in {kind} needs a 'time'")
+        try:
+            when = parse_time_string(event["time"], now)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid event time {event['time']!r}: {e}") from e
+        parsed.append((when.timestamp(), event.get("type")))
+    return parsed
+
+
+class LearnerLog:
+    """One learner's events in time order, plus the aggregates derived from them."""
+
+    __slots__ = ("meals", "visits", "no_voids", "window_voids", "window_accidents", "window_start", "keys")
+
+    def __init__(self):
+        self.meals: deque[float] = deque()
+        self.visits: deque[tuple[float, str | None]] = deque()
+        self.no_voids: deque[float] = deque()
+        # Void and accident visits not yet older than the toileting window at the last query
+        self.window_voids: deque[float] = deque()
+        self.window_accidents: deque[float] = deque()
+        self.window_start = float("-inf")
+        # Stored events, so a client resending part of its log does not double count it
+        self.keys: set[tuple] = set()
+
+    def add_meal(self, timestamp: float) -> bool:
+        key = ("meal", timestamp)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        _insert_sorted(self.meals, timestamp)
+        return True
+
+    def add_visit(self, timestamp: float, visit_type: str | None) -> bool:
+        visit_type = visit_type or None
+        key = ("visit", timestamp, visit_type)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        # Missing types sort first among visits at the same time
+        _insert_sorted(self.visits, (timestamp, visit_type or ""))
+        if visit_type == NO_VOID_TYPE:
+            _insert_sorted(self.no_voids, timestamp)
+        # A visit already older than the window can never count toward it again
+        if timestamp >= self.window_start:
+            if visit_type in VOID_TYPES:
+                _insert_sorted(self.window_voids, timestamp)
+            if visit_type in ACCIDENT_TYPES:
+                _insert_sorted(self.window_accidents, timestamp)
+        return True
+
+    def advance_window(self, window_start: float) -> None:
+        self.window_start = max(self.window_start, window_start)
+        for events in (self.window_voids, self.window_accidents):
+            while events and events[0] < self.window_start:
+                events.popleft()
+
+    def evict(self, before: float) -> None:
+        """Drop events older than ``before``"""
+        while self.meals and self.meals[0] < before:
+            self.keys.discard(("meal", self.meals.popleft()))
+        while self.visits and self.visits[0][0] < before:
+            timestamp, visit_type = self.visits.popleft()
+            self.keys.discard(("visit", timestamp, visit_type or None))
+        while self.no_voids and self.no_voids[0] < before:
+            self.no_voids.popleft()
+        self.advance_window(before)
+
+    def __len__(self) -> int:
+        return len(self.meals) + len(self.visits)
+
+
+class LearnerEventStore:
+    """Event logs keyed by learner id, evicting events older than ``retention_seconds``."""
+
+    def __init__(
+        self,
+        retention_seconds: float = EVENT_RETENTION_SECONDS_DEFAULT,
+        window_seconds: float = TOILETING_WINDOW_SECONDS,
+    ):
+        self.retention_seconds = retention_seconds
+        self.window_seconds = window_seconds
+        self._logs: dict[str, LearnerLog] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.events_added = 0
+        self.skipped = 0  # duplicates and events past retention
+        self.evicted_learners = 0
+
+    @staticmethod
+    def _key(learner_id) -> str:
+        key = str(learner_id).strip() if learner_id is not None else ""
+        if not key:
+            raise ValueError("learner_id must be a non-empty string")
+        return key
+
+    def add(self, learner_id, meals=None, bathroom_visits=None, now: datetime | None = None) -> dict:
+        """Append events for a learner; all of them are stored or, on a bad entry, none are"""
+        key = self._key(learner_id)
+        now = now or datetime.now()
+        parsed_meals = _parse_events(meals, now, "meals")
+        parsed_visits = _parse_events(bathroom_visits, now, "bathroomVisits")
+        horizon = now.timestamp() - self.retention_seconds
+
+        added = 0
+        with self._lock:
+            log = self._logs.get(key)
+            if log is None:
+                log = self._logs[key] = LearnerLog()
+            # Events already past retention are dropped on arrival
+            for timestamp, _ in parsed_meals:
+                if timestamp >= horizon and log.add_meal(timestamp):
+                    added += 1
+            for timestamp, visit_type in parsed_visits:
+                if timestamp >= horizon and log.add_visit(timestamp, visit_type):
+                    added += 1
+            if not log:
+                del self._logs[key]
+
+            received = len(parsed_meals) + len(parsed_visits)
+            self.events_added += added
+            self.skipped += received - added
+            self._maybe_sweep(horizon)
+
+        return {"learner_id": key, "received": received, "added": added, "stored": len(log)}
+
+    def derive(self, learner_id, now: datetime | None = None) -> dict[str, int | None]:
+        """Meal, void and toileting features from the stored log, in the shape derive_time_features returns"""
+        key = self._key(learner_id)
+        now = now or datetime.now()
+        current = now.timestamp()
+
+        with self._lock:
+            log = self._logs.get(key)
+            if log is None:
+                last_meal = last_no_void = None
+                has_visits = False
+                recent_voids = recent_accidents = 0
+            else:
+                log.evict(current - self.retention_seconds)
+                log.advance_window(current - self.window_seconds)
+                last_meal = log.meals[-1] if log.meals else None
+                last_no_void = log.no_voids[-1] if log.no_voids else None
+                has_visits = bool(log.visits)
+                recent_voids = len(log.window_voids)
+                recent_accidents = len(log.window_accidents)
+
+        # 0=Normal, 2=No void in 60 min, 3=Recent accident
+        toileting_status_bucket_numeric = 0
+        if has_visits:
+            if recent_accidents:
+                toileting_status_bucket_numeric = 3
+            elif not recent_voids:
+                toileting_status_bucket_numeric = 2
+
+        return {
+            "time_since_last_meal_min": int((current - last_meal) / 60) if last_meal is not None else None,
+            "time_since_last_void_min": int((current - last_no_void) / 60) if last_no_void is not None else None,
+            "toileting_status_bucket_numeric": toileting_status_bucket_numeric,
+            "recent_accident_flag": 1 if toileting_status_bucket_numeric == 3 else 0,
+        }
+
+    def events(self, learner_id) -> dict | None:
+        """The learner's stored log in the /predict payload shape, oldest first"""
+        key = self._key(learner_id)
+        with self._lock:
+            log = self._logs.get(key)
+            if log is None:
+                return None
+            meals = list(log.meals)
+            visits = list(log.visits)
+        return {
+            "learner_id": key,
+            "meals": [{"time": datetime.fromtimestamp(timestamp).isoformat()} for timestamp in meals],
+            "bathroomVisits": [
+                {"time": datetime.fromtimestamp(timestamp).isoformat(), "type": visit_type or None}
+                for timestamp, visit_type in visits
+            ],
+        }
+
+    def clear(self, learner_id) -> bool:
+        key = self._key(learner_id)
+        with self._lock:
+            return self._logs.pop(key, None) is not None
+
+    def _maybe_sweep(self, horizon: float) -> None:
+        """Evict old events from every learner now and then; callers hold the lock"""
+        now = time.monotonic()
+        if now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        for key in list(self._logs):
+            log = self._logs[key]
+            log.evict(horizon)
+            if not log:
+                del self._logs[key]
+                self.evicted_learners += 1
+
+    def stats(self) -> dict:
+        return {
+            "learners": len(self._logs),
+            "events_added": self.events_added,
+            "events_skipped": self.skipped,
+            "evicted_learners": self.evicted_learners,
+        }
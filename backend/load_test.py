@@ -0,0 +1,249 @@
+"""Open-loop load generator for /predict and /chat.
+
+Replays synthetic learner payloads against a running server at a target
+request rate and reports latency percentiles, throughput and error rate per
+endpoint. Requests are sent on a fixed schedule whether or not earlier ones
+have finished. Latency is measured from each request's scheduled send time,
+so time spent queued behind a slow server counts against it instead of
+silently lowering the offered load.
+
+Start the server with the stand-in model so no API credits are spent:
+
+    LLM_BACKEND=standin python backend/asgi_app.py
+    python backend/load_test.py --qps 20 --duration 60 --mix /predict=3,/chat=1
+"""
+
+from __future__ import annotations
+
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import sys
+
+import httpx
+import numpy as np
+
+from features import SOCIAL_CONTEXT_MAP, TRANSITION_MAP
+from generate_synthetic_data import generate_samples
+
+URL_DEFAULT = "http://127.0.0.1:5000"
+MIX_DEFAULT = "/predict=3,/chat=1"
+LEARNERS_DEFAULT = 500
+CONCURRENCY_DEFAULT = 256
+TIMEOUT_SECONDS_DEFAULT = 60.0
+PERCENTILES = (50, 95, 99)
+
+TRANSITION_NAMES = {value: name for name, value in TRANSITION_MAP.items()}
+SOCIAL_CONTEXT_NAMES = {value: name for name, value in SOCIAL_CONTEXT_MAP.items()}
+
+CHAT_QUESTIONS = (
+    "What antecedent strategies help before a transition from NET back to table work?",
+    "The learner skipped breakfast today. What should the RBT watch for this morning?",
+    "How should we thin reinforcement after a week of low escalation?",
+    "Suggest a visual schedule for an afternoon with two major transitions.",
+    "What data should we collect to check whether the behavior is escape maintained?",
+)
+
+
+def learner_payloads(count: int, seed: int, now: datetime | None = None) -> list[dict]:
+    """/predict payloads built from synthetic rows, with the elapsed times written as event logs"""
+    now = now or datetime.now()
+    samples = generate_samples(count, seed=seed)
+
+    def ago(minutes) -> str:
+        return (now - timedelta(minutes=int(minutes))).isoformat(timespec="minutes")
+
+    payloads = []
+    for row in samples.itertuples(index=False):
+        minutes = int(row.time_numeric)
+        visits = [{"time": ago(row.time_since_last_void_min), "type": "no void"}]
+        if row.recent_accident_flag:
+            visits.append({"time": ago(20), "type": "urine accident"})
+        payloads.append({
+            "sleep_quality_numeric": int(row.sleep_quality_numeric),
+            # The synthetic data counts minutes since midnight; /predict takes HHMM
+            "time_numeric": minutes // 60 * 100 + minutes % 60,
+            "weekday_numeric": int(row.weekday_numeric),
+            "temperature_c": int(row.temperature_c),
+            "humidity_percent": int(row.humidity_percent),
+            "weather_type_numeric": int(row.weather_type_numeric),
+            "transitionType": TRANSITION_NAMES[int(row.transition_type_numeric)],
+            "socialInteractionContext": SOCIAL_CONTEXT_NAMES[int(row.social_context_numeric)],
+            "meals": [{"time": ago(row.time_since_last_meal_min)}],
+            "bathroomVisits": visits,
+        })
+    return payloads
+
+
+def chat_payloads(count: int, rng: np.random.Generator) -> list[dict]:
+    return [
+        {
+            "conversation_id": f"load-test-{index}",
+            "messages": [{"role": "user", "content": CHAT_QUESTIONS[rng.integers(len(CHAT_QUESTIONS))]}],
+        }
+        for index in range(count)
+    ]
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    """``/predict=3,/chat=1`` -> relative weight per endpoint"""
+    mix = {}
+    for part in spec.split(","):
+        path, _, weight = part.strip().partition("=")
+        if path not in ("/predict", "/chat"):
+            raise ValueError(f"Unsupported endpoint {path!r} in --mix; use /predict and /chat")
+        mix[path] = float(weight) if weight else 1.0
+    if not mix or any(weight < 0 for weight in mix.values()) or sum(mix.values()) <= 0:
+        raise ValueError(f"--mix needs positive weights, got {spec!r}")
+    return mix
+
+
+def arrival_offsets(qps: float, duration: float, arrival: str, rng: np.random.Generator) -> np.ndarray:
+    """Send times in seconds from the start: Poisson arrivals, or evenly spaced ones"""
+    if arrival == "uniform":
+        return np.arange(0.0, duration, 1.0 / qps)
+    # Draw a few extra gaps so the cumulative sum nearly always covers the duration
+    gaps = rng.exponential(1.0 / qps, size=int(qps * duration * 1.2) + 16)
+    offsets = np.cumsum(gaps) - gaps[0]
+    return offsets[offsets < duration]
+
+
+def summarize(samples: list[tuple[str, str, float]], elapsed: float) -> dict:
+    """Per-endpoint and overall counts, error rate, throughput and latency percentiles"""
+    by_endpoint: dict[str, list[tuple[str, float]]] = defaultdict(list)
+    for endpoint, outcome, latency in samples:
+        by_endpoint[endpoint].append((outcome, latency))
+        by_endpoint["all"].append((outcome, latency))
+
+    report = {}
+    for endpoint, results in sorted(by_endpoint.items()):
+        outcomes = Counter(outcome for outcome, _ in results)
+        errors = sum(count for outcome, count in outcomes.items() if not outcome.startswith("2"))
+        latencies_ms = np.asarray([latency for _, latency in results]) * 1000
+        report[endpoint] = {
+            "requests": len(results),
+            "errors": errors,
+            "error_rate": round(errors / len(results), 4),
+            "throughput_rps": round((len(results) - errors) / elapsed, 2),
+            "latency_ms": {
+                **{f"p{q}": round(float(np.percentile(latencies_ms, q)), 1) for q in PERCENTILES},
+                "max": round(float(latencies_ms.max()), 1),
+            },
+            "outcomes": dict(sorted(outcomes.items())),
+        }
+    return report
+
+
+async def run(args: argparse.Namespace) -> dict:
+    rng = np.random.default_rng(args.seed)
+    mix = parse_mix(args.mix)
+    endpoints = list(mix)
+    weights = np.asarray([mix[path] for path in endpoints]) / sum(mix.values())
+    bodies = {
+        "/predict": learner_payloads(args.learners, args.seed),
+        "/chat": chat_payloads(args.learners, rng),
+    }
+
+    offsets = arrival_offsets(args.qps, args.duration, args.arrival, rng)
+    plan = [
+        (offset, endpoints[choice], bodies[endpoints[choice]][rng.integers(args.learners)])
+        for offset, choice in zip(offsets, rng.choice(len(endpoints), size=len(offsets), p=weights))
+    ]
+
+    samples: list[tuple[str, str, float]] = []
+    in_flight = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        async def send(scheduled: float, endpoint: str, body: dict) -> None:
+            async with in_flight:
+                try:
+                    response = await client.post(endpoint, json=body)
+                    outcome = str(response.status_code)
+                except httpx.HTTPError as e:
+                    outcome = type(e).__name__
+            samples.append((endpoint, outcome, loop.time() - scheduled))
+
+        tasks = []
+        for offset, endpoint, body in plan:
+            delay = started + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(started + offset, endpoint, body)))
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - started
+
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "target": {
+            "url": args.url,
+            "qps": args.qps,
+            "duration_s": args.duration,
+            "arrival": args.arrival,
+            "mix": mix,
+            "concurrency": args.concurrency,
+        },
+        "sent": len(plan),
+        "offered_qps": round(len(plan) / args.duration, 2),
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": summarize(samples, elapsed) if samples else {},
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay synthetic learner traffic against /predict and /chat")
+    parser.add_argument("--url", default=URL_DEFAULT, help="Base URL of the running server")
+    parser.add_argument("--qps", type=float, default=10.0, help="Target request rate across all endpoints")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to send requests for")
+    parser.add_argument("--mix", default=MIX_DEFAULT, help="Relative weight per endpoint, e.g. /predict=3,/chat=1")
+    parser.add_argument(
+        "--arrival",
+        choices=["poisson", "uniform"],
+        default="poisson",
+        help="Poisson arrivals (bursty, like real clients) or evenly spaced ones",
+    )
+    parser.add_argument("--learners", type=int, default=LEARNERS_DEFAULT, help="Distinct synthetic payloads to replay")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=CONCURRENCY_DEFAULT,
+        help="Most requests in flight at once; later ones wait, and the wait counts toward their latency",
+    )
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_SECONDS_DEFAULT, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+    if args.qps <= 0 or args.duration <= 0 or args.learners <= 0 or args.concurrency <= 0:
+        parser.error("--qps, --duration, --learners and --concurrency must be positive")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        report = asyncio.run(run(args))
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+    if args.output:
+        with args.output.open("w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    overall = report["endpoints"].get("all")
+    if overall:
+        latency = overall["latency_ms"]
+        print(
+            f"{overall['requests']} requests, {overall['throughput_rps']} ok/s, "
+            f"error rate {overall['error_rate']:.1%}, p50 {latency['p50']} ms, p99 {latency['p99']} ms",
+            file=sys.stderr,
+        )
+
+
+if __name__ == "__main__":
+    main()
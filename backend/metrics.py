@@ -0,0 +1,229 @@
+"""Request, stage and LLM metrics in the Prometheus text format.
+
+Histograms keep fixed cumulative buckets per label set, so an observation is
+a bisect and three additions under a lock, and nothing is allocated after a
+label set's first use. The servers time every request and each stage of
+/predict and /chat: weather lookup, feature derivation, model input build,
+model scoring, prompt build and the LLM round trip. LLM token counts and
+failures by exception class are counted alongside. ``render`` writes
+everything out for a ``/metrics`` scrape.
+
+Each process keeps its own registry. Under ``prefork.py`` a scrape reports
+the worker that answered it.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from typing import Callable
+import math
+import threading
+import time
+
+from conversation import estimate_tokens
+
+# Seconds, from sub-millisecond feature work up to slow LLM replies
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in values]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: one count per bucket plus the +Inf overflow, then the sum
+        self._series: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels) -> "_Timer":
+        """Context manager observing the wall time of its block, whether or not it raises"""
+        return _Timer(self, labels)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+
+        lines = []
+        for labels, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-1]):
+                cumulative += count
+                le = _labels(self.label_names, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    # A plain class rather than @contextmanager, which costs several times more per use
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class Gauge:
+    """Values read from a callback at scrape time, as {label values: value}"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...], read: Callable[[], dict]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.read = read
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+            for labels, value in sorted(self.read().items())
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, label_names))
+
+    def histogram(self, name: str, help_text: str, label_names: tuple[str, ...] = (), **kwargs) -> Histogram:
+        return self._register(Histogram(name, help_text, label_names, **kwargs))
+
+    def gauge(self, name: str, help_text: str, label_names: tuple[str, ...], read: Callable[[], dict]) -> Gauge:
+        return self._register(Gauge(name, help_text, label_names, read))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+registry = MetricsRegistry()
+
+request_seconds = registry.histogram(
+    "aba_request_duration_seconds",
+    "Time to answer a request, by route and status code",
+    ("route", "status"),
+)
+stage_seconds = registry.histogram(
+    "aba_stage_duration_seconds",
+    "Time spent in each stage of an operation (predict, chat, summarize)",
+    ("operation", "stage"),
+)
+llm_tokens = registry.counter(
+    "aba_llm_tokens_total",
+    "Estimated LLM tokens sent (system message and prompt) and received",
+    ("operation", "direction"),
+)
+llm_errors = registry.counter(
+    "aba_llm_errors_total",
+    "Failed LLM calls by the class of the underlying exception",
+    ("operation", "error"),
+)
+
+
+def error_class(error: BaseException) -> str:
+    """Class name of the root exception; Railtracks wraps model failures in its own LLMError"""
+    while True:
+        cause = error.__cause__ or error.__context__
+        if cause is None:
+            return type(error).__name__
+        error = cause
+
+
+def record_llm_call(
+    operation: str,
+    input_tokens: int,
+    started: float,
+    reply: str | None = None,
+    error: BaseException | None = None,
+) -> None:
+    """Account one LLM round trip that began at ``started`` (a perf_counter reading)"""
+    stage_seconds.observe(time.perf_counter() - started, operation, "llm")
+    llm_tokens.inc(input_tokens, operation, "input")
+    if error is not None:
+        llm_errors.inc(1, operation, error_class(error))
+    else:
+        llm_tokens.inc(estimate_tokens(reply), operation, "output")
@@ -0,0 +1,235 @@
+"""Versioned model registry with background hot reload.
+
+Training with ``--version`` writes a complete artifact to
+``<model dir>/versions/<version>/``, with the metrics file written last. The
+registry polls that directory. When a newer version appears it is loaded
+and warmed on the watcher thread, and then swapped in with a single
+reference assignment. Requests read ``registry.current`` once and keep that
+predictor for their whole lifetime, so they never stall on a reload or see
+half of one model and half of another. The unversioned artifact directly in
+the model directory is served as version ``base`` until a versioned one
+exists.
+
+A rollback leaves a ``RETIRED`` marker in the version's directory. Every
+process serving from the same directory (the pre-forked workers, or a
+restarted server) follows it on its next poll and never promotes that version
+again. Delete the marker to allow the version back.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import threading
+import time
+
+from inference import BehaviorPredictor
+from structured_logging import get_logger
+from train_model import BASE_VERSION, METRICS_FILENAME, VERSIONS_DIRNAME, complete_versions
+
+POLL_INTERVAL_SECONDS_DEFAULT = 5.0
+# Loaded predictors kept in memory so a rollback is instant
+HISTORY_DEFAULT = 3
+RETIRED_FILENAME = "RETIRED"
+
+logger = get_logger("model_registry")
+
+
+class RollbackError(RuntimeError):
+    """No earlier model version is loaded to roll back to"""
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        model_dir: Path,
+        poll_interval: float = POLL_INTERVAL_SECONDS_DEFAULT,
+        history: int = HISTORY_DEFAULT,
+    ):
+        self.model_dir = model_dir
+        self.poll_interval = poll_interval
+        self.history = history
+        self._active: list[BehaviorPredictor] = []  # oldest first; the last one is serving
+        self._retired: set[str] = set()  # rolled back; the watcher never promotes these again
+        self._failed: dict[str, float] = {}  # version -> metrics mtime of the artifact that failed to load
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self.reloads = 0
+        self.load_failures = 0
+        self.last_load_ms: float | None = None
+
+        # Start from the newest version that loads, falling back to the unversioned artifact
+        predictor = None
+        while predictor is None:
+            latest = self._latest_candidate()
+            if latest is None:
+                predictor = self._load_base()
+            else:
+                predictor = self._try_load(latest)
+        self._activate(predictor)
+
+    @property
+    def current(self) -> BehaviorPredictor:
+        return self._active[-1]
+
+    @property
+    def versions_dir(self) -> Path:
+        return self.model_dir / VERSIONS_DIRNAME
+
+    def available_versions(self) -> list[str]:
+        """Complete versioned artifacts on disk, oldest first"""
+        return complete_versions(self.model_dir)
+
+    def _latest_candidate(self, versions: list[str] | None = None) -> str | None:
+        for version in reversed(self.available_versions() if versions is None else versions):
+            if self._is_retired(version):
+                continue
+            failed_mtime = self._failed.get(version)
+            if failed_mtime is not None and failed_mtime == self._metrics_mtime(version):
+                continue
+            return version
+        return None
+
+    def _is_retired(self, version: str) -> bool:
+        if version in self._retired:
+            return True
+        if version != BASE_VERSION and (self.versions_dir / version / RETIRED_FILENAME).exists():
+            self._retired.add(version)
+            return True
+        return False
+
+    def _metrics_mtime(self, version: str) -> float | None:
+        try:
+            return (self.versions_dir / version / METRICS_FILENAME).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+    def _load_base(self) -> BehaviorPredictor:
+        predictor = BehaviorPredictor.load(self.model_dir, version=BASE_VERSION)
+        predictor.warm_up()
+        return predictor
+
+    def _load(self, version: str) -> BehaviorPredictor:
+        start = time.perf_counter()
+        predictor = BehaviorPredictor.load(self.versions_dir / version, version=version)
+        predictor.warm_up()
+        self.last_load_ms = round((time.perf_counter() - start) * 1000, 1)
+        return predictor
+
+    def _try_load(self, version: str) -> BehaviorPredictor | None:
+        try:
+            return self._load(version)
+        except Exception:
+            self.load_failures += 1
+            self._failed[version] = self._metrics_mtime(version)
+            logger.exception("model load failed", extra={"fields": {"model_version": version}})
+            return None
+
+    def _activate(self, predictor: BehaviorPredictor) -> None:
+        with self._swap_lock:
+            # Build the new list and publish it in one assignment, so readers never see a partial update
+            self._active = (self._active + [predictor])[-self.history:]
+
+    def poll(self) -> bool:
+        """Load and swap in a newer version if one has landed; True if the model changed"""
+        if self._follow_rollback():
+            return True
+        versions = self.available_versions()
+        candidate = self._latest_candidate(versions)
+        current = self.current.version
+        if candidate is None or candidate == current:
+            return False
+        # Never move back past the serving version, e.g. to one older than a rollback target
+        if current in versions and versions.index(candidate) < versions.index(current):
+            return False
+
+        predictor = self._try_load(candidate)
+        if predictor is None:
+            return False
+
+        previous = self.current.version
+        self._activate(predictor)
+        self.reloads += 1
+        logger.info("model activated", extra={"fields": {
+            "model_version": candidate,
+            "previous_version": previous,
+            "load_ms": self.last_load_ms,
+            "decision_threshold": predictor.decision_threshold,
+        }})
+        return True
+
+    def rollback(self) -> BehaviorPredictor:
+        """Retire the serving version and go back to the one before it"""
+        with self._swap_lock:
+            if len(self._active) < 2:
+                raise RollbackError("No previous model version is loaded")
+            retired = self._active[-1]
+            self._retired.add(retired.version)
+            self._active = self._active[:-1]
+        if retired.version != BASE_VERSION:
+            try:
+                (self.versions_dir / retired.version / RETIRED_FILENAME).touch()
+            except OSError:
+                logger.exception("could not mark model version retired", extra={"fields": {
+                    "model_version": retired.version,
+                }})
+        logger.warning("model rolled back", extra={"fields": {
+            "model_version": self.current.version,
+            "retired_version": retired.version,
+        }})
+        return self.current
+
+    def _follow_rollback(self) -> bool:
+        """Leave the serving version if another process retired it; True if the model changed"""
+        retired = self.current.version
+        if not self._is_retired(retired):
+            return False
+        if len(self._active) >= 2:
+            with self._swap_lock:
+                self._active = self._active[:-1]
+        else:
+            # Nothing earlier is loaded here: load the newest version still in service
+            candidate = self._latest_candidate()
+            predictor = self._try_load(candidate) if candidate is not None else None
+            predictor = predictor or self._load_base()
+            with self._swap_lock:
+                self._active = [predictor]
+        logger.warning("model rolled back by another process", extra={"fields": {
+            "model_version": self.current.version,
+            "retired_version": retired,
+        }})
+        return True
+
+    def start(self) -> "ModelRegistry":
+        if self._watcher is None and self.poll_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, name="model-registry", daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def after_fork(self) -> None:
+        """Start a fresh watcher in a forked worker; threads do not survive fork"""
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        self.start()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("model registry poll failed")
+
+    def stats(self) -> dict:
+        return {
+            "model_version": self.current.version,
+            "decision_threshold": self.current.decision_threshold,
+            "loaded_versions": [predictor.version for predictor in self._active],
+            "retired_versions": sorted(self._retired),
+            "reloads": self.reloads,
+            "load_failures": self.load_failures,
+            "last_load_ms": self.last_load_ms,
+        }
@@ -0,0 +1,288 @@
+"""Cross-validated hyperparameter search for the behavior predictor's forest.
+
+``train_model.py --search grid|random`` runs it on the training split before
+the final fit. Each candidate forest is scored by stratified k-fold CV:
+
+- **Folds.** Every fold's scaler is fitted once and its scaled train and
+  validation arrays are written under the cache directory. Workers
+  memory-map them instead of refitting the preprocessing for each candidate.
+- **Workers.** (candidate, fold) fits are spread across a process pool,
+  with one core per forest.
+- **Scoring.** Each fold's decision threshold is tuned on the forest's
+  out-of-bag predictions for its training rows, and the fold's macro-F1 is
+  that threshold's score on the held-out rows. Tuning on the held-out rows
+  themselves would overstate every candidate. Forests fitted without
+  bootstrap have no out-of-bag rows and are scored at 0.5.
+- **Resume.** Each fold result is cached on disk under a hash of the
+  training data, the fold layout and the candidate's parameters. A re-run
+  of an interrupted or widened search only fits what is missing.
+- **Latency.** Fold 0's model of each candidate is exported as a compiled
+  forest. The parent then times it serially, scoring one row at a time the
+  way /predict does, so the pool's load does not skew the timings. Timings
+  depend on the machine, so they are measured on every run, never cached.
+
+Candidates slower than the latency budget are dropped. The rest are ranked
+by ``mean macro-F1 - latency_weight * latency / budget``, so at equal accuracy
+the faster forest wins.
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.model_selection import ParameterGrid, ParameterSampler, StratifiedKFold
+
+from compiled_forest import CompiledForest
+from evaluation import best_macro_f1_threshold, threshold_curve
+from train_model import NUMERIC_FEATURES, build_pipeline
+
+SEARCH_MODES = ("grid", "random")
+SEARCH_SPACE_DEFAULT = {
+    "n_estimators": [100, 200, 300],
+    "max_depth": [None, 12, 20],
+    "min_samples_split": [2, 4, 8],
+    "min_samples_leaf": [1, 2, 4],
+}
+FOLDS_DEFAULT = 5
+RANDOM_ITERATIONS_DEFAULT = 20
+# Median single-row time of the compiled forest, the /predict scoring path
+LATENCY_BUDGET_MS_DEFAULT = 2.0
+# Objective points lost per full latency budget spent
+LATENCY_WEIGHT_DEFAULT = 0.02
+LATENCY_REPEAT = 300
+SEARCH_CACHE_DIRNAME = "search_cache"
+# Threshold for forests without out-of-bag predictions to tune one on
+FIXED_THRESHOLD = 0.5
+# Bump when the meaning of a cached fold result changes, so older results are not reused
+RESULT_FORMAT = 2
+
+
+@dataclass(frozen=True)
+class SearchConfig:
+    mode: str
+    space: dict[str, list] = field(default_factory=lambda: dict(SEARCH_SPACE_DEFAULT))
+    iterations: int = RANDOM_ITERATIONS_DEFAULT
+    folds: int = FOLDS_DEFAULT
+    workers: int | None = None
+    cache_dir: Path | None = None
+    latency_budget_ms: float = LATENCY_BUDGET_MS_DEFAULT
+    latency_weight: float = LATENCY_WEIGHT_DEFAULT
+
+
+def load_search_space(path: Path) -> dict[str, list]:
+    """JSON object mapping forest parameters to lists of values to try"""
+    with path.open("r", encoding="utf-8") as f:
+        space = json.load(f)
+    if not isinstance(space, dict) or not all(isinstance(values, list) and values for values in space.values()):
+        raise ValueError(f"{path} must map each parameter name to a non-empty list of values")
+    return space
+
+
+def candidates(config: SearchConfig, random_seed: int) -> list[dict]:
+    if config.mode == "grid":
+        return list(ParameterGrid(config.space))
+    # ParameterSampler samples without replacement when every value is a list
+    total = len(ParameterGrid(config.space))
+    return list(ParameterSampler(config.space, n_iter=min(config.iterations, total), random_state=random_seed))
+
+
+def dataset_hash(X: pd.DataFrame, y: pd.Series) -> str:
+    digest = hashlib.sha256()
+    digest.update(json.dumps(list(X.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(X, index=False).to_numpy().tobytes())
+    digest.update(pd.util.hash_pandas_object(y, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _key(*parts) -> str:
+    material = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()[:24]
+
+
+def _write_json(path: Path, payload: dict) -> None:
+    tmp_path = path.with_suffix(".json.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def prepare_folds(X: pd.DataFrame, y: pd.Series, folds: int, random_seed: int, fold_root: Path) -> list[Path]:
+    """Fit each fold's preprocessing once and store its scaled arrays; reuses folds already on disk"""
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_seed)
+    fold_dirs = []
+    for index, (train_index, val_index) in enumerate(splitter.split(X, y)):
+        fold_dir = fold_root / f"fold-{index}"
+        fold_dirs.append(fold_dir)
+        if (fold_dir / "preprocess.joblib").exists():
+            continue
+        fold_dir.mkdir(parents=True, exist_ok=True)
+        preprocess = build_pipeline(random_seed).named_steps["preprocess"]
+        X_train = preprocess.fit_transform(X.iloc[train_index])
+        np.save(fold_dir / "X_train.npy", np.ascontiguousarray(X_train))
+        np.save(fold_dir / "y_train.npy", y.iloc[train_index].to_numpy())
+        np.save(fold_dir / "X_val.npy", np.ascontiguousarray(preprocess.transform(X.iloc[val_index])))
+        np.save(fold_dir / "y_val.npy", y.iloc[val_index].to_numpy())
+        # Written last: its presence marks a complete fold
+        joblib.dump(preprocess, fold_dir / "preprocess.joblib")
+    return fold_dirs
+
+
+def _fit_fold(fold_dir: Path, params: dict, random_seed: int, result_path: Path, forest_path: Path | None) -> dict:
+    """Fit one candidate on one fold and cache its score; runs in a worker process"""
+    load = lambda name: np.load(fold_dir / f"{name}.npy", mmap_mode="r")  # noqa: E731
+    pipeline = build_pipeline(random_seed, params)
+    # The pool already keeps every core busy
+    pipeline.named_steps["clf"].set_params(n_jobs=1)
+
+    forest = pipeline.named_steps["clf"]
+    # Out-of-bag predictions give the threshold training rows the forest has not fitted
+    forest.set_params(oob_score=forest.bootstrap)
+
+    start = time.perf_counter()
+    forest.fit(load("X_train"), load("y_train"))
+    fit_seconds = time.perf_counter() - start
+
+    positive = list(forest.classes_).index(1)
+    threshold = FIXED_THRESHOLD
+    if forest.bootstrap:
+        oob_proba = forest.oob_decision_function_[:, positive]
+        # Rows that were in every tree's bootstrap sample have no out-of-bag prediction
+        seen = np.isfinite(oob_proba)
+        if seen.any():
+            y_train = np.asarray(load("y_train"))
+            threshold, _ = best_macro_f1_threshold(threshold_curve(y_train[seen], oob_proba[seen]))
+
+    y_proba = forest.predict_proba(load("X_val"))[:, positive]
+    y_val = np.asarray(load("y_val"))
+    macro_f1 = float(threshold_curve(y_val, y_proba).macro_f1()[_rule_index(y_proba, threshold)])
+
+    if forest_path is not None:
+        # Reassemble the serving pipeline around the fold's fitted scaler for the latency check
+        pipeline.steps[0] = ("preprocess", joblib.load(fold_dir / "preprocess.joblib"))
+        CompiledForest.from_pipeline(pipeline).save(forest_path)
+
+    result = {
+        "params": params,
+        "macro_f1": round(float(macro_f1), 6),
+        "threshold": float(threshold),
+        "fit_seconds": round(fit_seconds, 3),
+    }
+    _write_json(result_path, result)
+    return result
+
+
+def _rule_index(y_score: np.ndarray, threshold: float) -> int:
+    """Position in ``threshold_curve(..., y_score)`` of the rule ``score >= threshold``"""
+    # The curve has the empty rule, then one entry per distinct score in decreasing order
+    return int(np.unique(y_score[y_score >= threshold]).size)
+
+
+def measure_latency_ms(forest_path: Path, row: np.ndarray, repeat: int = LATENCY_REPEAT) -> float:
+    """Median time for the compiled forest to score one row"""
+    compiled = CompiledForest.load(forest_path)
+    compiled.predict_proba(row)  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compiled.predict_proba(row)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def search(X: pd.DataFrame, y: pd.Series, config: SearchConfig, random_seed: int, cache_dir: Path) -> dict:
+    """Score every candidate by k-fold CV and pick the best one within the latency budget"""
+    if config.mode not in SEARCH_MODES:
+        raise ValueError(f"Search mode must be one of {SEARCH_MODES}, got {config.mode!r}")
+    if config.latency_budget_ms <= 0:
+        raise ValueError("The latency budget must be positive")
+
+    data_key = _key(dataset_hash(X, y), config.folds, random_seed, sklearn.__version__, RESULT_FORMAT)
+    fold_dirs = prepare_folds(X, y, config.folds, random_seed, cache_dir / "folds" / data_key)
+    results_dir = cache_dir / "results" / data_key
+    results_dir.mkdir(parents=True, exist_ok=True)
+    forests_dir = cache_dir / "forests" / data_key
+    forests_dir.mkdir(parents=True, exist_ok=True)
+
+    params_list = candidates(config, random_seed)
+    keys = [_key(params) for params in params_list]
+    scores: dict[tuple[str, int], dict] = {}
+    tasks = []
+    for key, params in zip(keys, params_list):
+        for fold, fold_dir in enumerate(fold_dirs):
+            result_path = results_dir / f"{key}-fold{fold}.json"
+            forest_path = forests_dir / f"{key}.npz" if fold == 0 else None
+            if result_path.exists() and (forest_path is None or forest_path.exists()):
+                with result_path.open("r", encoding="utf-8") as f:
+                    scores[key, fold] = json.load(f)
+            else:
+                tasks.append((key, fold, fold_dir, params, result_path, forest_path))
+
+    cached_fits = len(scores)
+    print(
+        f"Search: {len(params_list)} candidates x {config.folds} folds, "
+        f"{cached_fits} fits cached, {len(tasks)} to run",
+        file=sys.stderr,
+    )
+    start = time.perf_counter()
+    if tasks:
+        with ProcessPoolExecutor(max_workers=config.workers or os.cpu_count() or 1) as executor:
+            futures = {
+                executor.submit(_fit_fold, fold_dir, params, random_seed, result_path, forest_path): (key, fold)
+                for key, fold, fold_dir, params, result_path, forest_path in tasks
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                scores[futures[future]] = future.result()
+                if done % max(len(tasks) // 10, 1) == 0 or done == len(tasks):
+                    print(f"  {done}/{len(tasks)} fits done", file=sys.stderr)
+    search_seconds = time.perf_counter() - start
+
+    # The compiled forest scores raw feature vectors, as /predict passes them
+    row = X.iloc[[0]][NUMERIC_FEATURES].to_numpy(dtype=np.float32)[0]
+    ranked = []
+    for key, params in zip(keys, params_list):
+        latency_ms = round(measure_latency_ms(forests_dir / f"{key}.npz", row), 4)
+
+        fold_f1 = [scores[key, fold]["macro_f1"] for fold in range(config.folds)]
+        mean_f1 = statistics.fmean(fold_f1)
+        within_budget = latency_ms <= config.latency_budget_ms
+        ranked.append({
+            "params": params,
+            "cv_macro_f1": round(mean_f1, 4),
+            "cv_macro_f1_std": round(statistics.pstdev(fold_f1), 4),
+            "latency_ms": latency_ms,
+            "within_budget": within_budget,
+            "objective": round(mean_f1 - config.latency_weight * latency_ms / config.latency_budget_ms, 4),
+        })
+    ranked.sort(key=lambda row: (not row["within_budget"], -row["objective"]))
+
+    if not ranked[0]["within_budget"]:
+        fastest = min(ranked, key=lambda row: row["latency_ms"])
+        raise ValueError(
+            f"No candidate meets the {config.latency_budget_ms} ms latency budget "
+            f"(fastest: {fastest['latency_ms']} ms with {fastest['params']})"
+        )
+
+    return {
+        "mode": config.mode,
+        "folds": config.folds,
+        "candidates": len(params_list),
+        "fits_run": len(tasks),
+        "fits_cached": cached_fits,
+        "search_seconds": round(search_seconds, 2),
+        "latency_budget_ms": config.latency_budget_ms,
+        "latency_weight": config.latency_weight,
+        "best": ranked[0],
+        "ranking": ranked,
+    }
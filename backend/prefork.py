@@ -0,0 +1,257 @@
+"""Pre-fork multi-worker serving for the ASGI app.
+
+The parent imports the app once, which loads the model and its compiled
+forest, freezes the heap for the garbage collector and then forks the
+workers. The sklearn forest is shared copy-on-write. The compiled forest's
+node arrays are memory-mapped from the .npz file, so they stay shared in the
+page cache even after a worker reloads a model version. Each worker serves
+the inherited listening socket with its own uvicorn event loop and reports
+its startup time and memory to the parent once it is ready.
+
+Any worker may answer any request, so state that has to be consistent across
+requests lives in files: deferred analysis jobs, weather readings and the
+analysis cache use SQLite files (in a temporary directory unless their paths
+are set), and rollbacks leave a marker next to the model version.
+
+    python backend/prefork.py --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import os
+from pathlib import Path
+import select
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+from structured_logging import get_logger
+
+WORKER_REPORT_TIMEOUT = 60.0
+# A worker that dies sooner than this after its fork counts as a failed start
+FAST_FAILURE_SECONDS = 10.0
+# Restart delay doubles with each consecutive failed start, up to the maximum
+RESTART_BACKOFF_SECONDS = 0.5
+RESTART_BACKOFF_MAX_SECONDS = 30.0
+# Consecutive failed starts (a bad model version, say) after which the parent gives up
+MAX_FAST_FAILURES = 5
+
+# SQLite files the workers share, by the environment variable that sets each path
+SHARED_STATE_FILES = {
+    "ANALYSIS_JOBS_PATH": "analysis_jobs.sqlite3",
+    "WEATHER_STORE_PATH": "weather.sqlite3",
+    "ANALYSIS_CACHE_PATH": "analysis_cache.sqlite3",
+}
+
+logger = get_logger("prefork")
+
+
+def share_state() -> Path | None:
+    """Point every unset shared-state path at a fresh temporary directory; returns it, or None if unused"""
+    unset = [name for name in SHARED_STATE_FILES if not os.environ.get(name)]
+    if not unset:
+        return None
+    state_dir = Path(tempfile.mkdtemp(prefix="prefork-state-"))
+    for name in unset:
+        os.environ[name] = str(state_dir / SHARED_STATE_FILES[name])
+    return state_dir
+
+
+def process_memory(pid: int | str = "self") -> dict[str, float | None]:
+    """RSS and PSS in MiB from /proc; PSS splits shared pages between the processes mapping them"""
+
+    def read_kib(path: str, key: str) -> float | None:
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                for line in f:
+                    if line.startswith(key):
+                        return float(line.split()[1])
+        except OSError:
+            return None
+        return None
+
+    rss = read_kib(f"/proc/{pid}/status", "VmRSS:")
+    pss = read_kib(f"/proc/{pid}/smaps_rollup", "Pss:")
+    return {
+        "rss_mb": round(rss / 1024, 1) if rss is not None else None,
+        "pss_mb": round(pss / 1024, 1) if pss is not None else None,
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Serve the ASGI app from pre-forked workers sharing one loaded model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    parser.add_argument("--host", default=os.environ.get("ASGI_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("ASGI_PORT", "5000")))
+    return parser.parse_args()
+
+
+class _WorkerServer(uvicorn.Server):
+    """uvicorn server that tells the parent when it is accepting connections"""
+
+    def __init__(self, config: uvicorn.Config, report_fd: int | None, forked_at: float):
+        super().__init__(config)
+        self.report_fd = report_fd
+        self.forked_at = forked_at
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        report = {
+            "pid": os.getpid(),
+            "startup_ms": round((time.perf_counter() - self.forked_at) * 1000, 1),
+            **process_memory(),
+        }
+        self.config.app.state.worker_stats = lambda: {**report, **process_memory()}
+        logger.info("worker ready", extra={"fields": report})
+        if self.report_fd is not None:
+            # One short line is below PIPE_BUF, so reports from different workers never interleave
+            os.write(self.report_fd, (json.dumps(report) + "\n").encode("utf-8"))
+
+
+def _read_reports(fd: int, count: int, timeout: float) -> list[dict]:
+    """Collect up to ``count`` worker reports, giving up after ``timeout`` seconds"""
+    reports: list[dict] = []
+    buffer = b""
+    deadline = time.monotonic() + timeout
+    while len(reports) < count:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            break
+        chunk = os.read(fd, 4096)
+        if not chunk:
+            break
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        reports.extend(json.loads(line) for line in lines if line)
+    return reports
+
+
+def _run_worker(app, sock: socket.socket, report_fd: int | None, forked_at: float) -> None:
+    from app import model_registry
+
+    model_registry.after_fork()
+    config = uvicorn.Config(app, lifespan="on", log_config=None)
+    server = _WorkerServer(config, report_fd, forked_at)
+    server.run(sockets=[sock])
+
+
+def main() -> None:
+    args = parse_args()
+    started = time.perf_counter()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    # Must run before the app is imported, since it reads the paths at import time
+    state_dir = share_state()
+
+    # Importing the app loads the model; everything loaded here is shared with the workers
+    from asgi_app import app
+
+    load_ms = round((time.perf_counter() - started) * 1000, 1)
+    # Keep the collector from touching (and so copying) the inherited objects in every worker
+    gc.collect()
+    gc.freeze()
+
+    report_read, report_write = os.pipe()
+    workers: dict[int, float] = {}  # pid -> fork time (monotonic)
+    shutting_down = False
+
+    def spawn(report_fd: int | None) -> None:
+        forked_at = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                _run_worker(app, sock, report_fd, forked_at)
+            finally:
+                os._exit(0)
+        workers[pid] = time.monotonic()
+
+    def shutdown(signum, frame) -> None:
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    for _ in range(args.workers):
+        spawn(report_write)
+    os.close(report_write)
+
+    reports = _read_reports(report_read, args.workers, WORKER_REPORT_TIMEOUT)
+    os.close(report_read)
+    parent_memory = process_memory()
+    pss_total = sum(report["pss_mb"] or 0 for report in reports) + (parent_memory["pss_mb"] or 0)
+    logger.info("prefork ready", extra={"fields": {
+        "host": args.host,
+        "port": args.port,
+        "workers": len(reports),
+        "parent_load_ms": load_ms,
+        "parent_rss_mb": parent_memory["rss_mb"],
+        "worker_startup_ms": [report["startup_ms"] for report in reports],
+        "worker_rss_mb": [report["rss_mb"] for report in reports],
+        "worker_pss_mb": [report["pss_mb"] for report in reports],
+        "total_pss_mb": round(pss_total, 1),
+        "shared_state": {name: os.environ[name] for name in SHARED_STATE_FILES},
+    }})
+
+    # Replace workers that die until asked to stop; replacements log their own report.
+    # Workers that keep dying right after the fork are restarted with a growing delay, then abandoned.
+    fast_failures = 0
+    exit_code = 0
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        uptime = time.monotonic() - workers.pop(pid, time.monotonic())
+        if shutting_down:
+            continue
+
+        fast_failures = fast_failures + 1 if uptime < FAST_FAILURE_SECONDS else 0
+        if fast_failures >= MAX_FAST_FAILURES:
+            logger.error("workers keep failing at startup, shutting down", extra={"fields": {
+                "pid": pid,
+                "status": status,
+                "consecutive_failures": fast_failures,
+            }})
+            exit_code = 1
+            shutdown(None, None)
+            continue
+
+        delay = min(RESTART_BACKOFF_SECONDS * 2 ** (fast_failures - 1), RESTART_BACKOFF_MAX_SECONDS) if fast_failures else 0.0
+        logger.warning("worker exited, restarting", extra={"fields": {
+            "pid": pid,
+            "status": status,
+            "uptime_s": round(uptime, 1),
+            "restart_delay_s": delay,
+        }})
+        time.sleep(delay)
+        if not shutting_down:
+            spawn(None)
+
+    if state_dir is not None:
+        shutil.rmtree(state_dir, ignore_errors=True)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""SQLite files shared by the pre-forked workers.
+
+A SQLite connection must not be used by any process other than the one that
+opened it, and the parent opens its stores before it forks. Each process
+therefore opens its own connection the first time it touches a store. WAL
+journaling lets one worker read while another writes.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+import os
+import sqlite3
+
+BUSY_TIMEOUT_SECONDS = 5.0
+
+
+class ProcessLocalSQLite:
+    """One connection per process to a SQLite file; callers serialize their own threads."""
+
+    def __init__(self, path: Path, schema: str):
+        self.path = Path(path)
+        self.schema = schema
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection: sqlite3.Connection | None = None
+        self._pid: int | None = None
+        # Create the tables now, with a connection that is closed again before any fork
+        self._open().close()
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(str(self.path), timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(self.schema)
+        return connection
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._connection = self._open()
+            self._pid = os.getpid()
+        return self._connection
@@ -0,0 +1,77 @@
+"""Anthropic prompt caching for the agents' static system messages.
+
+``PromptCachingAnthropicLLM`` is ``rt.llm.AnthropicLLM`` with the system
+message sent as a text block marked ``cache_control: ephemeral``. Everything
+up to and including that block is the cached prefix. For /predict it is the
+BCBA role and response format from analysis_prompt.py, and only the learner
+data after it is billed and processed in full. Each response's cache use is
+counted in /metrics: tokens read from the cache, tokens written to it and
+uncached tokens.
+
+The API only caches a prefix of at least ``min_cacheable_tokens`` tokens and
+silently ignores shorter markers, so the marker is only added to system
+messages that reach the model's minimum (by the same estimate /chat uses for
+budgeting). Cache entries expire after five minutes without a hit.
+"""
+
+from __future__ import annotations
+
+import railtracks as rt
+
+from conversation import estimate_tokens
+from metrics import registry
+
+CACHE_CONTROL = {"type": "ephemeral"}
+CACHE_TTL_SECONDS = 300
+# Shortest prefix the API will cache, by model family
+MIN_CACHEABLE_TOKENS_DEFAULT = 1024
+MIN_CACHEABLE_TOKENS_HAIKU = 2048
+
+prompt_cache_tokens = registry.counter(
+    "aba_llm_prompt_cache_tokens_total",
+    "Input tokens reported by the model, by prompt cache use (read, write, uncached)",
+    ("kind",),
+)
+
+
+def min_cacheable_tokens(model_name: str) -> int:
+    return MIN_CACHEABLE_TOKENS_HAIKU if "haiku" in model_name.lower() else MIN_CACHEABLE_TOKENS_DEFAULT
+
+
+def record_prompt_cache(read: int, written: int, uncached: int) -> None:
+    prompt_cache_tokens.inc(read, "read")
+    prompt_cache_tokens.inc(written, "write")
+    prompt_cache_tokens.inc(uncached, "uncached")
+
+
+def _usage_count(value) -> int:
+    return value if isinstance(value, int) else 0
+
+
+def cacheable(text: str, model_name: str) -> bool:
+    """Whether a prefix of ``text`` is long enough for the API to cache for this model"""
+    return estimate_tokens(text) >= min_cacheable_tokens(model_name)
+
+
+class PromptCachingAnthropicLLM(rt.llm.AnthropicLLM):
+    """Anthropic model that marks the system message as a cacheable prefix once it is long enough."""
+
+    def _to_litellm_message(self, msg) -> dict:
+        message = super()._to_litellm_message(msg)
+        content = message.get("content")
+        if message["role"] == "system" and isinstance(content, str) and cacheable(content, self._model_name):
+            message["content"] = [{"type": "text", "text": message["content"], "cache_control": CACHE_CONTROL}]
+        return message
+
+    @classmethod
+    def extract_message_info(cls, model_response, latency: float):
+        info = super().extract_message_info(model_response, latency)
+        usage = getattr(model_response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None)
+        if usage is not None:
+            # LiteLLM folds cache reads and writes into prompt_tokens
+            read = _usage_count(getattr(details, "cached_tokens", None))
+            written = _usage_count(getattr(details, "cache_creation_tokens", None))
+            total = _usage_count(getattr(usage, "prompt_tokens", None))
+            record_prompt_cache(read, written, max(total - read - written, 0))
+        return info
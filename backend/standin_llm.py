@@ -0,0 +1,290 @@
+"""Local stand-in for the Claude model, for load tests that should not spend API credits.
+
+``StandInLLM`` is a Railtracks model, so it plugs into ``AgentPool`` in place
+of ``rt.llm.AnthropicLLM`` and runs through the same ``rt.call`` code paths.
+It does not call any API. For each call it:
+
+1. waits for a time-to-first-token drawn from a configurable distribution;
+2. fails the call with probability ``error_rate``;
+3. otherwise writes a canned reply with the /predict analysis section
+   headings, at a fixed token rate.
+
+It also mimics the API's prompt cache for system messages, as
+``PromptCachingAnthropicLLM`` marks them: a prefix at least
+``STANDIN_LLM_CACHE_MIN_TOKENS`` long (by default the real model's minimum)
+is written on first use and read on later calls within five minutes. Its
+token counts go to the same /metrics counter as the real model's, so cache
+behavior can be checked without an API key.
+
+Set ``LLM_BACKEND=standin`` to serve with it; see ``StandInConfig.from_env``
+for the other variables.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import math
+import os
+import threading
+import time
+
+import numpy as np
+import railtracks as rt
+from railtracks.llm.response import MessageInfo, Response
+
+from conversation import CHARS_PER_TOKEN, estimate_tokens
+from prompt_cache import CACHE_TTL_SECONDS, min_cacheable_tokens, record_prompt_cache
+from streaming import ANALYSIS_SECTIONS
+
+LATENCY_DEFAULT = "lognormal:900,0.5"
+TOKENS_PER_SECOND_DEFAULT = 60.0
+OUTPUT_TOKENS_DEFAULT = 450
+ERROR_RATE_DEFAULT = 0.0
+# Tokens per streamed chunk, roughly what the Anthropic API sends per delta
+STREAM_CHUNK_TOKENS = 6
+
+_FILLER = (
+    "Offer a first/then board before each table-work block and pair the transition warning with a preferred item. "
+    "Keep the reinforcement schedule dense (FR1 to VR2) during demanding tasks and prompt a functional mand early. "
+    "Watch for precursor behaviors such as pacing or task refusal and record antecedents for the supervising BCBA. "
+)
+
+
+class SharedState:
+    """Random stream and prompt cache shared by every stand-in model from one factory.
+
+    Railtracks deep-copies an agent's model for each call. Plain attributes
+    would be copied too, and every call would then draw the same numbers and
+    start from an empty cache.
+    """
+
+    def __init__(self, seed: int | None = None):
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._cached_prefixes: dict[str, float] = {}  # prefix hash -> expiry (monotonic)
+
+    def __deepcopy__(self, memo) -> "SharedState":
+        return self
+
+    def draw(self, fn):
+        with self._lock:
+            return fn(self._rng)
+
+    def touch_prefix(self, prefix: str) -> bool:
+        """Whether ``prefix`` was still cached; either way it stays cached for another TTL"""
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cached_prefixes.get(key, 0.0) > now
+            self._cached_prefixes[key] = now + CACHE_TTL_SECONDS
+        return hit
+
+
+class StandInLLMError(RuntimeError):
+    """Injected failure, standing in for an overloaded or unavailable API"""
+
+
+@dataclass(frozen=True)
+class LatencyDistribution:
+    """Time to first token in milliseconds: ``fixed:<ms>``, ``uniform:<low>-<high>`` or ``lognormal:<median>,<sigma>``"""
+
+    kind: str
+    params: tuple[float, ...]
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, _, values = spec.strip().partition(":")
+        kind = kind.lower()
+        try:
+            if kind == "fixed":
+                params = (float(values),)
+            elif kind == "uniform":
+                low, high = values.split("-")
+                params = (float(low), float(high))
+            elif kind == "lognormal":
+                median, sigma = values.split(",")
+                params = (float(median), float(sigma))
+            else:
+                raise ValueError(f"unknown distribution {kind!r}")
+        except ValueError as e:
+            raise ValueError(
+                f"Invalid latency {spec!r} ({e}); use fixed:<ms>, uniform:<low>-<high> or lognormal:<median>,<sigma>"
+            ) from e
+        if any(value < 0 for value in params):
+            raise ValueError(f"Latency parameters must not be negative, got {spec!r}")
+        return cls(kind, params)
+
+    def sample_seconds(self, rng: np.random.Generator) -> float:
+        if self.kind == "fixed":
+            milliseconds = self.params[0]
+        elif self.kind == "uniform":
+            milliseconds = rng.uniform(*self.params)
+        else:
+            median, sigma = self.params
+            milliseconds = rng.lognormal(math.log(median), sigma) if median > 0 else 0.0
+        return milliseconds / 1000
+
+
+@dataclass(frozen=True)
+class StandInConfig:
+    latency: LatencyDistribution = LatencyDistribution.parse(LATENCY_DEFAULT)
+    tokens_per_second: float = TOKENS_PER_SECOND_DEFAULT
+    output_tokens: int = OUTPUT_TOKENS_DEFAULT
+    error_rate: float = ERROR_RATE_DEFAULT
+    seed: int | None = None
+    # None means the minimum the real model enforces
+    cache_min_tokens: int | None = None
+
+    @classmethod
+    def from_env(cls) -> "StandInConfig":
+        """Read STANDIN_LLM_LATENCY, _TOKENS_PER_SECOND, _OUTPUT_TOKENS, _ERROR_RATE, _SEED and _CACHE_MIN_TOKENS"""
+        seed = os.environ.get("STANDIN_LLM_SEED")
+        cache_min_tokens = os.environ.get("STANDIN_LLM_CACHE_MIN_TOKENS")
+        config = cls(
+            latency=LatencyDistribution.parse(os.environ.get("STANDIN_LLM_LATENCY", LATENCY_DEFAULT)),
+            tokens_per_second=float(os.environ.get("STANDIN_LLM_TOKENS_PER_SECOND", TOKENS_PER_SECOND_DEFAULT)),
+            output_tokens=int(os.environ.get("STANDIN_LLM_OUTPUT_TOKENS", OUTPUT_TOKENS_DEFAULT)),
+            error_rate=float(os.environ.get("STANDIN_LLM_ERROR_RATE", ERROR_RATE_DEFAULT)),
+            seed=int(seed) if seed else None,
+            cache_min_tokens=int(cache_min_tokens) if cache_min_tokens else None,
+        )
+        if config.tokens_per_second <= 0:
+            raise ValueError("STANDIN_LLM_TOKENS_PER_SECOND must be positive")
+        if not 0.0 <= config.error_rate <= 1.0:
+            raise ValueError("STANDIN_LLM_ERROR_RATE must be between 0 and 1")
+        return config
+
+    def factory(self):
+        """An ``AgentPool`` llm_factory; every model it builds shares one random stream"""
+        shared = SharedState(self.seed)
+
+        def build(model_name: str, stream: bool = False) -> "StandInLLM":
+            return StandInLLM(model_name, stream=stream, config=self, shared=shared)
+
+        return build
+
+
+def canned_reply(output_tokens: int) -> str:
+    """Reply of about ``output_tokens`` tokens laid out under the /predict analysis headings"""
+    per_section = max(output_tokens * CHARS_PER_TOKEN // len(ANALYSIS_SECTIONS), 1)
+    body = _FILLER * (per_section // len(_FILLER) + 1)
+    return "\n\n".join(f"{section}:\n{body[:per_section].rstrip()}" for section in ANALYSIS_SECTIONS)
+
+
+def _chunks(text: str, tokens_per_chunk: int = STREAM_CHUNK_TOKENS) -> list[str]:
+    size = tokens_per_chunk * CHARS_PER_TOKEN
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+class StandInLLM(rt.llm.ModelBase):
+    """Railtracks model with simulated latency, token rate and failures instead of an API call."""
+
+    def __init__(
+        self,
+        model_name: str,
+        stream: bool = False,
+        config: StandInConfig | None = None,
+        shared: SharedState | None = None,
+    ):
+        super().__init__(stream=stream)
+        self._model_name = model_name
+        self.config = config or StandInConfig()
+        self._shared = shared or SharedState(self.config.seed)
+
+    def model_name(self) -> str:
+        return self._model_name
+
+    def model_provider(self) -> rt.llm.ModelProvider:
+        return rt.llm.ModelProvider.ANTHROPIC
+
+    @classmethod
+    def model_gateway(cls) -> rt.llm.ModelProvider:
+        return rt.llm.ModelProvider.ANTHROPIC
+
+    def _plan(self, messages) -> tuple[float, bool, str]:
+        """Time to first token, whether the call fails, and the reply"""
+        def draw(rng: np.random.Generator) -> tuple[float, bool, int]:
+            # Reply lengths vary by about a fifth around the configured size
+            tokens = max(int(rng.normal(self.config.output_tokens, self.config.output_tokens * 0.2)), 1)
+            return self.config.latency.sample_seconds(rng), rng.random() < self.config.error_rate, tokens
+
+        first_token, fails, tokens = self._shared.draw(draw)
+        return first_token, fails, canned_reply(tokens)
+
+    def _input_tokens(self, messages) -> int:
+        """Input tokens, accounted against the prompt cache like the API's usage report"""
+        prefix = "".join(message.content for message in messages if message.role == "system")
+        total = sum(estimate_tokens(str(message.content)) for message in messages)
+        prefix_tokens = estimate_tokens(prefix)
+        minimum = self.config.cache_min_tokens
+        if minimum is None:
+            minimum = min_cacheable_tokens(self._model_name)
+
+        read = written = 0
+        if prefix and prefix_tokens >= minimum:
+            if self._shared.touch_prefix(prefix):
+                read = prefix_tokens
+            else:
+                written = prefix_tokens
+        record_prompt_cache(read, written, total - read - written)
+        return total
+
+    def _response(self, messages, reply: str, started: float) -> Response:
+        return Response(
+            message=rt.llm.AssistantMessage(content=reply),
+            message_info=MessageInfo(
+                input_tokens=self._input_tokens(messages),
+                output_tokens=estimate_tokens(reply),
+                latency=time.perf_counter() - started,
+                model_name=self._model_name,
+                total_cost=0.0,
+            ),
+        )
+
+    def _stream(self, messages, reply: str, started: float):
+        for chunk in _chunks(reply):
+            time.sleep(estimate_tokens(chunk) / self.config.tokens_per_second)
+            yield chunk
+        yield self._response(messages, reply, started)
+
+    def _chat(self, messages):
+        started = time.perf_counter()
+        first_token, fails, reply = self._plan(messages)
+        time.sleep(first_token)
+        if fails:
+            raise StandInLLMError("Stand-in LLM injected failure (simulated overload)")
+        if self.stream:
+            return self._stream(messages, reply, started)
+        time.sleep(estimate_tokens(reply) / self.config.tokens_per_second)
+        return self._response(messages, reply, started)
+
+    async def _astream(self, messages, reply: str, started: float):
+        for chunk in _chunks(reply):
+            await asyncio.sleep(estimate_tokens(chunk) / self.config.tokens_per_second)
+            yield chunk
+        yield self._response(messages, reply, started)
+
+    async def _achat(self, messages):
+        started = time.perf_counter()
+        first_token, fails, reply = self._plan(messages)
+        await asyncio.sleep(first_token)
+        if fails:
+            raise StandInLLMError("Stand-in LLM injected failure (simulated overload)")
+        if self.stream:
+            return self._astream(messages, reply, started)
+        await asyncio.sleep(estimate_tokens(reply) / self.config.tokens_per_second)
+        return self._response(messages, reply, started)
+
+    def _structured(self, messages, schema):
+        raise NotImplementedError("The stand-in LLM only produces plain text replies")
+
+    async def _astructured(self, messages, schema):
+        raise NotImplementedError("The stand-in LLM only produces plain text replies")
+
+    def _chat_with_tools(self, messages, tools):
+        return self._chat(messages)
+
+    async def _achat_with_tools(self, messages, tools):
+        return await self._achat(messages)
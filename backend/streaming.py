@@ -0,0 +1,129 @@
+"""Server-sent event framing for streamed Claude replies.
+
+Both servers stream the same events:
+
+- ``prediction``: the risk score payload (``/predict`` only, sent before any LLM output)
+- ``token``: ``{"text": ...}`` for every chunk as it arrives from the model
+- ``section_start`` / ``section_end``: emitted as each analysis heading completes;
+  ``section_end`` carries the finished section text
+- ``done``: the same JSON body the non-streaming endpoint would have returned
+- ``error``: ``{"error": ...}`` if the call fails after the stream has started
+"""
+
+from __future__ import annotations
+
+from typing import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator
+import json
+import re
+
+ANALYSIS_SECTIONS = (
+    "BEHAVIORAL ANALYSIS",
+    "KEY RISK FACTORS",
+    "PROTECTIVE FACTORS",
+    "ACTIONABLE RECOMMENDATIONS",
+    "MONITORING PRIORITIES",
+)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Markdown emphasis the model sometimes wraps headings in
+_HEADING_NOISE = " \t\r\n*#_:"
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def wants_stream(data, accept: str | None) -> bool:
+    """Stream when the body sets "stream": true or the client asks for text/event-stream"""
+    if isinstance(data, dict) and data.get("stream") is not None:
+        return bool(data.get("stream"))
+    return "text/event-stream" in (accept or "")
+
+
+class SectionStream:
+    """Accumulates streamed text and reports when section headings complete.
+
+    A heading counts as complete once its trailing colon has arrived, so a
+    heading split across chunks is only reported once it is whole. Sections are
+    matched in order; a heading the model skips is simply never reported.
+    """
+
+    def __init__(self, sections: Iterable[str] = ()):
+        self.sections = tuple(sections)
+        self.text = ""
+        self._patterns = [re.compile(re.escape(name) + r"\W{0,4}:", re.IGNORECASE) for name in self.sections]
+        self._next = 0  # index of the next heading to look for
+        self._current: int | None = None
+        self._body_start = 0
+
+    def feed(self, chunk: str) -> list[str]:
+        self.text += chunk
+        frames = [sse_event("token", {"text": chunk})]
+        while self._next < len(self.sections):
+            match = self._find_next_heading()
+            if match is None:
+                break
+            index, heading = match
+            if self._current is not None:
+                frames.append(self._section_end(heading.start()))
+            frames.append(sse_event("section_start", {"name": self.sections[index], "index": index}))
+            self._current = index
+            self._body_start = heading.end()
+            self._next = index + 1
+        return frames
+
+    def close(self) -> list[str]:
+        if self._current is None:
+            return []
+        frame = self._section_end(len(self.text))
+        self._current = None
+        return [frame]
+
+    def _find_next_heading(self) -> tuple[int, re.Match] | None:
+        # Search from the end of the last heading so the same heading never matches twice
+        for index in range(self._next, len(self.sections)):
+            match = self._patterns[index].search(self.text, self._body_start)
+            if match is not None:
+                return index, match
+        return None
+
+    def _section_end(self, end: int) -> str:
+        body = self.text[self._body_start:end].strip(_HEADING_NOISE)
+        return sse_event("section_end", {
+            "name": self.sections[self._current],
+            "index": self._current,
+            "text": body,
+        })
+
+
+def sse_frames(
+    chunks: Iterable[str],
+    finish: Callable[[str], dict],
+    sections: Iterable[str] = (),
+) -> Iterator[str]:
+    """SSE frames for a blocking chunk iterator; ``finish`` builds the ``done`` payload from the full text"""
+    stream = SectionStream(sections)
+    try:
+        for chunk in chunks:
+            yield from stream.feed(chunk)
+        yield from stream.close()
+        yield sse_event("done", finish(stream.text.strip()))
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+
+
+async def asse_frames(
+    chunks: AsyncIterable[str],
+    finish: Callable[[str], dict],
+    sections: Iterable[str] = (),
+) -> AsyncIterator[str]:
+    """Async twin of sse_frames for the ASGI server"""
+    stream = SectionStream(sections)
+    try:
+        async for chunk in chunks:
+            for frame in stream.feed(chunk):
+                yield frame
+        for frame in stream.close():
+            yield frame
+        yield sse_event("done", finish(stream.text.strip()))
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
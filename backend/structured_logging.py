@@ -0,0 +1,159 @@
+"""Leveled, sampled JSON logging for the backend servers.
+
+Records are formatted as one JSON object per line and written by a
+background QueueListener, so request threads only pay for an in-memory
+queue put. DEBUG and INFO records can be sampled per endpoint; warnings and
+errors are always kept.
+
+Configuration (environment):
+
+- ``LOG_LEVEL``: minimum level, default ``INFO``
+- ``LOG_SAMPLE_RATES``: per-endpoint rates such as ``/predict=0.1,/chat=1``;
+  the longest matching path prefix wins
+- ``LOG_SAMPLE_RATE``: rate for endpoints not listed, default ``1``
+"""
+
+from __future__ import annotations
+
+from contextvars import ContextVar
+from datetime import datetime, timezone
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+LOGGER_NAMESPACE = "aba"
+
+_endpoint: ContextVar[str | None] = ContextVar("log_endpoint", default=None)
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: logging.handlers.QueueHandler | None = None
+_sample_rates: dict[str, float] = {}
+_default_sample_rate = 1.0
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAMESPACE}.{name}")
+
+
+def parse_sample_rates(spec: str | None) -> dict[str, float]:
+    rates = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        path, _, rate = item.partition("=")
+        value = float(rate)
+        if not 0.0 <= value <= 1.0:
+            raise ValueError(f"Log sample rate for {path.strip()} must be between 0 and 1, got {rate}")
+        rates[path.strip()] = value
+    return rates
+
+
+def sample_rate_for(path: str) -> float:
+    best, best_length = _default_sample_rate, -1
+    for prefix, rate in _sample_rates.items():
+        matches = path == prefix or path.startswith(prefix.rstrip("/") + "/")
+        if matches and len(prefix) > best_length:
+            best, best_length = rate, len(prefix)
+    return best
+
+
+def begin_request(path: str) -> None:
+    """Tag this request's records with its endpoint and decide once whether to sample it"""
+    rate = sample_rate_for(path)
+    _endpoint.set(path)
+    _sampled.set(rate >= 1.0 or random.random() < rate)
+
+
+def debug_enabled(logger: logging.Logger) -> bool:
+    """Guard for expensive debug payloads: False unless DEBUG is on and this request is sampled"""
+    return logger.isEnabledFor(logging.DEBUG) and _sampled.get()
+
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.endpoint = _endpoint.get()
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class _StructuredQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock handler folds the traceback into msg; keep it as its own field instead
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        endpoint = getattr(record, "endpoint", None)
+        if endpoint:
+            entry["endpoint"] = endpoint
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def configure_logging() -> logging.Logger:
+    """Install the queue-backed JSON handler on the namespace logger (idempotent)"""
+    global _listener, _queue_handler, _sample_rates, _default_sample_rate
+
+    root = logging.getLogger(LOGGER_NAMESPACE)
+    if _listener is not None:
+        return root
+
+    _sample_rates = parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES"))
+    _default_sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", "1"))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = _StructuredQueueHandler(log_queue)
+    # Filter on the producer side so dropped records never reach the queue
+    _queue_handler.addFilter(SamplingFilter())
+
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    root.addHandler(_queue_handler)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_stop_listener)
+    # Forked workers inherit the queue but not the listener thread
+    os.register_at_fork(after_in_child=_restart_listener)
+    return root
+
+
+def _stop_listener() -> None:
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_listener() -> None:
+    # The inherited queue may be mid-operation in the dead listener thread, and its pending
+    # records are the parent's to write; start over on a fresh queue
+    global _listener
+    if _listener is not None:
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        _queue_handler.queue = log_queue
+        _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers)
+        _listener.start()
@@ -0,0 +1,6 @@
+"""Backend scripts import their sibling modules directly, so put backend/ on the path."""
+
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
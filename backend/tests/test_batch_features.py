@@ -0,0 +1,38 @@
+"""Batch feature building keeps going past learners with bad fields."""
+
+from __future__ import annotations
+
+import numpy as np
+
+from features import build_feature_frame, extract_weather
+from train_model import NUMERIC_FEATURES
+
+
+def learner(sleep_quality) -> dict:
+    return {
+        "sleep_quality_numeric": sleep_quality,
+        "time_numeric": 1030,
+        "weekday_numeric": 2,
+        "meals": [],
+        "bathroomVisits": [],
+    }
+
+
+def test_non_numeric_field_fails_only_its_row():
+    payloads = [learner(3), learner("abc"), learner(2)]
+    features, row_indexes, calculated, errors = build_feature_frame(payloads, weather_values=extract_weather(None))
+
+    assert list(errors) == [1]
+    assert "sleep_quality_numeric" in errors[1]
+    assert row_indexes == [0, 2]
+    assert len(calculated) == 2
+    assert list(features.columns) == NUMERIC_FEATURES
+    assert (features.dtypes == np.float64).all()
+    assert features["sleep_quality_numeric"].tolist() == [3.0, 2.0]
+
+
+def test_all_rows_bad_gives_empty_frame():
+    features, row_indexes, _, errors = build_feature_frame([learner("abc")], weather_values=extract_weather(None))
+
+    assert row_indexes == [] and list(errors) == [0]
+    assert features.shape == (0, len(NUMERIC_FEATURES))
@@ -0,0 +1,114 @@
+"""Parity of the compiled forest with the sklearn pipeline it is exported from."""
+
+from __future__ import annotations
+
+import struct
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from compiled_forest import ARRAY_ALIGNMENT, POSITIVE_LABEL, CompiledForest
+from generate_synthetic_data import generate_samples
+from inference import feature_matrix
+from train_model import NUMERIC_FEATURES, TARGET_COLUMN, build_pipeline
+
+SEED = 7
+
+
+@pytest.fixture(scope="module")
+def samples():
+    return generate_samples(2000, seed=SEED)
+
+
+@pytest.fixture(scope="module")
+def pipeline(samples):
+    X = samples[NUMERIC_FEATURES].astype(np.float64)
+    # Blank out some values so the trees learn where missing inputs go
+    rng = np.random.default_rng(SEED)
+    X = X.mask(rng.random(X.shape) < 0.05)
+    pipeline = build_pipeline(SEED, {"n_estimators": 25, "max_depth": 10})
+    pipeline.named_steps["clf"].set_params(n_jobs=1)
+    return pipeline.fit(X, samples[TARGET_COLUMN])
+
+
+@pytest.fixture(scope="module")
+def compiled(pipeline):
+    return CompiledForest.from_pipeline(pipeline)
+
+
+def expected_positive(pipeline, X: np.ndarray) -> np.ndarray:
+    frame = pd.DataFrame(X.astype(np.float64), columns=NUMERIC_FEATURES)
+    return pipeline.predict_proba(frame)[:, list(pipeline.classes_).index(POSITIVE_LABEL)]
+
+
+def test_matches_pipeline(pipeline, compiled, samples):
+    X = samples[NUMERIC_FEATURES].to_numpy(dtype=np.float32)
+    np.testing.assert_allclose(compiled.predict_positive(X), expected_positive(pipeline, X), rtol=0, atol=1e-12)
+
+
+def test_single_row_matches_batch(compiled, samples):
+    X = samples[NUMERIC_FEATURES].to_numpy(dtype=np.float32)[:50]
+    single = np.concatenate([compiled.predict_positive(row) for row in X])
+    np.testing.assert_array_equal(single, compiled.predict_positive(X))
+
+
+def test_missing_values_follow_missing_right(pipeline, compiled, samples):
+    X = samples[NUMERIC_FEATURES].to_numpy(dtype=np.float32)[:300].copy()
+    rng = np.random.default_rng(SEED + 1)
+    X[rng.random(X.shape) < 0.2] = np.nan
+    # Rows the serving path builds from JSON with null features
+    rows = samples[NUMERIC_FEATURES].head(20).to_dict("records")
+    for index, row in enumerate(rows):
+        row[NUMERIC_FEATURES[index % len(NUMERIC_FEATURES)]] = None
+    X = np.vstack([X, feature_matrix(rows)])
+
+    assert compiled.missing_right.any() and not compiled.missing_right.all()
+    expected = expected_positive(pipeline, X)
+    np.testing.assert_allclose(compiled.predict_positive(X), expected, rtol=0, atol=1e-12)
+    single = np.concatenate([compiled.predict_positive(row) for row in X])
+    np.testing.assert_allclose(single, expected, rtol=0, atol=1e-12)
+
+
+def test_predict_proba_columns(compiled, samples):
+    proba = compiled.predict_proba(samples[NUMERIC_FEATURES].to_numpy(dtype=np.float32)[:10])
+    assert proba.shape == (10, 2)
+    np.testing.assert_allclose(proba.sum(axis=1), 1.0)
+
+
+@pytest.mark.parametrize("mmap_arrays", [False, True])
+def test_save_load_round_trip(compiled, samples, tmp_path, mmap_arrays):
+    path = compiled.save(tmp_path / "forest.npz")
+    loaded = CompiledForest.load(path, mmap_arrays=mmap_arrays)
+
+    for name in ("feature", "threshold", "children", "missing_right", "value", "roots"):
+        original, restored = getattr(compiled, name), getattr(loaded, name)
+        assert restored.dtype == original.dtype
+        np.testing.assert_array_equal(restored, original)
+    assert loaded.max_depth == compiled.max_depth
+    assert loaded.feature_names == compiled.feature_names
+
+    X = samples[NUMERIC_FEATURES].to_numpy(dtype=np.float32)[:100]
+    np.testing.assert_array_equal(loaded.predict_positive(X), compiled.predict_positive(X))
+
+
+def test_saved_members_are_aligned(compiled, tmp_path):
+    path = compiled.save(tmp_path / "forest.npz")
+    with path.open("rb") as f, zipfile.ZipFile(f) as archive:
+        members = archive.infolist()
+        assert members and all(member.compress_type == zipfile.ZIP_STORED for member in members)
+        for member in members:
+            f.seek(member.header_offset)
+            name_length, extra_length = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(member.header_offset + 30 + name_length + extra_length)
+            if np.lib.format.read_magic(f) == (1, 0):
+                np.lib.format.read_array_header_1_0(f)
+            else:
+                np.lib.format.read_array_header_2_0(f)
+            assert f.tell() % ARRAY_ALIGNMENT == 0, member.filename
+
+    for name, array in np.load(path).items():
+        np.testing.assert_array_equal(array, np.asarray(getattr(compiled, name)))
+    mapped = CompiledForest.load(path, mmap_arrays=True)
+    assert all(getattr(mapped, name).flags.aligned for name in ("feature", "threshold", "children", "value"))
@@ -0,0 +1,43 @@
+"""Stores backed by one SQLite file behave as one store across processes.
+
+Two store objects on the same file stand in for two pre-forked workers.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+import weather_store
+from analysis_jobs import DONE, PENDING, AnalysisStore
+from weather_store import AmbiguousLocationError, WeatherStore
+
+
+def test_analysis_job_is_visible_to_other_workers(tmp_path):
+    runner = AnalysisStore(db_path=tmp_path / "jobs.sqlite3")
+    other = AnalysisStore(db_path=tmp_path / "jobs.sqlite3")
+
+    job = runner.create()
+    snapshot = other.get(job.analysis_id)
+    assert snapshot is not None and snapshot.status == PENDING and not snapshot.done.is_set()
+
+    runner.complete(job, "Plan the transition early.")
+    finished = other.wait(job.analysis_id, timeout=1.0)
+    assert finished.status == DONE and finished.done.is_set()
+    assert finished.to_dict()["analysis"] == "Plan the transition early."
+    assert other.get("unknown") is None
+
+
+def test_weather_posted_to_one_worker_reaches_the_others(tmp_path, monkeypatch):
+    monkeypatch.setattr(weather_store, "WEATHER_SYNC_SECONDS", 0.0)
+    first = WeatherStore(db_path=tmp_path / "weather.sqlite3")
+    second = WeatherStore(db_path=tmp_path / "weather.sqlite3")
+
+    first.put({"location": "Site A", "temperature": 31, "humidity": 80, "condition": "Rain"})
+    assert second.get().values == first.get().values
+    assert second.get("site a").location == "Site A"
+
+    second.put({"location": "Site B", "temperature": 10, "humidity": 20, "condition": "Clear"})
+    with pytest.raises(AmbiguousLocationError):
+        first.get()
+    assert first.get("Site B").values["temperature"] == 10
+    assert first.get("Site A").values["temperature"] == 31
@@ -3,25 +3,46 @@ from __future__ import annotations
 """Training pipeline for the ABA Forecast stress-level classifier."""
 
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
 import argparse
 import json
-from typing import Iterable
+import os
+import time
+import warnings
+from typing import TYPE_CHECKING
 
 import joblib
 import numpy as np
 import pandas as pd
 from sklearn.compose import ColumnTransformer
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report, f1_score
+from sklearn.metrics import accuracy_score, classification_report
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 
+from dataset_io import peak_rss_mb, read_columns
+from evaluation import best_macro_f1_threshold, evaluation_report, threshold_curve
+
+if TYPE_CHECKING:
+    from model_search import SearchConfig
+
 DATA_FILE_DEFAULT = Path("backend") / "data" / "synthetic_behavior_data.csv"
 MODEL_DIR_DEFAULT = Path("backend") / "models"
 MODEL_FILENAME = "behavior_predictor.joblib"
 METRICS_FILENAME = "behavior_predictor_metrics.json"
+EVALUATION_FILENAME = "behavior_predictor_evaluation.json"
+FOREST_FILENAME = "behavior_predictor_forest.npz"
+SEARCH_FILENAME = "behavior_predictor_search.json"
+# Held-out rows kept with each artifact; incremental retrains re-tune the threshold on them
+VALIDATION_FILENAME = "behavior_predictor_validation.csv.gz"
+VALIDATION_WINDOW_DEFAULT = 20_000
+NEW_TREES_DEFAULT = 50
+# Versioned artifacts live in <model dir>/versions/<version>/; the metrics file is written last
+VERSIONS_DIRNAME = "versions"
+# Name for the unversioned artifact directly in the model directory
+BASE_VERSION = "base"
 
 
 @dataclass(frozen=True)
@@ -30,6 +51,19 @@ class TrainConfig:
     model_dir: Path
     test_size: float
     random_seed: int
+    version: str | None = None
+    search: SearchConfig | None = None
+    incremental: IncrementalConfig | None = None
+    validation_window: int = VALIDATION_WINDOW_DEFAULT
+
+
+@dataclass(frozen=True)
+class IncrementalConfig:
+    # None extends the newest complete version, or the unversioned artifact when there is none
+    base_version: str | None = None
+    new_trees: int = NEW_TREES_DEFAULT
+    # None keeps the base model's forest size
+    max_trees: int | None = None
 
 
 CATEGORICAL_FEATURES = [
@@ -50,15 +84,17 @@ NUMERIC_FEATURES = [
     "social_context_numeric",
 ]
 
-DROP_COLUMNS = [
-    "behaviour_topography",
-    "antecedent_category_numeric",
-    "function_inferred_numeric",
-    "behaviour_level",
-]
 TARGET_COLUMN = "escalation_label"
 TOP_FEATURE_LIMIT = 10
 
+# Forest hyperparameters when no search has picked others
+FOREST_PARAMS_DEFAULT = {
+    "n_estimators": 300,
+    "max_depth": None,
+    "min_samples_split": 4,
+    "min_samples_leaf": 2,
+}
+
 
 def parse_args() -> TrainConfig:
     parser = argparse.ArgumentParser(description="Train behavior stress-level classifier")
@@ -66,7 +102,7 @@ def parse_args() -> TrainConfig:
         "--data-path",
         type=Path,
         default=DATA_FILE_DEFAULT,
-        help="Path to the CSV dataset",
+        help="CSV, Parquet or Arrow file, or a directory of shards from generate_synthetic_data.py",
     )
     parser.add_argument(
         "--model-dir",
@@ -86,25 +122,190 @@ def parse_args() -> TrainConfig:
         default=42,
         help="Random seed for reproducibility",
     )
+    parser.add_argument(
+        "--version",
+        nargs="?",
+        const="auto",
+        default=None,
+        help="Write a versioned artifact under <model-dir>/versions/ for the serving registry "
+        "(a UTC timestamp when no name is given)",
+    )
+    parser.add_argument(
+        "--validation-window",
+        type=int,
+        default=VALIDATION_WINDOW_DEFAULT,
+        help="Most recent held-out rows kept with the artifact for re-tuning the threshold in incremental retrains",
+    )
+
+    incremental = parser.add_argument_group("incremental retraining")
+    incremental.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Add trees fitted on --data-path (only the new rows) to the current model instead of refitting it",
+    )
+    incremental.add_argument(
+        "--base-version",
+        default=None,
+        help="Version to extend (default: the newest one, else the unversioned model in --model-dir)",
+    )
+    incremental.add_argument(
+        "--new-trees",
+        type=int,
+        default=NEW_TREES_DEFAULT,
+        help="Trees to fit on the new rows",
+    )
+    incremental.add_argument(
+        "--max-trees",
+        type=int,
+        default=None,
+        help="Forest size cap; the oldest trees are dropped beyond it (default: the base model's size)",
+    )
+    # Imported here because model_search itself imports build_pipeline from this module
+    import model_search
+
+    search = parser.add_argument_group("hyperparameter search")
+    search.add_argument(
+        "--search",
+        choices=model_search.SEARCH_MODES,
+        default=None,
+        help="Pick the forest hyperparameters by stratified k-fold CV on the training split before the final fit",
+    )
+    search.add_argument(
+        "--search-space",
+        type=Path,
+        default=None,
+        help="JSON file mapping forest parameters to lists of values (default: a small built-in grid)",
+    )
+    search.add_argument(
+        "--search-iterations",
+        type=int,
+        default=model_search.RANDOM_ITERATIONS_DEFAULT,
+        help="Candidates sampled by --search random",
+    )
+    search.add_argument("--folds", type=int, default=model_search.FOLDS_DEFAULT, help="Cross-validation folds")
+    search.add_argument(
+        "--search-workers",
+        type=int,
+        default=None,
+        help="Worker processes fitting candidates (default: one per CPU)",
+    )
+    search.add_argument(
+        "--search-cache",
+        type=Path,
+        default=None,
+        help=f"Directory for fold data and per-fold results (default: <model-dir>/{model_search.SEARCH_CACHE_DIRNAME})",
+    )
+    search.add_argument(
+        "--latency-budget-ms",
+        type=float,
+        default=model_search.LATENCY_BUDGET_MS_DEFAULT,
+        help="Slowest median single-row scoring time a candidate may have",
+    )
+    search.add_argument(
+        "--latency-weight",
+        type=float,
+        default=model_search.LATENCY_WEIGHT_DEFAULT,
+        help="Macro-F1 a candidate gives up for using its whole latency budget",
+    )
 
     args = parser.parse_args()
+    if args.validation_window < 1:
+        parser.error("--validation-window must be positive")
+    incremental_config = None
+    if args.incremental:
+        if args.search:
+            parser.error("--search refits the whole forest; it cannot be combined with --incremental")
+        if args.new_trees < 1 or (args.max_trees is not None and args.max_trees < args.new_trees):
+            parser.error("--new-trees must be positive and --max-trees at least --new-trees")
+        incremental_config = IncrementalConfig(
+            base_version=args.base_version,
+            new_trees=args.new_trees,
+            max_trees=args.max_trees,
+        )
+    search_config = None
+    if args.search:
+        if args.folds < 2 or args.search_iterations < 1 or args.latency_budget_ms <= 0:
+            parser.error("--folds must be at least 2; --search-iterations and --latency-budget-ms must be positive")
+        space = model_search.SEARCH_SPACE_DEFAULT
+        if args.search_space:
+            space = model_search.load_search_space(args.search_space)
+        search_config = model_search.SearchConfig(
+            mode=args.search,
+            space=space,
+            iterations=args.search_iterations,
+            folds=args.folds,
+            workers=args.search_workers,
+            cache_dir=args.search_cache or args.model_dir / model_search.SEARCH_CACHE_DIRNAME,
+            latency_budget_ms=args.latency_budget_ms,
+            latency_weight=args.latency_weight,
+        )
     return TrainConfig(
         data_path=args.data_path,
         model_dir=args.model_dir,
         test_size=args.test_size,
         random_seed=args.seed,
+        version=new_version_name() if args.version == "auto" else args.version,
+        search=search_config,
+        incremental=incremental_config,
+        validation_window=args.validation_window,
     )
 
 
-def load_dataset(path: Path) -> pd.DataFrame:
-    if not path.exists():
-        raise FileNotFoundError(
-            f"Dataset not found at {path}. Generate it first using generate_synthetic_data.py"
+def new_version_name() -> str:
+    """Timestamp version names sort in training order"""
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def artifact_dir(model_dir: Path, version: str | None) -> Path:
+    return model_dir / VERSIONS_DIRNAME / version if version else model_dir
+
+
+def version_sequence(version_dir: Path) -> int:
+    """Creation order of a versioned artifact; 0 for artifacts written before sequences existed"""
+    try:
+        with (version_dir / METRICS_FILENAME).open("r", encoding="utf-8") as f:
+            sequence = json.load(f).get("version_sequence", 0)
+    except (OSError, ValueError):
+        return 0
+    return sequence if isinstance(sequence, int) else 0
+
+
+def complete_versions(model_dir: Path) -> list[str]:
+    """Versioned artifacts whose metrics file has been written, oldest first.
+
+    Ordered by the creation sequence recorded in each metrics file, not by
+    name, so ``v10`` comes after ``v9`` whatever the names are.
+    """
+    versions_dir = model_dir / VERSIONS_DIRNAME
+    if not versions_dir.is_dir():
+        return []
+    names = [
+        entry.name
+        for entry in versions_dir.iterdir()
+        if (entry / METRICS_FILENAME).is_file() and (entry / MODEL_FILENAME).is_file()
+    ]
+    return sorted(names, key=lambda name: (version_sequence(versions_dir / name), name))
+
+
+def next_version_sequence(model_dir: Path) -> int:
+    versions = complete_versions(model_dir)
+    return version_sequence(model_dir / VERSIONS_DIRNAME / versions[-1]) + 1 if versions else 1
+
+
+def check_new_version(model_dir: Path, version: str | None) -> None:
+    """Refuse to overwrite an existing version, which may be the one being served"""
+    if version and artifact_dir(model_dir, version).exists():
+        raise FileExistsError(
+            f"Model version {version!r} already exists in {model_dir / VERSIONS_DIRNAME}; pick a new name"
         )
-    return pd.read_csv(path)
 
 
-def build_pipeline(random_seed: int) -> Pipeline:
+def load_dataset(path: Path) -> pd.DataFrame:
+    """Only the model's feature and target columns, downcast to the smallest dtypes that hold them"""
+    return read_columns(path, NUMERIC_FEATURES + [TARGET_COLUMN])
+
+
+def build_pipeline(random_seed: int, forest_params: dict | None = None) -> Pipeline:
     preprocess = ColumnTransformer(
         transformers=[
             (
@@ -117,10 +318,7 @@ def build_pipeline(random_seed: int) -> Pipeline:
     )
 
     model = RandomForestClassifier(
-        n_estimators=300,
-        max_depth=None,
-        min_samples_split=4,
-        min_samples_leaf=2,
+        **{**FOREST_PARAMS_DEFAULT, **(forest_params or {})},
         class_weight="balanced_subsample",
         n_jobs=-1,
         random_state=random_seed,
@@ -165,78 +363,247 @@ def aggregate_feature_importance(
 
 
 def optimize_threshold(y_true: pd.Series, y_proba: np.ndarray) -> tuple[float, float]:
-    thresholds = np.linspace(0.1, 0.9, 81)
-    best_threshold = 0.5
-    best_macro_f1 = -1.0
-
-    for threshold in thresholds:
-        y_pred = (y_proba >= threshold).astype(int)
-        macro = f1_score(y_true, y_pred, average="macro")
-        if macro > best_macro_f1:
-            best_macro_f1 = macro
-            best_threshold = float(threshold)
+    """Exact macro-F1 optimum over every distinct validation score"""
+    return best_macro_f1_threshold(threshold_curve(y_true, y_proba))
 
-    return best_threshold, best_macro_f1
 
+def export_compiled_forest(pipeline: Pipeline, path: Path) -> Path:
+    """Flatten the fitted scaler + forest into NumPy node arrays for the serving engine."""
+    # Imported here because compiled_forest itself imports the feature lists from this module
+    from compiled_forest import CompiledForest
 
-def train(config: TrainConfig) -> dict[str, float | str]:
-    df = load_dataset(config.data_path)
-    df = df.drop(columns=[col for col in DROP_COLUMNS if col in df.columns])
-
-    if TARGET_COLUMN not in df.columns:
-        raise ValueError(f"Target column '{TARGET_COLUMN}' missing from dataset")
+    return CompiledForest.from_pipeline(pipeline).save(path)
 
-    X = df.drop(columns=[TARGET_COLUMN])
-    y = df[TARGET_COLUMN]
 
-    X_train, X_val, y_train, y_val = train_test_split(
-        X,
-        y,
-        test_size=config.test_size,
-        random_state=config.random_seed,
-        stratify=y,
-    )
+def load_training_data(path: Path) -> tuple[pd.DataFrame, dict]:
+    start = time.perf_counter()
+    df = load_dataset(path)
+    data_loading = {
+        "rows": int(len(df)),
+        "seconds": round(time.perf_counter() - start, 3),
+        "memory_mb": round(df.memory_usage(index=False).sum() / 2**20, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    return df, data_loading
 
-    pipeline = build_pipeline(config.random_seed)
-    pipeline.fit(X_train, y_train)
 
+def save_artifacts(
+    pipeline: Pipeline,
+    output_dir: Path,
+    X_val: pd.DataFrame,
+    y_val: pd.Series,
+    validation_window: int,
+    extra_metrics: dict,
+) -> dict:
+    """Tune the threshold on the validation rows, then write the model, compiled forest, evaluation and metrics"""
     y_proba = pipeline.predict_proba(X_val)[:, 1]
-    best_threshold, best_macro_f1 = optimize_threshold(y_val, y_proba)
+    evaluation = evaluation_report(y_val, y_proba)
+    best_threshold, best_macro_f1 = evaluation["best_threshold"], evaluation["best_macro_f1"]
     y_pred = (y_proba >= best_threshold).astype(int)
 
     accuracy = accuracy_score(y_val, y_pred)
     macro_f1 = best_macro_f1
     report = classification_report(y_val, y_pred, output_dict=True)
 
-    config.model_dir.mkdir(parents=True, exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
 
-    model_path = config.model_dir / MODEL_FILENAME
+    model_path = output_dir / MODEL_FILENAME
     joblib.dump(pipeline, model_path)
 
+    forest_path = export_compiled_forest(pipeline, output_dir / FOREST_FILENAME)
+
     feature_importance = aggregate_feature_importance(pipeline)
 
+    evaluation_path = output_dir / EVALUATION_FILENAME
+    with evaluation_path.open("w", encoding="utf-8") as f:
+        json.dump(evaluation, f, indent=2)
+
+    validation_path = output_dir / VALIDATION_FILENAME
+    window = X_val.tail(validation_window).assign(**{TARGET_COLUMN: y_val.tail(validation_window)})
+    window.to_csv(validation_path, index=False, compression="gzip")
+
     metrics = {
         "accuracy": round(float(accuracy), 4),
         "macro_f1": round(float(macro_f1), 4),
-        "class_distribution": dict(pd.Series(y).value_counts(normalize=True).round(4)),
         "classification_report": report,
         "model_path": str(model_path.resolve()),
-        "train_samples": int(len(X_train)),
+        "compiled_forest_path": str(forest_path.resolve()),
         "val_samples": int(len(X_val)),
         "top_feature_importance": feature_importance,
-        "decision_threshold": round(best_threshold, 3),
+        "decision_threshold": best_threshold,
+        "roc_auc": evaluation["roc_auc"],
+        "average_precision": evaluation["average_precision"],
+        "brier_score": evaluation["brier_score"],
+        "expected_calibration_error": evaluation["expected_calibration_error"],
+        "evaluation_path": str(evaluation_path.resolve()),
+        "validation_path": str(validation_path.resolve()),
+        **extra_metrics,
+        "peak_rss_mb": peak_rss_mb(),
     }
 
-    metrics_path = config.model_dir / METRICS_FILENAME
-    with metrics_path.open("w", encoding="utf-8") as f:
+    # The metrics file marks a complete artifact for the model registry, so write it last and atomically
+    metrics_path = output_dir / METRICS_FILENAME
+    tmp_path = metrics_path.with_suffix(".json.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
         json.dump(metrics, f, indent=2)
+    os.replace(tmp_path, metrics_path)
 
     return metrics
 
 
+def train(config: TrainConfig) -> dict[str, float | str]:
+    if config.incremental:
+        return train_incremental(config)
+    check_new_version(config.model_dir, config.version)
+
+    df, data_loading = load_training_data(config.data_path)
+    X = df[NUMERIC_FEATURES]
+    y = df[TARGET_COLUMN]
+
+    X_train, X_val, y_train, y_val = train_test_split(
+        X,
+        y,
+        test_size=config.test_size,
+        random_state=config.random_seed,
+        stratify=y,
+    )
+
+    search_report = None
+    forest_params = dict(FOREST_PARAMS_DEFAULT)
+    if config.search:
+        # Imported here because model_search itself imports build_pipeline from this module
+        from model_search import search
+
+        # Only the training split is searched, so the validation metrics below stay unbiased
+        search_report = search(X_train, y_train, config.search, config.random_seed, config.search.cache_dir)
+        forest_params.update(search_report["best"]["params"])
+
+    pipeline = build_pipeline(config.random_seed, forest_params)
+    pipeline.fit(X_train, y_train)
+
+    output_dir = artifact_dir(config.model_dir, config.version)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    extra_metrics = {
+        "class_distribution": dict(pd.Series(y).value_counts(normalize=True).round(4)),
+        "train_samples": int(len(X_train)),
+        "forest_params": forest_params,
+        "data_loading": data_loading,
+    }
+    if search_report is not None:
+        search_path = output_dir / SEARCH_FILENAME
+        with search_path.open("w", encoding="utf-8") as f:
+            json.dump(search_report, f, indent=2)
+        extra_metrics["search"] = {
+            "mode": search_report["mode"],
+            "folds": search_report["folds"],
+            "candidates": search_report["candidates"],
+            "cv_macro_f1": search_report["best"]["cv_macro_f1"],
+            "latency_ms": search_report["best"]["latency_ms"],
+            "latency_budget_ms": search_report["latency_budget_ms"],
+            "report_path": str(search_path.resolve()),
+        }
+    if config.version:
+        extra_metrics["model_version"] = config.version
+        extra_metrics["version_sequence"] = next_version_sequence(config.model_dir)
+
+    return save_artifacts(pipeline, output_dir, X_val, y_val, config.validation_window, extra_metrics)
+
+
+def train_incremental(config: TrainConfig) -> dict[str, float | str]:
+    """Extend the current forest with trees fitted on only the new rows at ``config.data_path``.
+
+    The newest ``test_size`` share of the new rows is held out and appended to
+    the base artifact's validation window, which keeps its most recent
+    ``validation_window`` rows. The remaining new rows are scaled with the base
+    model's scaler, which the existing trees' split thresholds depend on, and
+    ``new_trees`` trees are fitted on them with ``warm_start``. The oldest
+    trees are then dropped to keep the forest at ``max_trees``. The decision
+    threshold is re-tuned on the window, and the result is written as a new
+    version.
+    """
+    incremental = config.incremental
+    version = config.version or new_version_name()
+    check_new_version(config.model_dir, version)
+    versions = complete_versions(config.model_dir)
+    base_version = incremental.base_version or (versions[-1] if versions else None)
+    base_dir = artifact_dir(config.model_dir, base_version)
+    if not (base_dir / MODEL_FILENAME).exists():
+        raise FileNotFoundError(f"No model to extend at {base_dir}. Train one first without --incremental")
+    pipeline: Pipeline = joblib.load(base_dir / MODEL_FILENAME)
+    base_metrics = {}
+    if (base_dir / METRICS_FILENAME).exists():
+        with (base_dir / METRICS_FILENAME).open("r", encoding="utf-8") as f:
+            base_metrics = json.load(f)
+
+    df, data_loading = load_training_data(config.data_path)
+    # Rows are in arrival order, so the newest ones validate the forest that the older ones extend
+    held_out = min(max(int(len(df) * config.test_size), 1), len(df) - 1)
+    new_rows, new_val = df.iloc[:-held_out], df.iloc[-held_out:]
+    if new_rows[TARGET_COLUMN].nunique() < 2:
+        raise ValueError("The new rows must contain both classes to fit trees on")
+
+    window = new_val
+    base_window_path = base_dir / VALIDATION_FILENAME
+    if base_window_path.exists():
+        window = pd.concat([load_dataset(base_window_path), new_val], ignore_index=True)
+    window = window.tail(config.validation_window)
+
+    forest: RandomForestClassifier = pipeline.named_steps["clf"]
+    base_trees = len(forest.estimators_)
+    max_trees = incremental.max_trees or base_trees
+    generation = base_metrics.get("forest_generation", 0) + 1
+    X_new = pipeline.named_steps["preprocess"].transform(new_rows[NUMERIC_FEATURES])
+    forest.set_params(
+        warm_start=True,
+        n_estimators=base_trees + incremental.new_trees,
+        # A fresh seed per generation, so new trees never repeat an aged-out tree's bootstrap
+        random_state=config.random_seed + generation,
+    )
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        # balanced_subsample weighs classes within each new tree's own bootstrap, which is the intent here
+        warnings.filterwarnings("ignore", message="class_weight presets", category=UserWarning)
+        forest.fit(X_new, new_rows[TARGET_COLUMN])
+    fit_seconds = time.perf_counter() - start
+
+    dropped = max(len(forest.estimators_) - max_trees, 0)
+    forest.estimators_ = forest.estimators_[dropped:]
+    forest.set_params(n_estimators=len(forest.estimators_), warm_start=False)
+
+    forest_params = {**FOREST_PARAMS_DEFAULT, **base_metrics.get("forest_params", {})}
+    forest_params["n_estimators"] = len(forest.estimators_)
+    extra_metrics = {
+        "class_distribution": dict(new_rows[TARGET_COLUMN].value_counts(normalize=True).round(4)),
+        "train_samples": int(len(new_rows)),
+        "forest_params": forest_params,
+        "data_loading": data_loading,
+        "model_version": version,
+        "version_sequence": next_version_sequence(config.model_dir),
+        "forest_generation": generation,
+        "incremental": {
+            "base_version": base_version or BASE_VERSION,
+            "trees_added": incremental.new_trees,
+            "trees_dropped": dropped,
+            "fit_seconds": round(fit_seconds, 3),
+        },
+    }
+    return save_artifacts(
+        pipeline,
+        artifact_dir(config.model_dir, version),
+        window[NUMERIC_FEATURES],
+        window[TARGET_COLUMN],
+        config.validation_window,
+        extra_metrics,
+    )
+
+
 def main() -> None:
     config = parse_args()
-    metrics = train(config)
+    try:
+        metrics = train(config)
+    except (ValueError, FileExistsError) as e:
+        raise SystemExit(str(e))
     print("Model training complete. Metrics:")
     print(
         f"  Accuracy: {metrics['accuracy'] * 100:.1f}%\n"
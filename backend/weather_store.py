@@ -0,0 +1,185 @@
+"""Per-location store for the weather readings the frontend posts to /weather.
+
+Readings are decoded into model-ready values (temperature, humidity,
+condition and weather_type_numeric) once at ingest, so /predict does a single
+dict lookup. Stored readings are immutable and replaced wholesale, which lets
+readers skip the lock entirely; only writers serialize. Re-posting an
+identical reading just refreshes its timestamp.
+
+A lookup without a location is only answered while a single site has a
+fresh reading. With several, the latest post could come from any of them, so
+the caller has to say which one it means.
+
+With a SQLite file, every post is also written there, and each process picks
+up other processes' posts at most ``WEATHER_SYNC_SECONDS`` later. That is how
+the pre-forked workers share one set of readings.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+import json
+import threading
+import time
+
+from features import extract_weather
+from process_sqlite import ProcessLocalSQLite
+
+WEATHER_TTL_SECONDS_DEFAULT = 2 * 3600
+WEATHER_SYNC_SECONDS = 1.0
+
+WEATHER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS weather (key TEXT PRIMARY KEY, data TEXT NOT NULL, seen REAL NOT NULL);
+"""
+
+
+class AmbiguousLocationError(LookupError):
+    """No location was given while several sites have fresh readings"""
+
+
+def normalize_location(location) -> str:
+    return str(location or "").strip().casefold()
+
+
+@dataclass(frozen=True)
+class WeatherReading:
+    location: str | None
+    raw: dict  # OpenWeatherMap-style dict, echoed back by /weather
+    values: dict  # extract_weather() output, ready for assemble_features
+    fingerprint: tuple
+
+
+def _to_openweather(data: dict) -> dict:
+    """Store weather in OpenWeatherMap API format for compatibility with predict endpoint"""
+    return {
+        "main": {
+            "temp": data.get("temperature"),
+            "feels_like": data.get("feels_like"),
+            "humidity": data.get("humidity")
+        },
+        "weather": [{
+            "main": data.get("condition"),
+            "description": (data.get("condition") or "").lower()
+        }],
+        "wind": {
+            "speed": data.get("wind_speed")
+        },
+        "name": data.get("location"),
+        "timestamp": data.get("timestamp", datetime.now().isoformat())
+    }
+
+
+class WeatherStore:
+    """Latest reading per location, expiring after ``ttl_seconds`` without an update."""
+
+    def __init__(self, ttl_seconds: float = WEATHER_TTL_SECONDS_DEFAULT, db_path: Path | None = None):
+        self.ttl_seconds = ttl_seconds
+        self._readings: dict[str, WeatherReading] = {}
+        self._seen: dict[str, float] = {}  # wall-clock time, so other processes' posts compare
+        self._latest: str | None = None
+        # Most recent post from any site other than the latest one; fresh means several sites are
+        self._runner_up_seen = float("-inf")
+        self._write_lock = threading.Lock()
+        self._db = ProcessLocalSQLite(db_path, WEATHER_SCHEMA) if db_path is not None else None
+        self._synced = float("-inf")
+        self.writes = 0
+        self.unchanged_writes = 0
+
+    def put(self, data: dict) -> tuple[WeatherReading, bool]:
+        """Store a posted reading; returns it and whether it differed from the stored one"""
+        key = normalize_location(data.get("location"))
+        now = time.time()
+
+        with self._write_lock:
+            current, changed = self._apply(key, data, now)
+            if changed:
+                self.writes += 1
+            else:
+                self.unchanged_writes += 1
+            self._evict(now)
+            self._rank()
+            if self._db is not None:
+                connection = self._db.connection
+                connection.execute(
+                    "INSERT OR REPLACE INTO weather (key, data, seen) VALUES (?, ?, ?)",
+                    (key, json.dumps(data, default=str), now),
+                )
+                connection.commit()
+        return current, changed
+
+    def get(self, location=None) -> WeatherReading | None:
+        """Reading for ``location``; without one, the only fresh reading (AmbiguousLocationError if several)"""
+        if self._db is not None and time.monotonic() - self._synced >= WEATHER_SYNC_SECONDS:
+            self._sync()
+        now = time.time()
+        if location is None and now - self._runner_up_seen <= self.ttl_seconds:
+            raise AmbiguousLocationError("Weather is stored for several locations; send a location to pick one")
+        key = self._latest if location is None else normalize_location(location)
+        if key is None:
+            return None
+        reading = self._readings.get(key)
+        if reading is None or self._expired(key, now):
+            return None
+        return reading
+
+    def _apply(self, key: str, data: dict, seen: float) -> tuple[WeatherReading, bool]:
+        """Record a post seen at ``seen``; the caller holds the write lock"""
+        fingerprint = tuple(
+            data.get(field) for field in ("temperature", "feels_like", "humidity", "wind_speed", "condition")
+        )
+        current = self._readings.get(key)
+        changed = current is None or current.fingerprint != fingerprint or self._expired(key, seen)
+        if changed:
+            raw = _to_openweather(data)
+            current = WeatherReading(
+                location=data.get("location"),
+                raw=raw,
+                values=extract_weather(raw),
+                fingerprint=fingerprint,
+            )
+            self._readings[key] = current
+        self._seen[key] = seen
+        return current, changed
+
+    def _rank(self) -> None:
+        """Find the latest site and when the next most recent one posted; the caller holds the write lock"""
+        top = sorted(self._seen.items(), key=lambda item: item[1], reverse=True)[:2]
+        self._latest = top[0][0] if top else None
+        self._runner_up_seen = top[1][1] if len(top) > 1 else float("-inf")
+
+    def _sync(self) -> None:
+        """Apply posts other processes wrote since the last sync"""
+        # Readers never wait: if a post or another sync holds the lock, skip this one
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            self._synced = time.monotonic()
+            now = time.time()
+            rows = self._db.connection.execute(
+                "SELECT key, data, seen FROM weather WHERE seen >= ?", (now - self.ttl_seconds,)
+            ).fetchall()
+            for key, data, seen in rows:
+                if seen > self._seen.get(key, float("-inf")):
+                    self._apply(key, json.loads(data), seen)
+            self._evict(now)
+            self._rank()
+        finally:
+            self._write_lock.release()
+
+    def _expired(self, key: str, now: float) -> bool:
+        return now - self._seen.get(key, float("-inf")) > self.ttl_seconds
+
+    def _evict(self, now: float) -> None:
+        expired = [key for key, seen in self._seen.items() if now - seen > self.ttl_seconds]
+        for key in expired:
+            self._readings.pop(key, None)
+            self._seen.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "locations": len(self._readings),
+            "writes": self.writes,
+            "unchanged_writes": self.unchanged_writes,
+        }
@@ -51,6 +51,8 @@ export function ChatAgentOverlay({ predictionContext }: ChatAgentOverlayProps) {
   })
 
   const messagesEndRef = useRef<HTMLDivElement | null>(null)
+  // Lets the backend keep this chat's running summary separate from other chats
+  const conversationIdRef = useRef<string | null>(null)
 
   // Auto-scroll to newest message
   useEffect(() => {
@@ -71,6 +73,7 @@ export function ChatAgentOverlay({ predictionContext }: ChatAgentOverlayProps) {
     setMessages(prev => [...prev, userMessage])
     setInput('')
     setIsSending(true)
+    conversationIdRef.current ??= crypto.randomUUID()
 
     // Build system prompt with prediction context if available
     let systemPrompt = 'You are a Board Certified Behavior Analyst (BCBA) providing real-time session support for ABA therapists and RBTs in a clinic setting. Provide practical, concrete, session-ready strategies for table work, NET, transitions, and other ABA activities. Use "do this" language, not vague suggestions.';
@@ -112,6 +115,7 @@ export function ChatAgentOverlay({ predictionContext }: ChatAgentOverlayProps) {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
+          conversation_id: conversationIdRef.current,
           // send a simplified history: only role + content
           messages: [
             // optional system prompt to steer behavior
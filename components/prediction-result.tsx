@@ -446,6 +446,17 @@ export default function PredictionResult({ data }: PredictionResultProps) {
         </div>
       )}
 
+      {/* Deferred analysis still being generated, or it failed */}
+      {!data.analysis && (data.analysis_status === 'pending' || data.analysis_status === 'error') && (
+        <div className="bg-white dark:bg-slate-800 p-6 rounded-xl border-2 border-slate-200 dark:border-slate-700 shadow-md">
+          <p className="text-slate-600 dark:text-slate-300 text-base">
+            {data.analysis_status === 'pending'
+              ? 'Generating the behavioral analysis…'
+              : 'The behavioral analysis could not be generated. The risk score above is still valid.'}
+          </p>
+        </div>
+      )}
+
       {/* Fallback: Show raw analysis if parsing fails */}
       {data.analysis && !analysis && (
         <div className="bg-white dark:bg-slate-800 p-6 rounded-xl border-2 border-emerald-200 dark:border-emerald-900 shadow-md hover:shadow-lg transition-shadow">
@@ -2,6 +2,8 @@
 
 import { useEffect, useState } from 'react';
 
+import { WEATHER_LOCATION_STORAGE_KEY } from '@/lib/constants';
+
 interface WeatherData {
   temperature: number;
   condition: string;
@@ -59,6 +61,9 @@ export default function WeatherDisplay() {
           }),
         });
 
+        // Predictions pick this site's reading, not whichever site posted last
+        localStorage.setItem(WEATHER_LOCATION_STORAGE_KEY, weather.location);
+
         console.log('Weather data sent to backend:', weather);
       } catch (err) {
         const errorMessage = err instanceof Error ? err.message : 'Unable to fetch weather';
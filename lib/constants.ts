@@ -1,2 +1,4 @@
 export const ASSESSMENT_STORAGE_KEY = 'aba-forecast-summaries'
 export const PROFILE_STORAGE_KEY = 'aba-forecast-patient-profile'
+// Site name of the last weather reading posted to the backend; /predict sends it as location
+export const WEATHER_LOCATION_STORAGE_KEY = 'aba-forecast-weather-location'